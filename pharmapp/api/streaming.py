@@ -0,0 +1,142 @@
+"""
+Streaming JSON responses for the bulk API endpoints.
+
+``JsonResponse`` needs the whole payload as Python objects before encoding
+it, so memory grows with the size of the catalogue. ``StreamingJsonResponse``
+encodes the payload while it is being sent instead:
+
+    * querysets are read with ``.iterator(chunk_size=...)``;
+    * generators and other iterables are consumed one element at a time;
+    * ``StreamedObject`` streams ``(key, value)`` pairs as a JSON object;
+    * the elements of a list or queryset (the rows) are encoded whole, each
+      in one ``encoder.encode()`` call, unless they hold one of the lazy
+      values above;
+    * callables are evaluated when their position in the output is reached,
+      so totals can be computed while the rows before them are streamed;
+    * ``Decimal``, date and time values are encoded inline by
+      ``DjangoJSONEncoder`` (``Decimal`` as a string, like ``JsonResponse``).
+"""
+import logging
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models.query import QuerySet
+from django.http import StreamingHttpResponse
+
+logger = logging.getLogger(__name__)
+
+QUERYSET_CHUNK_SIZE = 2000
+
+# Encoded text is sent in pieces of about this many characters
+BUFFER_SIZE = 64 * 1024
+
+
+class StreamedObject:
+    """A JSON object whose ``(key, value)`` pairs are produced lazily"""
+
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+
+def _iter_values(value, chunk_size):
+    if isinstance(value, QuerySet):
+        return value.iterator(chunk_size=chunk_size)
+    return iter(value)
+
+
+def iter_json(value, encoder=None, chunk_size=QUERYSET_CHUNK_SIZE):
+    """
+    Yield the JSON encoding of ``value`` in pieces.
+
+    Args:
+        value: Payload; dicts, StreamedObjects, lists, tuples, querysets and
+            generators are streamed, anything else is encoded in one go
+        encoder: JSON encoder instance (defaults to DjangoJSONEncoder)
+        chunk_size: Rows fetched per database round trip for querysets
+    """
+    encoder = encoder or DjangoJSONEncoder()
+
+    if callable(value) and not isinstance(value, type):
+        value = value()
+
+    if isinstance(value, (dict, StreamedObject)):
+        pairs = value.items() if isinstance(value, dict) else value.pairs
+        yield '{'
+        for index, (key, item) in enumerate(pairs):
+            yield (', ' if index else '') + encoder.encode(str(key)) + ': '
+            yield from iter_json(item, encoder, chunk_size)
+        yield '}'
+    elif isinstance(value, (list, tuple, QuerySet)) or _is_lazy_iterable(value):
+        yield '['
+        for index, item in enumerate(_iter_values(value, chunk_size)):
+            if index:
+                yield ', '
+            if _is_lazy(item) or _has_lazy_values(item):
+                yield from iter_json(item, encoder, chunk_size)
+            else:
+                # A row: one encode() call is several times faster than
+                # encoding each of its fields separately
+                yield encoder.encode(item)
+        yield ']'
+    else:
+        yield encoder.encode(value)
+
+
+def _is_lazy_iterable(value):
+    """True for generators, map/filter objects and similar one-shot iterables"""
+    return hasattr(value, '__next__') and hasattr(value, '__iter__')
+
+
+def _is_lazy(value):
+    """True for values only iter_json can encode (querysets, generators, callables, ...)"""
+    return (
+        isinstance(value, (QuerySet, StreamedObject))
+        or _is_lazy_iterable(value)
+        or (callable(value) and not isinstance(value, type))
+    )
+
+
+def _has_lazy_values(value):
+    """True for a dict, list or tuple holding a lazy value at its first level"""
+    if isinstance(value, dict):
+        return any(_is_lazy(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return any(_is_lazy(item) for item in value)
+    return False
+
+
+def buffered(pieces, size=BUFFER_SIZE):
+    """Join small encoded pieces into chunks of roughly ``size`` characters"""
+    buffer = []
+    buffered_length = 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered_length += len(piece)
+        if buffered_length >= size:
+            yield ''.join(buffer)
+            buffer = []
+            buffered_length = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+class StreamingJsonResponse(StreamingHttpResponse):
+    """
+    A streaming counterpart of ``JsonResponse``.
+
+    The status code and headers are sent before the payload is encoded, so
+    errors have to be detected before the response is returned. An exception
+    raised while streaming is logged and truncates the body, which makes the
+    client's JSON parsing (and therefore its retry logic) fail.
+    """
+
+    def __init__(self, data, encoder=DjangoJSONEncoder, chunk_size=QUERYSET_CHUNK_SIZE, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(self._stream(data, encoder(), chunk_size), **kwargs)
+
+    @staticmethod
+    def _stream(data, encoder, chunk_size):
+        try:
+            yield from buffered(iter_json(data, encoder, chunk_size))
+        except Exception as e:
+            logger.error(f"Error while streaming JSON response: {str(e)}")
+            raise
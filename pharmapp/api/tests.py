@@ -0,0 +1,445 @@
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.test import AsyncRequestFactory, TestCase, Client, RequestFactory, override_settings
+from django.http import HttpResponse
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from decimal import Decimal
+from datetime import date
+from store.models import Item
+from store.barcode_lookup import barcode_cache, resolve_barcodes
+from api.streaming import StreamedObject, StreamingJsonResponse, iter_json
+from api.views import barcode_lookup, counter_stream, user_counters
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pharmapp.connectivity import CONNECTION_STATUS_CACHE_KEY, ConnectivityMonitor, monitor as process_monitor
+from pharmapp.middleware import ConnectionDetectionMiddleware
+from pharmapp import counters
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from chat.models import ChatRoom, ChatMessage
+from chat.unread import unread_count
+from store.models import Notification
+from store.notifications import NotificationService
+import json
+import threading
+import time
+
+
+class StreamingJsonTests(TestCase):
+    """Test cases for the streaming JSON encoder used by the bulk endpoints"""
+
+    def setUp(self):
+        self.item = Item.objects.create(name='Stream Item', barcode='4006381333931',
+                                        price=Decimal('2.50'), stock=Decimal('3'))
+
+    def test_encodes_decimals_dates_and_lazy_values_inline(self):
+        """Test nested iterables, querysets and callables are encoded in place"""
+        data = {
+            'price': Decimal('1.10'),
+            'dates': (d for d in [date(2024, 1, 2)]),
+            'items': Item.objects.values('name', 'price'),
+            'totals': StreamedObject(iter([('count', lambda: 1)])),
+        }
+
+        self.assertEqual(json.loads(''.join(iter_json(data))), {
+            'price': '1.10',
+            'dates': ['2024-01-02'],
+            'items': [{'name': 'Stream Item', 'price': '2.50'}],
+            'totals': {'count': 1},
+        })
+
+    def test_rows_are_encoded_in_one_call_each(self):
+        """Test list and queryset elements are not encoded field by field"""
+        encoder = DjangoJSONEncoder()
+        rows = [{'id': i, 'price': Decimal('1.00'), 'tags': ['a', 'b']} for i in range(3)]
+
+        with mock.patch.object(encoder, 'encode', wraps=encoder.encode) as encode:
+            body = ''.join(iter_json({'rows': rows}, encoder))
+
+        self.assertEqual(json.loads(body)['rows'][2], {'id': 2, 'price': '1.00', 'tags': ['a', 'b']})
+        self.assertEqual(encode.call_count, 4)  # the 'rows' key and one call per row
+
+    def test_response_is_streamed(self):
+        """Test StreamingJsonResponse streams the payload"""
+        response = StreamingJsonResponse({'items': Item.objects.values('id')})
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), {'items': [{'id': self.item.id}]})
+
+    def test_barcode_batch_lookup_counts_follow_results(self):
+        """Test the batch lookup reports counts computed while streaming results"""
+        response = Client().post(
+            reverse('api:barcode_batch_lookup'),
+            json.dumps({'barcodes': ['4006381333931', '0000000000000']}),
+            content_type='application/json'
+        )
+        data = json.loads(b''.join(response.streaming_content))
+
+        self.assertEqual(data['found_count'], 1)
+        self.assertEqual(data['not_found'], ['0000000000000'])
+        self.assertEqual(data['results'][0]['item']['price'], '2.50')
+
+
+class BarcodeBatchLookupTests(TestCase):
+    """Test cases for the set-based barcode batch lookup"""
+
+    def setUp(self):
+        self.client = Client()
+        self.items = [
+            Item.objects.create(name=f'Batch Item {i}', barcode=f'59012341234{i:02d}', price=Decimal('1.00'))
+            for i in range(20)
+        ]
+
+    def lookup(self, barcodes):
+        response = self.client.post(
+            reverse('api:barcode_batch_lookup'),
+            json.dumps({'barcodes': barcodes, 'mode': 'retail'}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        """Test 2 and 40 codes (half of them misses) cost the same two queries"""
+        small = [self.items[0].barcode, '0000000000001']
+        large = [item.barcode for item in self.items] + [f'00000000000{i:02d}' for i in range(20)]
+
+        with self.assertNumQueries(2):
+            resolve_barcodes(Item, small)
+        with self.assertNumQueries(2):
+            resolved = resolve_barcodes(Item, large)
+        self.assertEqual(len(resolved['matches']), 20)
+
+        data = self.lookup(large)
+        self.assertEqual(data['found_count'], 20)
+        self.assertEqual(data['not_found_count'], 20)
+
+    def test_reports_duplicates_ambiguous_and_gs1_matches(self):
+        """Test repeated scans, shared barcodes and GTIN fallback are reported"""
+        Item.objects.create(name='Twin', barcode=self.items[1].barcode, price=Decimal('1.00'))
+        Item.objects.create(name='GS1 Item', gtin='18906047654987', price=Decimal('1.00'))
+        gs1_code = 'NAVIDOXINE(01) 18906047654987(10) 250203 (17) 012028(21) NVDXN0225'
+
+        data = self.lookup([self.items[0].barcode, self.items[0].barcode, self.items[1].barcode, gs1_code])
+
+        self.assertEqual(data['duplicates'], {self.items[0].barcode: 2})
+        self.assertEqual(data['ambiguous'], [self.items[1].barcode])
+        self.assertEqual(len(data['results'][2]['matches']), 2)
+        self.assertEqual(data['results'][3]['match_type'], 'gtin')
+        self.assertEqual(data['results'][3]['item']['name'], 'GS1 Item')
+        self.assertEqual(data['not_found'], [])
+
+
+class BarcodeLookupCacheTests(TestCase):
+    """Test cases for the barcode resolution cache behind barcode_lookup"""
+
+    def setUp(self):
+        self.client = Client()
+        barcode_cache.invalidate()
+        barcode_cache.reset_stats()
+        self.item = Item.objects.create(name='Cached Item', barcode='8901234567890', price=Decimal('4.00'),
+                                        stock=Decimal('9'))
+
+    def lookup(self, barcode):
+        return self.client.post(
+            reverse('api:barcode_lookup'),
+            json.dumps({'barcode': barcode, 'mode': 'retail'}),
+            content_type='application/json'
+        )
+
+    def test_repeat_scans_are_served_from_cache(self):
+        """Test a repeat scan skips the lookup cascade and a repeat miss only checks the barcode"""
+        self.assertEqual(self.lookup('8901234567890').status_code, 200)
+        self.assertEqual(self.lookup('0000000000000').status_code, 404)
+
+        def scan(barcode):
+            request = RequestFactory().post('/api/barcode/lookup/', json.dumps({'barcode': barcode}),
+                                            content_type='application/json')
+            return barcode_lookup(request)
+
+        # Only the primary key read of the matched item remains
+        with self.assertNumQueries(1):
+            response = scan('8901234567890')
+        self.assertEqual(json.loads(response.content)['item']['id'], self.item.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(scan('0000000000000').status_code, 404)
+
+        stats = self.client.get(reverse('api:barcode_cache_stats')).json()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['negative_hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+
+    def test_assigning_a_barcode_invalidates_cached_miss(self):
+        """Test a cached miss is dropped when the code is assigned to an item"""
+        self.assertEqual(self.lookup('7777777777777').status_code, 404)
+
+        response = self.client.post(
+            reverse('api:assign_barcode'),
+            json.dumps({'item_id': self.item.id, 'barcode': '7777777777777', 'mode': 'retail'}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.lookup('7777777777777').json()['item']['id'], self.item.id)
+
+    def test_stock_only_saves_keep_the_cache(self):
+        """Test saves that cannot change barcode resolution do not flush the cache"""
+        self.lookup('8901234567890')
+        self.item.stock = Decimal('3')
+        self.item.save(update_fields=['stock', 'updated_at'])
+
+        response = self.lookup('8901234567890')
+        self.assertEqual(barcode_cache.stats()['hits'], 1)
+        self.assertEqual(response.json()['item']['stock'], '3.00')
+
+    def test_full_saves_only_drop_the_saved_items_codes(self):
+        """Test a full save keeps the cache unless it changes that item's barcode values"""
+        other = Item.objects.create(name='Other Item', barcode='5012345678900', price=Decimal('1.00'))
+        self.lookup('8901234567890')
+        self.lookup('5012345678900')
+        self.lookup('7777777777777')
+
+        item = Item.objects.get(pk=self.item.pk)
+        item.stock = Decimal('1')
+        item.save()
+        self.assertEqual(barcode_cache.stats()['size'], 3)
+
+        other = Item.objects.get(pk=other.pk)
+        other.barcode = '7777777777777'
+        other.save()
+        self.assertIsNotNone(barcode_cache.get(Item, '8901234567890'))
+        self.assertIsNone(barcode_cache.get(Item, '5012345678900'))
+        self.assertIsNone(barcode_cache.get(Item, '7777777777777'))
+        self.assertEqual(self.lookup('7777777777777').json()['item']['id'], other.id)
+
+
+    def test_codes_moved_by_another_process_are_looked_up_again(self):
+        """Test cached answers are checked against the row, as other workers never invalidate them"""
+        other = Item.objects.create(name='Other Item', price=Decimal('1.00'))
+        self.lookup('8901234567890')
+        self.lookup('7777777777777')
+
+        # Saved elsewhere: no signal reaches this process's cache
+        Item.objects.filter(pk=self.item.pk).update(barcode='')
+        Item.objects.filter(pk=other.pk).update(barcode='8901234567890')
+        self.assertEqual(self.lookup('8901234567890').json()['item']['id'], other.id)
+
+        Item.objects.filter(pk=self.item.pk).update(barcode='7777777777777')
+        self.assertEqual(self.lookup('7777777777777').json()['item']['id'], self.item.id)
+
+
+class GtinCoreLookupTests(TestCase):
+    """Test cases for partial GTIN matching through the gtin_core column"""
+
+    def test_gtin_core_is_maintained_on_save(self):
+        """Test gtin_core follows gtin, also for saves limited by update_fields"""
+        item = Item.objects.create(name='Core Item', gtin='18906047654987')
+        self.assertEqual(item.gtin_core, '47654987')
+
+        item.gtin = '12345678901231'
+        item.save(update_fields=['gtin'])
+        item.refresh_from_db()
+        self.assertEqual(item.gtin_core, '78901231')
+
+    def test_partial_gtin_match_uses_indexed_equality(self):
+        """Test a GS1 scan matches an item by GTIN core without a LIKE scan"""
+        barcode_cache.invalidate()
+        item = Item.objects.create(name='Packaging Variant', gtin='08906047654987', price=Decimal('3.00'))
+        request = RequestFactory().post(
+            '/api/barcode/lookup/',
+            json.dumps({'barcode': '(01)18906047654987(10)B12', 'mode': 'retail'}),
+            content_type='application/json'
+        )
+
+        with CaptureQueriesContext(connection) as context:
+            response = barcode_lookup(request)
+
+        data = json.loads(response.content)
+        self.assertEqual(data['match_type'], 'partial_gtin')
+        self.assertEqual(data['item']['id'], item.id)
+        self.assertFalse(any('LIKE' in query['sql'] for query in context.captured_queries))
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    status = 200
+
+    def do_GET(self):
+        self.send_response(self.status)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ConnectivityMonitorTests(TestCase):
+    """Test cases for the background connectivity monitor"""
+
+    def setUp(self):
+        # Keep the process-wide monitor from publishing while these tests run
+        process_monitor.stop(timeout=5)
+        cache.delete(CONNECTION_STATUS_CACHE_KEY)
+        self.server = HTTPServer(('127.0.0.1', 0), _StandInHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}/'
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        _StandInHandler.status = 200
+        cache.delete(CONNECTION_STATUS_CACHE_KEY)
+
+    def test_probe_publishes_status_to_cache(self):
+        """Test the monitor publishes the stand-in endpoint's availability"""
+        monitor = ConnectivityMonitor(url=self.url, interval=60, timeout=1)
+
+        self.assertTrue(monitor.check_once())
+        self.assertTrue(cache.get(CONNECTION_STATUS_CACHE_KEY))
+
+        _StandInHandler.status = 503
+        self.assertFalse(monitor.check_once())
+        self.assertFalse(cache.get(CONNECTION_STATUS_CACHE_KEY))
+
+    def test_background_thread_starts_and_stops(self):
+        """Test the probe runs off the request path and stops on request"""
+        monitor = ConnectivityMonitor(url=self.url, interval=60, timeout=1)
+        monitor.start()
+        try:
+            for _ in range(50):
+                if cache.get(CONNECTION_STATUS_CACHE_KEY) is not None:
+                    break
+                threading.Event().wait(0.05)
+            self.assertTrue(cache.get(CONNECTION_STATUS_CACHE_KEY))
+        finally:
+            monitor.stop(timeout=2)
+        self.assertFalse(monitor.running)
+
+    @override_settings(CONNECTIVITY_MONITOR_ENABLED=False)
+    def test_middleware_only_reads_published_status(self):
+        """Test requests use the cached status without probing"""
+        middleware = ConnectionDetectionMiddleware(lambda request: HttpResponse())
+        request = RequestFactory().get('/')
+
+        self.assertEqual(middleware(request)['X-Connection-Status'], 'online')
+
+        cache.set(CONNECTION_STATUS_CACHE_KEY, False)
+        response = middleware(request)
+        self.assertEqual(response['X-Connection-Status'], 'offline')
+        self.assertEqual(request.current_database, 'offline')
+
+
+class UserCounterTests(TestCase):
+    """Test cases for the pushed notification/chat badge counters"""
+
+    def setUp(self):
+        cache.clear()
+        User = get_user_model()
+        self.user = User.objects.create_user(username='counter_user', mobile='0800000001', password='pass12345')
+        self.other = User.objects.create_user(username='counter_other', mobile='0800000002', password='pass12345')
+        self.factory = RequestFactory()
+
+    def _request(self, path, user=None, **params):
+        request = self.factory.get(path, params)
+        request.user = user or self.user
+        return request
+
+    def test_notification_count_follows_changes_without_queries(self):
+        """Test the unread notification count is adjusted instead of recounted"""
+        Notification.objects.create(user=self.user, notification_type='system_message', title='A', message='A')
+        self.assertEqual(NotificationService.get_cached_unread_count(self.user), 1)
+
+        personal = Notification.objects.create(user=self.user, notification_type='system_message', title='B', message='B')
+        Notification.objects.create(notification_type='system_message', title='C', message='C')
+        with self.assertNumQueries(0):
+            self.assertEqual(NotificationService.get_cached_unread_count(self.user), 3)
+
+        Notification.objects.get(pk=personal.pk).mark_as_read()
+        with self.assertNumQueries(0):
+            self.assertEqual(NotificationService.get_cached_unread_count(self.user), 2)
+
+        NotificationService.mark_all_as_read(self.user)
+        self.assertEqual(NotificationService.get_cached_unread_count(self.user), 0)
+        self.assertEqual(NotificationService.get_unread_count(self.user), 0)
+
+    def test_chat_unread_count_follows_messages_and_reads(self):
+        """Test the unread chat count is adjusted on new messages and reads"""
+        room, _ = ChatRoom.get_or_create_direct_room(self.user, self.other)
+        self.assertEqual(unread_count(self.user), 0)
+        self.assertEqual(unread_count(self.other), 0)
+
+        message = ChatMessage.objects.create(room=room, sender=self.other, message='Hello')
+        ChatMessage.objects.create(room=room, sender=self.user, message='Hi')
+        with self.assertNumQueries(0):
+            self.assertEqual(unread_count(self.user), 1)
+            self.assertEqual(unread_count(self.other), 1)
+
+        # Moving the read marker recounts once with a range count
+        message.mark_as_read(self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(unread_count(self.user), 0)
+
+    def test_poll_answers_without_waiting(self):
+        """Test the counters endpoint answers at once, even with a version (no long-poll)"""
+        first = json.loads(user_counters(self._request('/api/counters/')).content)
+        self.assertEqual(first['notifications'], 0)
+
+        started = time.monotonic()
+        again = json.loads(user_counters(self._request('/api/counters/', version=first['version'])).content)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(again['version'], first['version'])
+
+    @override_settings(USER_COUNTER_TTL=300, COUNTER_LOCAL_TTL=10)
+    def test_process_local_counts_expire_quickly(self):
+        """Test counts held in a process-local cache are recounted after COUNTER_LOCAL_TTL"""
+        with mock.patch.object(counters, 'cache') as fake_cache:
+            fake_cache.get.return_value = None
+            NotificationService.get_cached_unread_count(self.user)
+        self.assertEqual(fake_cache.add.call_args.args[2], 10)
+
+        with mock.patch.object(counters, 'is_shared_cache', return_value=True), \
+                mock.patch.object(counters, 'cache') as fake_cache:
+            fake_cache.get.return_value = None
+            NotificationService.get_cached_unread_count(self.user)
+        self.assertEqual(fake_cache.add.call_args.args[2], 300)
+
+    def test_counter_stream_is_off_under_wsgi(self):
+        """Test the stream answers 204 (EventSource stops, badges poll) unless push is enabled"""
+        request = self._request('/api/counters/stream/')
+        request.auser = self._auser(self.user)
+        with override_settings(COUNTER_PUSH=True):
+            self.assertEqual(async_to_sync(counter_stream)(request).status_code, 204)
+
+    @override_settings(COUNTER_STREAM_SECONDS=0.3, COUNTER_PUSH=True)
+    def test_counter_stream_sends_events(self):
+        """Test the event stream sends the counts and closes after its duration"""
+        Notification.objects.create(user=self.user, notification_type='system_message', title='A', message='A')
+        request = AsyncRequestFactory().get('/api/counters/stream/')
+        request.auser = self._auser(self.user)
+
+        async def read():
+            response = await counter_stream(request)
+            return response, ''.join([chunk.decode() async for chunk in response.streaming_content])
+
+        with mock.patch.object(counters, 'is_shared_cache', return_value=True):
+            response, body = async_to_sync(read)()
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        event = body.split('event: counters\ndata: ', 1)[1].split('\n', 1)[0]
+        self.assertEqual(json.loads(event)['notifications'], 1)
+
+    @staticmethod
+    def _auser(user):
+        async def auser():
+            return user
+        return auser
+
+    def test_counters_require_login(self):
+        """Test anonymous requests are rejected"""
+        self.assertEqual(user_counters(self._request('/api/counters/', user=AnonymousUser())).status_code, 401)
+        request = self._request('/api/counters/stream/', user=AnonymousUser())
+        request.auser = self._auser(AnonymousUser())
+        self.assertEqual(async_to_sync(counter_stream)(request).status_code, 401)
+
@@ -21,6 +21,11 @@ urlpatterns = [
     path('barcode/lookup/', views.barcode_lookup, name='barcode_lookup'),
     path('barcode/assign/', views.assign_barcode, name='assign_barcode'),
     path('barcode/batch-lookup/', views.barcode_batch_lookup, name='barcode_batch_lookup'),
+    path('barcode/cache-stats/', views.barcode_cache_stats, name='barcode_cache_stats'),
+    path('session-store/stats/', views.session_store_stats, name='session_store_stats'),
     path('barcode/add-item/', views.barcode_add_item, name='barcode_add_item'),
     path('barcode/batch-add-items/', views.barcode_batch_add_items, name='barcode_batch_add_items'),
+    # Badge counters
+    path('counters/', views.user_counters, name='user_counters'),
+    path('counters/stream/', views.counter_stream, name='counter_stream'),
 ]
\ No newline at end of file
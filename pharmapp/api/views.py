@@ -1,18 +1,30 @@
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
 from django.views.decorators.http import require_http_methods
 from django.db import transaction
 from django.utils import timezone
 from django.conf import settings
+from asgiref.sync import sync_to_async
 from store.models import Item, Sales, SalesItem, WholesaleItem, Receipt, DispensingLog, Cart
-from store.gs1_parser import parse_barcode, is_gs1_barcode, GS1Parser, extract_gtin
+from store.gs1_parser import parse_barcode, is_gs1_barcode, GS1Parser, extract_gtin, gtin_core, GTIN_CORE_LENGTH
+from store.barcode_lookup import (
+    BARCODE_FIELDS, BARCODE_VALUE_FIELDS, MAX_BATCH_BARCODES, NOT_FOUND, barcode_cache, normalize_barcode,
+    resolve_barcodes
+)
+from store.offline_sync import ChangeFeedPage, InvalidSyncToken, SYNC_COLLECTIONS
 from customer.models import Customer, WholesaleCustomer
 from supplier.models import Supplier
 from wholesale.models import *
+from .streaming import StreamedObject, StreamingJsonResponse
+from pharmapp import counters
+from userauth import session_backend
 from decimal import Decimal, InvalidOperation
+from itertools import chain, islice
 import json
 import logging
 import os
+import time
 
 # Handle date parsing for both Django and standard datetime
 try:
@@ -50,27 +62,37 @@ def health_check(request):
 
 @csrf_exempt
 @require_http_methods(["GET"])
+@gzip_page
 def get_initial_data(request):
-    """Return initial data for offline caching"""
-    try:
-        data = {
-            'inventory': list(Item.objects.values()),
-            'customers': list(Customer.objects.values()),
-            'suppliers': list(Supplier.objects.values()),
-            'wholesale': list(WholesaleItem.objects.values()),
-            'wholesale_customers': list(WholesaleCustomer.objects.values()),
-        }
-
-        # Convert Decimal fields to strings for JSON serialization
-        for item in data['inventory'] + data['wholesale']:
-            for key, value in item.items():
-                if isinstance(value, Decimal):
-                    item[key] = str(value)
+    """
+    Return data for offline caching.
 
-        return JsonResponse(data)
-    except Exception as e:
-        logger.error(f"Error in get_initial_data: {str(e)}")
-        return JsonResponse({'error': str(e)}, status=500)
+    Without ``since`` this pages through a full snapshot; with the
+    ``sync_token`` of a previous response only rows changed or deleted since
+    then are returned. Keep requesting with the returned ``sync_token`` while
+    ``has_more`` is true.
+    """
+    try:
+        page = ChangeFeedPage.from_request(request.GET.get('since'), request.GET.get('limit'))
+    except InvalidSyncToken as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # The page yields the row collections first, then the deletions
+    sections = page.sections()
+    rows = ((name, rows) for _, name, rows in islice(sections, len(SYNC_COLLECTIONS)))
+    deleted = ((name, ids) for _, name, ids in sections)
+
+    response = StreamingJsonResponse(StreamedObject(chain(
+        [('full', page.full)],
+        rows,
+        [
+            ('deleted', StreamedObject(deleted)),
+            ('has_more', lambda: page.has_more),
+            ('sync_token', lambda: page.sync_token),
+        ],
+    )))
+    response['Cache-Control'] = 'no-store'
+    return response
 
 @csrf_exempt
 @require_http_methods(["POST"])
@@ -105,8 +127,15 @@ def inventory_sync(request):
                         synced_count += 1
                     elif action_type == 'update_item':
                         item_id = item_data.pop('id', None)
+                        item_data.pop('updated_at', None)
+                        if 'gtin' in item_data:
+                            item_data['gtin_core'] = gtin_core(item_data['gtin'])
                         if item_id:
-                            Item.objects.filter(id=item_id).update(**item_data)
+                            Item.objects.filter(id=item_id).update(**item_data, updated_at=timezone.now())
+                            if not BARCODE_FIELDS.isdisjoint(item_data):
+                                barcode_cache.invalidate_item(
+                                    Item, item_id, [item_data.get(field) for field in BARCODE_VALUE_FIELDS]
+                                )
                             synced_count += 1
                     elif action_type == 'delete_item':
                         Item.objects.filter(id=item_data.get('id')).delete()
@@ -222,6 +251,7 @@ def customers_sync(request):
                 if action_type == 'add_customer':
                     Customer.objects.create(**customer_data)
                 elif action_type == 'update_customer':
+                    customer_data['updated_at'] = timezone.now()
                     Customer.objects.filter(id=customer_data['id']).update(**customer_data)
                     
         return JsonResponse({'status': 'success'})
@@ -245,6 +275,7 @@ def suppliers_sync(request):
                 if action_type == 'add_supplier':
                     Supplier.objects.create(**supplier_data)
                 elif action_type == 'update_supplier':
+                    supplier_data['updated_at'] = timezone.now()
                     Supplier.objects.filter(id=supplier_data['id']).update(**supplier_data)
                     
         return JsonResponse({'status': 'success'})
@@ -598,6 +629,73 @@ def wholesale_cart_sync(request):
 
 # Barcode Scanning API Endpoints
 
+def _lookup_item_data(item, default_barcode_type='', gs1=False):
+    """Item fields returned by barcode_lookup"""
+    data = {
+        'id': item.id,
+        'name': item.name,
+        'brand': item.brand or '',
+        'dosage_form': item.dosage_form or '',
+        'unit': item.unit or '',
+        'price': str(item.price),
+        'cost': str(item.cost),
+        'stock': str(item.stock),
+        'barcode': item.barcode or '',
+        'barcode_type': item.barcode_type or default_barcode_type,
+        'exp_date': item.exp_date.isoformat() if item.exp_date else None,
+    }
+    if gs1:
+        data.update({
+            'gtin': item.gtin or '',
+            'batch_number': item.batch_number or '',
+            'serial_number': item.serial_number or '',
+        })
+    return data
+
+
+def _cache_lookup_response(ItemModel, barcode, item, payload, default_barcode_type='', gs1=False, match=None):
+    """
+    Remember how a scanned code resolved and return the lookup response;
+    ``match`` holds the item values the code matched on
+    """
+    barcode_cache.set(ItemModel, barcode, {
+        'item_id': item.id,
+        'match': match or {},
+        'payload': payload,
+        'default_barcode_type': default_barcode_type,
+        'gs1': gs1,
+    })
+    return JsonResponse(dict(payload, item=_lookup_item_data(item, default_barcode_type, gs1)))
+
+
+def _barcode_not_found_response(barcode, is_gs1):
+    parsed_data = parse_barcode(barcode) if is_gs1 else None
+    return JsonResponse({
+        'status': 'error',
+        'error': 'Item not found',
+        'user_message': f'No item found with barcode: {barcode}. Please check if the barcode is assigned.',
+        'suggestions': {
+            'gs1_detected': is_gs1,
+            'gs1_parsed': parsed_data if is_gs1 else None,
+            'gtin': parsed_data.get('gtin') if is_gs1 else None
+        }
+    }, status=404)
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def barcode_cache_stats(request):
+    """Hit/miss counters of the in-process barcode resolution cache"""
+    return JsonResponse(barcode_cache.stats())
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def session_store_stats(request):
+    """Cache hit rate, write-behind and cleanup counters of the session engine"""
+    return JsonResponse(session_backend.stats())
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def barcode_lookup(request):
@@ -662,19 +760,7 @@ def barcode_lookup(request):
                 return JsonResponse({
                     'status': 'success',
                     'lookup_type': 'qr_code',
-                    'item': {
-                        'id': item.id,
-                        'name': item.name,
-                        'brand': item.brand or '',
-                        'dosage_form': item.dosage_form or '',
-                        'unit': item.unit or '',
-                        'price': str(item.price),
-                        'cost': str(item.cost),
-                        'stock': str(item.stock),
-                        'barcode': item.barcode or '',
-                        'barcode_type': item.barcode_type or 'QR',
-                        'exp_date': item.exp_date.isoformat() if item.exp_date else None,
-                    }
+                    'item': _lookup_item_data(item, 'QR'),
                 })
 
             except (ValueError, IndexError) as e:
@@ -694,6 +780,25 @@ def barcode_lookup(request):
         
         # Handle GS1 barcode parsing for pharmaceutical products
         is_gs1 = is_gs1_barcode(barcode)
+
+        # Repeat scans skip the lookup cascade; the matched row is re-read
+        # by primary key so price and stock are always current. The cache is
+        # per process and only the saving process invalidates it, so the
+        # row must still hold the values the code matched on, and a cached
+        # miss is dropped once the code is assigned as an item's barcode
+        cached = barcode_cache.get(ItemModel, barcode)
+        if cached == NOT_FOUND:
+            if not ItemModel.objects.filter(barcode=barcode).exists():
+                return _barcode_not_found_response(barcode, is_gs1)
+            barcode_cache.invalidate_item(ItemModel, None, [barcode])
+        elif cached is not None:
+            item = ItemModel.objects.filter(id=cached['item_id']).first()
+            if item is not None and all(getattr(item, field) == value for field, value in cached['match'].items()):
+                return JsonResponse(dict(
+                    cached['payload'],
+                    item=_lookup_item_data(item, cached['default_barcode_type'], cached['gs1'])
+                ))
+            barcode_cache.invalidate_item(ItemModel, cached['item_id'], [barcode])
         
         if is_gs1:
             # Parse the GS1 barcode
@@ -711,6 +816,7 @@ def barcode_lookup(request):
                     search_results.append({
                         'item': item,
                         'match_type': 'exact_barcode',
+                        'match': {'barcode': barcode},
                         'confidence': 1.0
                     })
                 
@@ -724,19 +830,20 @@ def barcode_lookup(request):
                         search_results.append({
                             'item': item,
                             'match_type': 'gtin',
+                            'match': {'gtin': gtin},
                             'confidence': 0.9
                         })
                 
-                # 3. Try partial GTIN matches (core digits)
-                if gtin and len(gtin) > 8:
-                    core_gtin = gtin[-8:]  # Last 8 digits
-                    partial_gtin_matches = ItemModel.objects.filter(gtin__endswith=core_gtin).exclude(
+                # 3. Try partial GTIN matches (core digits, indexed gtin_core column)
+                if gtin and len(gtin) > GTIN_CORE_LENGTH:
+                    partial_gtin_matches = ItemModel.objects.filter(gtin_core=gtin_core(gtin)).exclude(
                         id__in=[r['item'].id for r in search_results]
                     )
                     for item in partial_gtin_matches:
                         search_results.append({
                             'item': item,
                             'match_type': 'partial_gtin',
+                            'match': {'gtin_core': gtin_core(gtin)},
                             'confidence': 0.7
                         })
                 
@@ -754,6 +861,7 @@ def barcode_lookup(request):
                         search_results.append({
                             'item': item,
                             'match_type': 'batch_serial',
+                            'match': {'batch_number': batch_number, 'serial_number': serial_number},
                             'confidence': 0.8
                         })
                 
@@ -766,6 +874,7 @@ def barcode_lookup(request):
                         search_results.append({
                             'item': item,
                             'match_type': 'batch_only',
+                            'match': {'batch_number': batch_number},
                             'confidence': 0.6
                         })
                 
@@ -777,6 +886,7 @@ def barcode_lookup(request):
                         search_results.append({
                             'item': item,
                             'match_type': 'serial_only',
+                            'match': {'serial_number': serial_number},
                             'confidence': 0.6
                         })
                 
@@ -794,6 +904,7 @@ def barcode_lookup(request):
                     
                     if not item.gtin and gtin:
                         update_data['gtin'] = gtin
+                        update_data['gtin_core'] = gtin_core(gtin)
                         should_update = True
                     
                     if not item.batch_number and batch_number:
@@ -805,32 +916,17 @@ def barcode_lookup(request):
                         should_update = True
                     
                     if should_update:
-                        ItemModel.objects.filter(id=item.id).update(**update_data)
+                        ItemModel.objects.filter(id=item.id).update(**update_data, updated_at=timezone.now())
+                        barcode_cache.invalidate_item(ItemModel, item.id, update_data.values())
                         logger.info(f"Updated item {item.name} with GS1 components")
                     
-                    return JsonResponse({
+                    return _cache_lookup_response(ItemModel, barcode, item, {
                         'status': 'success',
                         'lookup_type': 'gs1_barcode',
                         'match_type': best_match['match_type'],
                         'confidence': best_match['confidence'],
                         'parsed_data': parsed_data,
                         'total_matches': len(search_results),
-                        'item': {
-                            'id': item.id,
-                            'name': item.name,
-                            'brand': item.brand or '',
-                            'dosage_form': item.dosage_form or '',
-                            'unit': item.unit or '',
-                            'price': str(item.price),
-                            'cost': str(item.cost),
-                            'stock': str(item.stock),
-                            'barcode': item.barcode or '',
-                            'barcode_type': item.barcode_type or parsed_data.get('barcode_type', 'OTHER'),
-                            'exp_date': item.exp_date.isoformat() if item.exp_date else None,
-                            'gtin': item.gtin or '',
-                            'batch_number': item.batch_number or '',
-                            'serial_number': item.serial_number or '',
-                        },
                         'other_matches': [
                             {
                                 'id': r['item'].id,
@@ -840,7 +936,7 @@ def barcode_lookup(request):
                             }
                             for r in search_results[1:4]  # Top 4 additional matches
                         ] if len(search_results) > 1 else None
-                    })
+                    }, parsed_data.get('barcode_type', 'OTHER'), gs1=True, match=best_match['match'])
                 
             except Exception as e:
                 logger.error(f"GS1 barcode parsing error: {e}", exc_info=True)
@@ -853,23 +949,10 @@ def barcode_lookup(request):
 
             logger.info(f"Barcode found: {item.name} (barcode: {barcode})")
 
-            return JsonResponse({
+            return _cache_lookup_response(ItemModel, barcode, item, {
                 'status': 'success',
                 'lookup_type': 'barcode',
-                'item': {
-                    'id': item.id,
-                    'name': item.name,
-                    'brand': item.brand or '',
-                    'dosage_form': item.dosage_form or '',
-                    'unit': item.unit or '',
-                    'price': str(item.price),
-                    'cost': str(item.cost),
-                    'stock': str(item.stock),
-                    'barcode': item.barcode or '',
-                    'barcode_type': item.barcode_type or '',
-                    'exp_date': item.exp_date.isoformat() if item.exp_date else None,
-                }
-            })
+            }, match={'barcode': barcode})
         except ItemModel.DoesNotExist:
             logger.warning(f"Barcode not found: {barcode} (mode: {mode})")
             
@@ -899,16 +982,8 @@ def barcode_lookup(request):
                 except Exception as e:
                     logger.error(f"GS1 component search error: {e}")
             
-            return JsonResponse({
-                'status': 'error',
-                'error': 'Item not found',
-                'user_message': f'No item found with barcode: {barcode}. Please check if the barcode is assigned.',
-                'suggestions': {
-                    'gs1_detected': is_gs1,
-                    'gs1_parsed': parsed_data if is_gs1 else None,
-                    'gtin': gtin if is_gs1 else None
-                }
-            }, status=404)
+            barcode_cache.set_not_found(ItemModel, barcode)
+            return _barcode_not_found_response(barcode, is_gs1)
 
     except json.JSONDecodeError as e:
         logger.error(f"Invalid JSON in barcode lookup: {str(e)}")
@@ -965,7 +1040,7 @@ def assign_barcode(request):
             # Assign barcode
             item.barcode = barcode
             item.barcode_type = barcode_type
-            item.save(update_fields=['barcode', 'barcode_type'])
+            item.save(update_fields=['barcode', 'barcode_type', 'updated_at'])
 
             return JsonResponse({
                 'status': 'success',
@@ -994,6 +1069,10 @@ def barcode_batch_lookup(request):
     """
     Look up multiple items by barcode for rapid scanning
     POST body: {"barcodes": ["123", "456", "789"], "mode": "retail"}
+
+    All codes are resolved together (exact barcode, then GTIN/GS1 fallback).
+    Codes scanned more than once are reported in ``duplicates`` and codes
+    matching several items in ``ambiguous``.
     """
     try:
         data = json.loads(request.body)
@@ -1003,40 +1082,59 @@ def barcode_batch_lookup(request):
         if not barcodes or not isinstance(barcodes, list):
             return JsonResponse({'error': 'barcodes array is required'}, status=400)
 
+        if len(barcodes) > MAX_BATCH_BARCODES:
+            return JsonResponse({
+                'error': f'Too many barcodes: {len(barcodes)} (maximum {MAX_BATCH_BARCODES} per request)'
+            }, status=400)
+
         # Select appropriate model based on mode
         ItemModel = Item if mode == 'retail' else WholesaleItem
 
-        results = []
-        not_found = []
+        resolved = resolve_barcodes(ItemModel, barcodes)
+        matches = resolved['matches']
+        not_found = [barcode for barcode in barcodes if normalize_barcode(barcode) not in matches]
+        ambiguous = [code for code, match in matches.items() if len(match['items']) > 1]
+
+        def results():
+            for barcode in barcodes:
+                match = matches.get(normalize_barcode(barcode))
+                if match is None:
+                    yield {
+                        'barcode': barcode,
+                        'found': False
+                    }
+                    continue
 
-        for barcode in barcodes:
-            try:
-                item = ItemModel.objects.get(barcode=barcode.strip())
-                results.append({
+                item = match['items'][0]
+                result = {
                     'barcode': barcode,
                     'found': True,
+                    'match_type': match['match_type'],
                     'item': {
-                        'id': item.id,
-                        'name': item.name,
-                        'brand': item.brand or '',
-                        'price': str(item.price),
-                        'stock': str(item.stock),
+                        'id': item['id'],
+                        'name': item['name'],
+                        'brand': item['brand'] or '',
+                        'price': item['price'],
+                        'stock': item['stock'],
                     }
-                })
-            except ItemModel.DoesNotExist:
-                not_found.append(barcode)
-                results.append({
-                    'barcode': barcode,
-                    'found': False
-                })
-
-        return JsonResponse({
+                }
+                if len(match['items']) > 1:
+                    result['ambiguous'] = True
+                    result['matches'] = [
+                        {'id': other['id'], 'name': other['name'], 'brand': other['brand'] or ''}
+                        for other in match['items']
+                    ]
+                yield result
+
+        return StreamingJsonResponse({
             'status': 'success',
             'total': len(barcodes),
             'found_count': len(barcodes) - len(not_found),
             'not_found_count': len(not_found),
-            'results': results,
-            'not_found': not_found
+            'duplicates': resolved['duplicates'],
+            'ambiguous': ambiguous,
+            'not_found': not_found,
+            'results': results(),
         })
 
     except json.JSONDecodeError:
@@ -1564,3 +1662,71 @@ def wholesale_cart_add(request):
             'error': str(e),
             'user_message': 'Failed to add item to wholesale cart'
         }, status=500)
+
+
+def counter_snapshot(user):
+    """Badge counts of ``user`` with the counter version they were read at"""
+    # Version first: a change racing with the reads shows up as a newer version
+    version = counters.version(user.pk)
+    from store.notifications import NotificationService
+    from chat.unread import unread_count
+    return {
+        'version': version,
+        'notifications': NotificationService.get_cached_unread_count(user),
+        'unread_messages': unread_count(user),
+    }
+
+
+@require_http_methods(["GET"])
+def user_counters(request):
+    """
+    Badge counts (unread notifications and chat messages), answered at once
+    from the cache (pharmapp.counters); the badges poll it unless
+    counter_stream pushes the counts.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'status': 'error', 'error': 'Authentication required'}, status=401)
+    return JsonResponse(counter_snapshot(request.user))
+
+
+@require_http_methods(["GET"])
+async def counter_stream(request):
+    """
+    Server-sent events stream of the badge counts.
+
+    Sends a ``counters`` event on connect and after every change, keep-alive
+    comments in between, and closes after COUNTER_STREAM_SECONDS; EventSource
+    reconnects by itself. Only served when counters.push_enabled() (an ASGI
+    server, COUNTER_PUSH and a shared cache); otherwise answers 204, which
+    stops EventSource and makes the badges poll user_counters.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'status': 'error', 'error': 'Authentication required'}, status=401)
+    if not counters.push_enabled(request):
+        return HttpResponse(status=204)
+
+    duration = getattr(settings, 'COUNTER_STREAM_SECONDS', 55)
+    keepalive = min(15, duration)
+    snapshot_of = sync_to_async(counter_snapshot)
+
+    async def events():
+        deadline = time.monotonic() + duration
+        snapshot = await snapshot_of(user)
+        yield 'retry: 3000\n'
+        while True:
+            yield f"event: counters\ndata: {json.dumps(snapshot)}\n\n"
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                version = await counters.wait_for_change(user.pk, snapshot['version'], min(keepalive, remaining))
+                if version != snapshot['version']:
+                    break
+                yield ': keepalive\n\n'
+            snapshot = await snapshot_of(user)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import ChatRoom, ChatMessage, UserChatStatus, MessageReadStatus
+from .models import Broadcast, ChatRoom, ChatMessage, ChatReadState, UserChatStatus, MessageReadStatus
 
 @admin.register(ChatRoom)
 class ChatRoomAdmin(admin.ModelAdmin):
@@ -44,3 +44,18 @@ class MessageReadStatusAdmin(admin.ModelAdmin):
     search_fields = ['message__message', 'user__username']
     readonly_fields = ['read_at']
     raw_id_fields = ['message', 'user']
+
+@admin.register(ChatReadState)
+class ChatReadStateAdmin(admin.ModelAdmin):
+    list_display = ['room', 'user', 'last_read_at', 'updated_at']
+    search_fields = ['user__username']
+    readonly_fields = ['updated_at']
+    raw_id_fields = ['room', 'user']
+
+@admin.register(Broadcast)
+class BroadcastAdmin(admin.ModelAdmin):
+    list_display = ['sender', 'status', 'total_recipients', 'sent_count', 'failed_count', 'created_at', 'completed_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['sender__username', 'message']
+    readonly_fields = ['created_at', 'started_at', 'completed_at']
+    raw_id_fields = ['sender']
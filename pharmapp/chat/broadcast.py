@@ -0,0 +1,249 @@
+"""
+Broadcast fan-out: one message delivered to every active user.
+
+``bulk_message_view`` used to loop over the users in the request, running
+get_or_create_direct_room, a message INSERT and a room UPDATE per user. A
+Broadcast is now delivered in batches of BROADCAST_BATCH_SIZE recipients:
+
+    1. one query finds the sender's existing direct rooms with the batch;
+    2. missing rooms and their participants are bulk_created;
+    3. the messages are bulk_created;
+    4. one UPDATE bumps ``updated_at`` of the batch's rooms.
+
+Broadcasts with up to BROADCAST_INLINE_RECIPIENTS recipients are delivered
+within the request (a handful of queries); larger ones run on a background
+thread started after the Broadcast commits, and report progress through
+``Broadcast.sent_count``/``failed_count`` (see views.broadcast_status).
+
+Recipients are delivered in primary key order and each batch commits its
+progress (``last_recipient_id``, ``progress_at``) with its messages. A run
+cut short by a worker timeout, recycle or deploy therefore stops making
+progress without sending anything twice. Once it has made none for
+BROADCAST_STALE_SECONDS it is resumed after its last recipient by the next
+status poll or by ``manage.py resume_broadcasts``, which can also mark such
+runs failed instead.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, connections, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from pharmapp import counters
+
+from . import realtime
+from .models import Broadcast, ChatMessage, ChatRoom
+from .unread import UNREAD_COUNTER
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+BROADCAST_BATCH_SIZE = getattr(settings, 'BROADCAST_BATCH_SIZE', 200)
+BROADCAST_INLINE_RECIPIENTS = getattr(settings, 'BROADCAST_INLINE_RECIPIENTS', 25)
+BROADCAST_STALE_SECONDS = getattr(settings, 'BROADCAST_STALE_SECONDS', 300)
+
+# Prefix instead of an emoji to avoid MySQL utf8 encoding issues
+BROADCAST_PREFIX = '[BROADCAST]'
+
+Participant = ChatRoom.participants.through
+
+
+def broadcast_recipients(sender):
+    return User.objects.filter(is_active=True).exclude(pk=sender.pk)
+
+
+def start_broadcast(sender, message_text):
+    """
+    Create a Broadcast of ``message_text`` to every active user but ``sender``.
+
+    Small broadcasts are delivered before returning; larger ones are handed
+    to a background thread once the surrounding transaction commits.
+
+    Returns:
+        Broadcast
+    """
+    total = broadcast_recipients(sender).count()
+    broadcast = Broadcast.objects.create(sender=sender, message=message_text, total_recipients=total)
+    if total <= getattr(settings, 'BROADCAST_INLINE_RECIPIENTS', BROADCAST_INLINE_RECIPIENTS):
+        deliver_broadcast(broadcast.pk)
+        broadcast.refresh_from_db()
+    else:
+        transaction.on_commit(lambda: _start_thread(broadcast.pk))
+    return broadcast
+
+
+def _start_thread(broadcast_id, deliver=None):
+    threading.Thread(
+        target=_deliver_in_thread, args=(broadcast_id, deliver or deliver_broadcast),
+        name=f'broadcast-{broadcast_id}', daemon=True
+    ).start()
+
+
+def _deliver_in_thread(broadcast_id, deliver):
+    close_old_connections()
+    try:
+        deliver(broadcast_id)
+    finally:
+        connections.close_all()
+
+
+def _direct_rooms(sender_id, user_ids):
+    """Map user id -> id of the sender's most recently updated direct room with that user"""
+    sender_rooms = Participant.objects.filter(
+        user_id=sender_id, chatroom__room_type='direct'
+    ).values('chatroom_id')
+    rooms = {}
+    pairs = Participant.objects.filter(
+        chatroom_id__in=sender_rooms, user_id__in=user_ids
+    ).order_by('-chatroom__updated_at').values_list('user_id', 'chatroom_id')
+    for user_id, room_id in pairs:
+        rooms.setdefault(user_id, room_id)
+    return rooms
+
+
+def deliver_batch(broadcast, user_ids):
+    """Deliver ``broadcast`` to ``user_ids`` in one transaction; returns the number sent"""
+    with transaction.atomic():
+        rooms = _direct_rooms(broadcast.sender_id, user_ids)
+        new_rooms = {user_id: ChatRoom(room_type='direct') for user_id in user_ids if user_id not in rooms}
+        if new_rooms:
+            ChatRoom.objects.bulk_create(new_rooms.values())
+            Participant.objects.bulk_create([
+                Participant(chatroom_id=room.pk, user_id=member_id)
+                for user_id, room in new_rooms.items()
+                for member_id in (broadcast.sender_id, user_id)
+            ])
+            rooms.update((user_id, room.pk) for user_id, room in new_rooms.items())
+
+        text = f"{BROADCAST_PREFIX} {broadcast.message}"
+        messages = ChatMessage.objects.bulk_create([
+            ChatMessage(
+                room_id=rooms[user_id],
+                sender=broadcast.sender,
+                message=text,
+                message_type='text',
+                receiver_id=user_id,  # Legacy field
+            )
+            for user_id in user_ids
+        ])
+        ChatRoom.objects.filter(pk__in=rooms.values()).update(updated_at=timezone.now())
+        # Committed with the messages, so a resumed run never sends this batch again
+        Broadcast.objects.filter(pk=broadcast.pk).update(
+            sent_count=F('sent_count') + len(user_ids),
+            last_recipient_id=max(user_ids),
+            progress_at=timezone.now(),
+        )
+
+    # bulk_create skips the signals that keep the unread badge current and push messages
+    counters.adjust(UNREAD_COUNTER, 1, user_ids)
+    if realtime.enabled():
+        transaction.on_commit(lambda: realtime.push_messages(messages))
+    return len(user_ids)
+
+
+def deliver_broadcast(broadcast_id, batch_size=None):
+    """Deliver a pending Broadcast batch by batch, recording progress as it goes"""
+    now = timezone.now()
+    started = Broadcast.objects.filter(pk=broadcast_id, status='pending').update(
+        status='running', started_at=now, progress_at=now
+    )
+    if started:
+        _deliver(broadcast_id, batch_size)
+
+
+def _stale(stale_seconds=None):
+    """Unfinished broadcasts whose delivery made no progress for ``stale_seconds``"""
+    stale_seconds = stale_seconds or getattr(settings, 'BROADCAST_STALE_SECONDS', BROADCAST_STALE_SECONDS)
+    cutoff = timezone.now() - timedelta(seconds=stale_seconds)
+    # Pending ones were never handed off (the process ended before the thread started)
+    return Broadcast.objects.filter(
+        Q(status='running', progress_at__lt=cutoff) | Q(status='pending', created_at__lt=cutoff)
+    )
+
+
+def is_stale(broadcast, stale_seconds=None):
+    return _stale(stale_seconds).filter(pk=broadcast.pk).exists()
+
+
+def resume_broadcast(broadcast_id, batch_size=None, stale_seconds=None, background=False):
+    """
+    Take over a stale broadcast and deliver it from its last recipient on.
+
+    Only one caller wins the take-over. With ``background`` delivery runs on
+    a thread started after the surrounding transaction commits.
+
+    Returns:
+        bool: Whether this call took the broadcast over
+    """
+    now = timezone.now()
+    claimed = _stale(stale_seconds).filter(pk=broadcast_id).update(
+        status='running', started_at=Coalesce(F('started_at'), Value(now)), progress_at=now
+    )
+    if not claimed:
+        return False
+    logger.warning(f"Broadcast {broadcast_id}: delivery stalled, resuming")
+    if background:
+        transaction.on_commit(lambda: _start_thread(broadcast_id, lambda pk: _deliver(pk, batch_size)))
+    else:
+        _deliver(broadcast_id, batch_size)
+    return True
+
+
+def resume_stale_broadcasts(batch_size=None, stale_seconds=None):
+    """Resume every stale broadcast in this process; returns the ids resumed"""
+    return [
+        broadcast_id
+        for broadcast_id in _stale(stale_seconds).order_by('pk').values_list('pk', flat=True)
+        if resume_broadcast(broadcast_id, batch_size, stale_seconds)
+    ]
+
+
+def fail_stale_broadcasts(stale_seconds=None):
+    """Mark every stale broadcast failed instead of resuming it; returns the number marked"""
+    return _stale(stale_seconds).update(
+        status='failed',
+        error='Delivery was interrupted and not resumed',
+        total_recipients=F('sent_count') + F('failed_count'),
+        completed_at=timezone.now(),
+    )
+
+
+def _deliver(broadcast_id, batch_size=None):
+    """Deliver a running Broadcast to the recipients after its last delivered one"""
+    batch_size = batch_size or getattr(settings, 'BROADCAST_BATCH_SIZE', BROADCAST_BATCH_SIZE)
+    broadcast = Broadcast.objects.select_related('sender').get(pk=broadcast_id)
+
+    user_ids = list(
+        broadcast_recipients(broadcast.sender).filter(pk__gt=broadcast.last_recipient_id)
+        .order_by('pk').values_list('pk', flat=True)
+    )
+    errors = []
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        try:
+            deliver_batch(broadcast, batch)
+        except Exception as e:
+            logger.error(f"Broadcast {broadcast_id}: batch of {len(batch)} recipients failed: {e}", exc_info=True)
+            errors.append(str(e))
+            Broadcast.objects.filter(pk=broadcast_id).update(
+                failed_count=F('failed_count') + len(batch),
+                last_recipient_id=max(batch),
+                progress_at=timezone.now(),
+            )
+
+    broadcast.refresh_from_db(fields=['sent_count', 'failed_count'])
+    broadcast.status = 'failed' if errors and not broadcast.sent_count else 'completed'
+    broadcast.error = '; '.join(errors[:3])
+    broadcast.total_recipients = broadcast.sent_count + broadcast.failed_count
+    broadcast.completed_at = timezone.now()
+    broadcast.save(update_fields=['status', 'error', 'total_recipients', 'completed_at'])
+    logger.info(
+        f"Broadcast {broadcast_id} by {broadcast.sender.username}: "
+        f"{broadcast.sent_count}/{broadcast.total_recipients} sent, {broadcast.failed_count} failed"
+    )
@@ -3,7 +3,8 @@ from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from .models import ChatRoom, ChatMessage, UserChatStatus
+from .models import ChatRoom, ChatMessage
+from . import presence
 import uuid
 
 User = get_user_model()
@@ -23,6 +24,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
         
         if self.room_id:
             # Direct room connection
+            if not await self.is_participant(self.room_id):
+                await self.close()
+                return
             self.room_group_name = f'chat_{self.room_id}'
         elif self.user_id:
             # Create or get direct room between users
@@ -67,6 +71,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 self.room_group_name,
                 self.channel_name
             )
+            await self.set_typing(False)
         
         if hasattr(self, 'user') and self.user.is_authenticated:
             # Update user offline status
@@ -106,30 +111,16 @@ class ChatConsumer(AsyncWebsocketConsumer):
         if not message_text.strip():
             return
         
-        # Save message to database
+        # Save message to database; chat.signals pushes it to the room group
+        # (this connection included) once it is committed
         room = await self.get_room_by_id(self.room_id)
-        message = await self.create_message(room, self.user, message_text)
-        
-        # Send message to room group
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'chat_message',
-                'message': {
-                    'id': str(message.id),
-                    'message': message.message,
-                    'sender_id': message.sender.id,
-                    'sender_username': message.sender.username,
-                    'timestamp': message.timestamp.isoformat(),
-                    'message_type': message.message_type,
-                    'status': message.status
-                }
-            }
-        )
+        await self.create_message(room, self.user, message_text)
+        await self.set_typing(False)
 
     async def handle_typing_status(self, data):
         is_typing = data.get('is_typing', False)
-        
+        await self.set_typing(is_typing)
+
         # Send typing status to room group
         await self.channel_layer.group_send(
             self.room_group_name,
@@ -194,6 +185,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
         room, created = ChatRoom.get_or_create_direct_room(user1, user2)
         return room
 
+    @database_sync_to_async
+    def is_participant(self, room_id):
+        return ChatRoom.objects.filter(id=room_id, participants=self.user).exists()
+
     @database_sync_to_async
     def get_room_by_id(self, room_id):
         return ChatRoom.objects.get(id=room_id)
@@ -221,20 +216,23 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
     @database_sync_to_async
     def update_user_online_status(self, is_online):
-        user_status, created = UserChatStatus.objects.get_or_create(
-            user=self.user,
-            defaults={'is_online': is_online, 'last_seen': timezone.now()}
-        )
-        user_status.is_online = is_online
-        user_status.last_seen = timezone.now()
-        user_status.save()
+        if is_online:
+            presence.mark_online(self.user)
+        else:
+            presence.mark_offline(self.user)
+
+    @database_sync_to_async
+    def set_typing(self, is_typing):
+        presence.set_typing(self.room_id, self.user, is_typing)
 
     @database_sync_to_async
     def mark_messages_read(self, message_ids, user):
-        ChatMessage.objects.filter(
+        messages = ChatMessage.objects.filter(
             id__in=message_ids,
             room__participants=user
-        ).exclude(sender=user).update(status='read')
+        ).exclude(sender=user)
+        messages.update(status='read')
+        ChatMessage.mark_many_as_read(messages.select_related('room'), user)
 
 
 class OnlineStatusConsumer(AsyncWebsocketConsumer):
@@ -278,12 +276,11 @@ class OnlineStatusConsumer(AsyncWebsocketConsumer):
 
     @database_sync_to_async
     def get_online_users(self):
-        online_statuses = UserChatStatus.objects.filter(is_online=True).select_related('user')
         return [
             {
-                'id': status.user.id,
-                'username': status.user.username,
-                'last_seen': status.last_seen.isoformat() if status.last_seen else None
+                'id': user['id'],
+                'username': user['username'],
+                'last_seen': user['last_seen'].isoformat()
             }
-            for status in online_statuses
+            for user in presence.online_users()
         ]
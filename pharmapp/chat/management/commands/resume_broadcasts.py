@@ -0,0 +1,43 @@
+"""
+Management command: finish broadcasts whose delivery was interrupted.
+
+Large broadcasts are delivered on a background thread of the web worker
+that started them (chat.broadcast). A worker timeout, recycle or deploy
+leaves them 'running' with part of the recipients served. This resumes
+every broadcast that made no progress for BROADCAST_STALE_SECONDS from its
+last delivered recipient, or with --fail marks them failed. Run after a
+deploy or periodically via cron:
+    python manage.py resume_broadcasts
+"""
+from django.core.management.base import BaseCommand
+
+from chat.broadcast import fail_stale_broadcasts, resume_stale_broadcasts
+
+
+class Command(BaseCommand):
+    help = 'Resume (or with --fail, mark failed) broadcasts whose delivery stalled.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fail',
+            action='store_true',
+            help='Mark stalled broadcasts failed instead of resuming them.',
+        )
+        parser.add_argument(
+            '--stale-seconds',
+            type=int,
+            default=None,
+            help='Seconds without progress before a broadcast counts as stalled (default: BROADCAST_STALE_SECONDS).',
+        )
+
+    def handle(self, *args, **options):
+        stale_seconds = options['stale_seconds']
+        if options['fail']:
+            failed = fail_stale_broadcasts(stale_seconds)
+            self.stdout.write(self.style.SUCCESS(f'Marked {failed} stalled broadcasts failed.'))
+            return
+
+        resumed = resume_stale_broadcasts(stale_seconds=stale_seconds)
+        self.stdout.write(self.style.SUCCESS(
+            f'Resumed {len(resumed)} stalled broadcasts' + (f': {", ".join(map(str, resumed))}' if resumed else '.')
+        ))
@@ -0,0 +1,70 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def backfill_read_states(apps, schema_editor):
+    """Start each (room, user) read marker at the latest message they had read"""
+    MessageReadStatus = apps.get_model('chat', 'MessageReadStatus')
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+    ChatReadState = apps.get_model('chat', 'ChatReadState')
+
+    markers = {}
+    read_receipts = MessageReadStatus.objects.values('message__room_id', 'user_id').annotate(
+        last_read_at=Max('message__timestamp')
+    )
+    legacy_reads = ChatMessage.objects.filter(receiver__isnull=False, is_read=True).values(
+        'room_id', 'receiver_id'
+    ).annotate(last_read_at=Max('timestamp'))
+    rows = [(row['message__room_id'], row['user_id'], row['last_read_at']) for row in read_receipts]
+    rows += [(row['room_id'], row['receiver_id'], row['last_read_at']) for row in legacy_reads]
+    for room_id, user_id, last_read_at in rows:
+        key = (room_id, user_id)
+        if key not in markers or last_read_at > markers[key]:
+            markers[key] = last_read_at
+
+    ChatReadState.objects.bulk_create([
+        ChatReadState(room_id=room_id, user_id=user_id, last_read_at=last_read_at)
+        for (room_id, user_id), last_read_at in markers.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_remove_messagereaction_unique_message_user_reaction_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatReadState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['room', 'timestamp'], name='chat_chatme_room_id_b9cdcd_idx'),
+        ),
+        migrations.AddField(
+            model_name='chatreadstate',
+            name='room',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='chat.chatroom'),
+        ),
+        migrations.AddField(
+            model_name='chatreadstate',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_read_states', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='chatreadstate',
+            unique_together={('room', 'user')},
+        ),
+        migrations.RunPython(backfill_read_states, migrations.RunPython.noop),
+    ]
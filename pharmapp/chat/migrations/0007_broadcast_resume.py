@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-18 08:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_broadcast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='broadcast',
+            name='last_recipient_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='broadcast',
+            name='progress_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -44,6 +44,11 @@ class ChatRoom(models.Model):
         room.participants.add(user1, user2)
         return room, True
 
+    @property
+    def tracks_read_receipts(self):
+        """Group rooms record who read each message; direct rooms only need read markers"""
+        return self.room_type == 'group'
+
     class Meta:
         ordering = ['-updated_at']
 
@@ -94,19 +99,33 @@ class ChatMessage(models.Model):
         return f'{self.sender.username} in {self.room}: {self.message[:20]}'
 
     def mark_as_read(self, user):
-        """Mark message as read by a specific user"""
-        MessageReadStatus.objects.get_or_create(
-            message=self,
-            user=user,
-            defaults={'read_at': timezone.now()}
-        )
+        """Mark message (and everything before it in the room) as read by a specific user"""
+        ChatMessage.mark_many_as_read([self], user)
+
+    @classmethod
+    def mark_many_as_read(cls, messages, user):
+        """
+        Mark ``messages`` as read by ``user`` in one write per room: the read
+        marker moves to the latest one, and group rooms get their receipts
+        in a single bulk insert. Messages sent by ``user`` are skipped.
+        """
+        from .unread import mark_messages_read
+        mark_messages_read(user, messages)
 
     def is_read_by(self, user):
         """Check if message is read by a specific user"""
-        return MessageReadStatus.objects.filter(message=self, user=user).exists()
+        if self.room.tracks_read_receipts:
+            return MessageReadStatus.objects.filter(message=self, user=user).exists()
+        return ChatReadState.objects.filter(
+            room_id=self.room_id, user=user, last_read_at__gte=self.timestamp
+        ).exists()
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Unread counts are range counts after each read marker
+            models.Index(fields=['room', 'timestamp']),
+        ]
 
 class MessageReadStatus(models.Model):
     """Track read status of messages by users"""
@@ -117,6 +136,59 @@ class MessageReadStatus(models.Model):
     class Meta:
         unique_together = ['message', 'user']
 
+class ChatReadState(models.Model):
+    """Last message time each participant has read up to in a room"""
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='read_states')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='chat_read_states')
+    last_read_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['room', 'user']
+
+    def __str__(self):
+        return f"{self.user.username} read {self.room} up to {self.last_read_at}"
+
+class Broadcast(models.Model):
+    """A message sent to every active user, delivered in batches by chat.broadcast"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='broadcasts')
+    message = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    total_recipients = models.PositiveIntegerField(default=0)
+    sent_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+    # Resume point: recipients are delivered in pk order, committed with each batch
+    last_recipient_id = models.BigIntegerField(default=0)
+    progress_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Broadcast by {self.sender.username} ({self.get_status_display()})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+
+    @property
+    def progress(self):
+        """Percentage of recipients processed"""
+        if not self.total_recipients:
+            return 100 if self.is_finished else 0
+        return int((self.sent_count + self.failed_count) * 100 / self.total_recipients)
+
 class MessageReaction(models.Model):
     """Model for message reactions (like, love, laugh, etc.)"""
     REACTION_TYPES = [
@@ -0,0 +1,161 @@
+"""
+Chat presence and typing indicators, kept in the cache.
+
+Both used to live in UserChatStatus rows: every chat page view and
+online-users poll rewrote ``is_online``/``last_seen``, and every start or
+stop of typing rewrote ``typing_in_room``/``typing_since``. The data is only
+meaningful for seconds to minutes, so it now lives in cache entries that
+expire on their own:
+
+    * ``chat_presence:<user_id>`` holds the time the user was last seen and
+      expires after CHAT_PRESENCE_TIMEOUT seconds;
+    * ``chat_typing:<room_id>:<user_id>`` exists while the user is typing in
+      the room, for at most CHAT_TYPING_TIMEOUT seconds after they started.
+
+UserChatStatus is still kept for "last seen", but written at most once every
+CHAT_PRESENCE_SAVE_INTERVAL seconds per user, and when they go offline.
+
+This needs a cache shared by every worker process (utils.cache). With a
+process-local cache (the LocMemCache default) a heartbeat or typing update
+handled by one worker would be invisible to the polls served by another,
+so UserChatStatus stays the shared record instead, as before:
+
+    * heartbeats write ``last_seen`` at most once every
+      CHAT_PRESENCE_DB_SAVE_INTERVAL seconds per user and process, and
+      online users are read from it;
+    * typing is written to ``typing_in_room``/``typing_since`` and read
+      back for CHAT_TYPING_TIMEOUT seconds.
+
+The HTTP views, the WebSocket consumers and the login/logout signals all go
+through this module.
+"""
+import logging
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+
+from utils.cache import is_shared_cache
+
+from .models import UserChatStatus
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+CHAT_PRESENCE_TIMEOUT = getattr(settings, 'CHAT_PRESENCE_TIMEOUT', 300)
+CHAT_PRESENCE_SAVE_INTERVAL = getattr(settings, 'CHAT_PRESENCE_SAVE_INTERVAL', 300)
+CHAT_TYPING_TIMEOUT = getattr(settings, 'CHAT_TYPING_TIMEOUT', 10)
+
+# Heartbeat writes of "last seen" without a shared cache (well inside the
+# two-minute window of the online-users poll)
+CHAT_PRESENCE_DB_SAVE_INTERVAL = getattr(settings, 'CHAT_PRESENCE_DB_SAVE_INTERVAL', 30)
+
+
+def _presence_key(user_id):
+    return f'chat_presence:{user_id}'
+
+
+def _saved_key(user_id):
+    return f'chat_presence_saved:{user_id}'
+
+
+def _typing_key(room_id, user_id):
+    return f'chat_typing:{room_id}:{user_id}'
+
+
+def _save_status(user_id, is_online, last_seen):
+    # update() leaves last_seen (auto_now) as given
+    if not UserChatStatus.objects.filter(user_id=user_id).update(is_online=is_online, last_seen=last_seen):
+        UserChatStatus.objects.get_or_create(user_id=user_id, defaults={'is_online': is_online})
+
+
+def mark_online(user):
+    """Record that ``user`` is active now"""
+    now = timezone.now()
+    shared = is_shared_cache()
+    interval = CHAT_PRESENCE_SAVE_INTERVAL if shared else min(CHAT_PRESENCE_SAVE_INTERVAL, CHAT_PRESENCE_DB_SAVE_INTERVAL)
+    if shared:
+        cache.set(_presence_key(user.pk), now, CHAT_PRESENCE_TIMEOUT)
+    if cache.add(_saved_key(user.pk), True, interval):
+        _save_status(user.pk, True, now)
+
+
+def mark_offline(user):
+    """Record that ``user`` left (logged out or closed their chat socket)"""
+    cache.delete_many([_presence_key(user.pk), _saved_key(user.pk)])
+    _save_status(user.pk, False, timezone.now())
+
+
+def online_users(exclude_user_id=None, within=None):
+    """
+    Users seen within the last ``within`` seconds (CHAT_PRESENCE_TIMEOUT by default).
+
+    Returns:
+        list: ``{'id', 'username', 'last_seen'}`` dicts, ``last_seen`` a datetime
+    """
+    threshold = timezone.now() - timezone.timedelta(seconds=within or CHAT_PRESENCE_TIMEOUT)
+    if not is_shared_cache():
+        statuses = UserChatStatus.objects.filter(
+            is_online=True, last_seen__gte=threshold
+        ).exclude(user_id=exclude_user_id).order_by('user_id').values_list('user_id', 'user__username', 'last_seen')
+        return [
+            {'id': user_id, 'username': username, 'last_seen': last_seen}
+            for user_id, username, last_seen in statuses
+        ]
+
+    users = User.objects.exclude(pk=exclude_user_id).values_list('pk', 'username')
+    usernames = dict(users)
+    seen = cache.get_many([_presence_key(user_id) for user_id in usernames])
+    return [
+        {'id': user_id, 'username': username, 'last_seen': seen[_presence_key(user_id)]}
+        for user_id, username in usernames.items()
+        if seen.get(_presence_key(user_id), threshold) > threshold
+    ]
+
+
+def set_typing(room_id, user, is_typing):
+    """Record that ``user`` started (or stopped) typing in ``room_id``"""
+    if not is_shared_cache():
+        if is_typing:
+            UserChatStatus.objects.update_or_create(
+                user_id=user.pk, defaults={'typing_in_room_id': room_id, 'typing_since': timezone.now()}
+            )
+        else:
+            UserChatStatus.objects.filter(user_id=user.pk, typing_in_room_id=room_id).update(
+                typing_in_room=None, typing_since=None
+            )
+        return
+
+    key = _typing_key(room_id, user.pk)
+    if is_typing:
+        cache.set(key, user.username, CHAT_TYPING_TIMEOUT)
+    else:
+        cache.delete(key)
+
+
+def typing_users(room, exclude_user_id=None):
+    """
+    Participants typing in ``room``.
+
+    Returns:
+        list: ``{'id', 'username'}`` dicts, without ``exclude_user_id``
+    """
+    if not is_shared_cache():
+        since = timezone.now() - timezone.timedelta(seconds=CHAT_TYPING_TIMEOUT)
+        statuses = UserChatStatus.objects.filter(
+            typing_in_room=room, typing_since__gte=since, user__in=room.participants.all()
+        ).exclude(user_id=exclude_user_id).order_by('user_id').values_list('user_id', 'user__username')
+        return [{'id': user_id, 'username': username} for user_id, username in statuses]
+
+    user_ids = [
+        user_id for user_id in room.participants.values_list('pk', flat=True)
+        if user_id != exclude_user_id
+    ]
+    typing = cache.get_many([_typing_key(room.pk, user_id) for user_id in user_ids])
+    return [
+        {'id': user_id, 'username': typing[_typing_key(room.pk, user_id)]}
+        for user_id in user_ids
+        if _typing_key(room.pk, user_id) in typing
+    ]
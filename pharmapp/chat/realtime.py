@@ -0,0 +1,85 @@
+"""
+Push of chat events to the WebSocket consumers (chat.consumers.ChatConsumer).
+
+Open chat pages used to poll get_new_messages_api every two seconds. With
+CHAT_WEBSOCKETS enabled they connect to ``ws/chat/room/<room_id>/`` instead
+and every new message is sent to the room's channel group once its
+transaction commits (see chat.signals), whichever view, consumer or
+broadcast created it. Typing indicators set over HTTP are pushed the same
+way. Pages fall back to polling while their socket is down.
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def enabled():
+    return getattr(settings, 'CHAT_WEBSOCKETS', False)
+
+
+def room_group(room_id):
+    return f'chat_{room_id}'
+
+
+def serialize_message_enhanced(message):
+    """Enhanced message serialization for real-time chat"""
+    return {
+        'id': str(message.id),
+        'sender_username': message.sender.username,
+        'sender_id': message.sender.id,
+        'message': message.message,
+        'timestamp': message.timestamp.isoformat(),
+        'message_type': message.message_type,
+        'status': message.status,
+        'is_read': message.is_read,
+        'file_url': message.file_attachment.url if message.file_attachment else None,
+        'edited_at': message.edited_at.isoformat() if message.edited_at else None,
+        'voice_duration': message.voice_duration,
+        'is_pinned': message.is_pinned,
+        'is_forwarded': message.is_forwarded,
+        'location_lat': str(message.location_lat) if message.location_lat else None,
+        'location_lng': str(message.location_lng) if message.location_lng else None,
+        'location_address': message.location_address,
+        'reply_to': {
+            'id': str(message.reply_to.id),
+            'message': message.reply_to.message,
+            'sender': message.reply_to.sender.username
+        } if message.reply_to else None
+    }
+
+
+def _group_send(room_id, event):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(room_group(room_id), event)
+    except Exception as e:
+        # Clients still catch up by polling; never fail the request over it
+        logger.warning(f"Could not push {event['type']} to room {room_id}: {e}")
+
+
+def push_messages(messages):
+    """Send ``messages`` to the consumers connected to their rooms"""
+    if not enabled():
+        return
+    for message in messages:
+        _group_send(message.room_id, {
+            'type': 'chat_message',
+            'message': serialize_message_enhanced(message),
+        })
+
+
+def push_typing(room_id, user, is_typing):
+    if not enabled():
+        return
+    _group_send(room_id, {
+        'type': 'typing_status',
+        'user_id': user.id,
+        'username': user.username,
+        'is_typing': is_typing,
+    })
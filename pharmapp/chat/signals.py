@@ -1,7 +1,9 @@
 from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
-from django.utils import timezone
-from .models import UserChatStatus
+from .models import ChatMessage, ChatRoom
+from . import presence, realtime, unread
 
 
 @receiver(user_logged_in)
@@ -10,13 +12,7 @@ def set_user_online_on_login(sender, request, user, **kwargs):
     Signal handler to set user chat status to online when user logs in
     """
     try:
-        user_chat_status, created = UserChatStatus.objects.get_or_create(
-            user=user,
-            defaults={'is_online': True, 'last_seen': timezone.now()}
-        )
-        user_chat_status.is_online = True
-        user_chat_status.last_seen = timezone.now()
-        user_chat_status.save()
+        presence.mark_online(user)
     except Exception:
         # Silently handle any errors to avoid breaking login process
         pass
@@ -28,11 +24,31 @@ def set_user_offline_on_logout(sender, request, user, **kwargs):
     Signal handler to set user chat status to offline when user logs out
     """
     try:
-        user_chat_status = UserChatStatus.objects.filter(user=user).first()
-        if user_chat_status:
-            user_chat_status.is_online = False
-            user_chat_status.last_seen = timezone.now()
-            user_chat_status.save()
+        if user is not None:
+            presence.mark_offline(user)
     except Exception:
         # Silently handle any errors to avoid breaking logout process
         pass
+
+
+@receiver(post_save, sender=ChatMessage)
+def count_message_save(sender, instance, created, **kwargs):
+    """Keep the unread messages badge (chat.unread) in step and push the message"""
+    if created:
+        unread.record_message_created(instance)
+        if realtime.enabled():
+            transaction.on_commit(lambda: realtime.push_messages([instance]))
+
+
+@receiver(post_delete, sender=ChatMessage)
+def count_message_delete(sender, instance, **kwargs):
+    unread.invalidate_room(instance.room_id)
+
+
+@receiver(m2m_changed, sender=ChatRoom.participants.through)
+def count_participants_change(sender, instance, action, pk_set=None, **kwargs):
+    """Joining or leaving a room changes which messages count as unread"""
+    if action in ('post_add', 'post_remove') and isinstance(instance, ChatRoom):
+        unread.invalidate_room(instance.pk, list(pk_set or ()))
+    elif action == 'pre_clear' and isinstance(instance, ChatRoom):
+        unread.invalidate_room(instance.pk)
@@ -1,9 +1,23 @@
-from django.test import TestCase, Client
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from django.db import connection
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.utils import timezone
-from chat.models import ChatRoom, ChatMessage, UserChatStatus, MessageReadStatus
+from chat.models import Broadcast, ChatRoom, ChatMessage, ChatReadState, UserChatStatus, MessageReadStatus
+from chat.broadcast import deliver_batch, deliver_broadcast, resume_stale_broadcasts
+from chat.unread import annotate_unread_counts, count_unread
+from chat import presence, realtime
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from unittest import mock
 import json
+import time
 
 User = get_user_model()
 
@@ -76,9 +90,52 @@ class ChatModelTests(TestCase):
         # Should be read now
         self.assertTrue(message.is_read_by(self.user2))
         
-        # Check read status object was created
-        read_status = MessageReadStatus.objects.get(message=message, user=self.user2)
-        self.assertIsNotNone(read_status.read_at)
+        # Direct rooms keep a read marker instead of per-message receipts
+        read_state = ChatReadState.objects.get(room=room, user=self.user2)
+        self.assertEqual(read_state.last_read_at, message.timestamp)
+        self.assertFalse(MessageReadStatus.objects.filter(message=message).exists())
+
+    def test_group_message_read_receipts(self):
+        """Test group rooms record a receipt per message read"""
+        room = ChatRoom.objects.create(room_type='group', name='Pharmacists')
+        room.participants.add(self.user1, self.user2)
+        message = ChatMessage.objects.create(room=room, sender=self.user1, message="Stock count at 5")
+
+        message.mark_as_read(self.user2)
+        message.mark_as_read(self.user2)
+
+        self.assertTrue(message.is_read_by(self.user2))
+        self.assertEqual(MessageReadStatus.objects.filter(message=message, user=self.user2).count(), 1)
+
+    def test_mark_many_as_read_writes_once_per_room(self):
+        """Test marking a batch of messages read does not write per message"""
+        room = ChatRoom.objects.create(room_type='group', name='Night shift')
+        room.participants.add(self.user1, self.user2)
+        for i in range(10):
+            ChatMessage.objects.create(room=room, sender=self.user1, message=f"Message {i}")
+        messages = list(room.messages.all())
+        messages[0].mark_as_read(self.user2)
+
+        # One marker update and one receipts insert for the whole batch
+        with self.assertNumQueries(2):
+            ChatMessage.mark_many_as_read(messages[1:], self.user2)
+
+        self.assertEqual(MessageReadStatus.objects.filter(user=self.user2).count(), 10)
+        self.assertEqual(count_unread(self.user2.pk), 0)
+
+    def test_unread_count_uses_read_marker(self):
+        """Test messages after the read marker count as unread"""
+        room, _ = ChatRoom.get_or_create_direct_room(self.user1, self.user2)
+        first = ChatMessage.objects.create(room=room, sender=self.user1, message="One")
+        ChatMessage.objects.create(room=room, sender=self.user1, message="Two")
+        ChatMessage.objects.create(room=room, sender=self.user2, message="Own message")
+
+        self.assertEqual(count_unread(self.user2.pk), 2)
+        first.mark_as_read(self.user2)
+        self.assertEqual(count_unread(self.user2.pk), 1)
+
+        rooms = annotate_unread_counts(ChatRoom.objects.filter(pk=room.pk), self.user2)
+        self.assertEqual(rooms.get().unread_count, 1)
 
     def test_user_chat_status(self):
         """Test user chat status functionality"""
@@ -358,6 +415,180 @@ class BulkMessageTests(TestCase):
         new_messages = ChatMessage.objects.count() - initial_message_count
         self.assertEqual(new_messages, 0)  # No messages sent
 
+    def test_broadcast_batch_queries_do_not_grow_with_recipients(self):
+        """Test a batch costs the same queries for 2 or 20 recipients"""
+        def deliver(user_ids):
+            broadcast = Broadcast.objects.create(sender=self.admin, message='Batch', total_recipients=len(user_ids))
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(deliver_batch(broadcast, user_ids), len(user_ids))
+            return len(queries)
+
+        small = deliver([self.user1.pk, self.user2.pk])
+        others = [
+            User.objects.create_user(username=f'staff{i}', mobile=f'07000000{i:02d}', password='test123').pk
+            for i in range(20)
+        ]
+        self.assertEqual(deliver(others), small)
+        # Existing rooms are reused
+        self.assertEqual(deliver(others), small - 2)
+
+        self.assertEqual(ChatMessage.objects.filter(receiver_id__in=others).count(), 40)
+        room, created = ChatRoom.get_or_create_direct_room(self.admin, User.objects.get(pk=others[0]))
+        self.assertFalse(created)
+        self.assertEqual(room.messages.count(), 2)
+
+    # Activity log and session write-behind off: the only on-commit callback is the broadcast hand-off
+    @override_settings(BROADCAST_INLINE_RECIPIENTS=1, BROADCAST_BATCH_SIZE=1,
+                       ACTIVITY_LOG_ASYNC=False, SESSION_WRITE_BEHIND=False)
+    def test_large_broadcast_is_delivered_off_the_request(self):
+        """Test large broadcasts are handed off after commit and report progress"""
+        self.client.login(mobile='1111111111', password='admin123')
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('chat:bulk_message'), data={'message': 'Stock take at 6'})
+
+        broadcast = Broadcast.objects.get()
+        self.assertRedirects(response, f"{reverse('chat:bulk_message')}?broadcast={broadcast.pk}",
+                             fetch_redirect_response=False)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(ChatMessage.objects.filter(sender=self.admin).count(), 0)
+
+        status_url = reverse('chat:broadcast_status', args=[broadcast.pk])
+        self.assertEqual(json.loads(self.client.get(status_url).content)['status'], 'pending')
+
+        # What the background thread runs
+        deliver_broadcast(broadcast.pk)
+        data = json.loads(self.client.get(status_url).content)
+        self.assertEqual((data['status'], data['sent'], data['total'], data['progress']), ('completed', 2, 2, 100))
+        self.assertEqual(ChatMessage.objects.filter(sender=self.admin).count(), 2)
+
+    def _interrupted_broadcast(self):
+        """A broadcast whose worker died after delivering to the first recipient"""
+        broadcast = Broadcast.objects.create(sender=self.admin, message='Inventory', total_recipients=2,
+                                             status='running', started_at=timezone.now())
+        deliver_batch(broadcast, [self.user1.pk])
+        Broadcast.objects.filter(pk=broadcast.pk).update(progress_at=timezone.now() - timedelta(minutes=10))
+        return broadcast
+
+    def test_interrupted_broadcast_is_resumed_after_its_last_recipient(self):
+        """Test a stalled run is finished without sending anyone the message twice"""
+        broadcast = self._interrupted_broadcast()
+        self.assertEqual(resume_stale_broadcasts(), [broadcast.pk])
+
+        broadcast.refresh_from_db()
+        self.assertEqual((broadcast.status, broadcast.sent_count, broadcast.total_recipients), ('completed', 2, 2))
+        for user in (self.user1, self.user2):
+            self.assertEqual(ChatMessage.objects.filter(sender=self.admin, receiver=user).count(), 1)
+        # Finished broadcasts are left alone
+        self.assertEqual(resume_stale_broadcasts(), [])
+
+    @override_settings(ACTIVITY_LOG_ASYNC=False, SESSION_WRITE_BEHIND=False)
+    def test_status_poll_resumes_a_stalled_broadcast(self):
+        """Test the progress page does not poll a dead run forever"""
+        broadcast = self._interrupted_broadcast()
+        self.client.login(mobile='1111111111', password='admin123')
+        with mock.patch('chat.broadcast._start_thread') as start_thread, \
+                self.captureOnCommitCallbacks(execute=True):
+            data = json.loads(self.client.get(reverse('chat:broadcast_status', args=[broadcast.pk])).content)
+        self.assertEqual(data['status'], 'running')
+        start_thread.assert_called_once()
+
+        # A second poll while the resumed run is making progress does not take it over again
+        self.client.get(reverse('chat:broadcast_status', args=[broadcast.pk]))
+        start_thread.assert_called_once()
+
+    def test_stalled_broadcasts_can_be_marked_failed(self):
+        """Test resume_broadcasts --fail finishes stalled runs as failed"""
+        broadcast = self._interrupted_broadcast()
+        call_command('resume_broadcasts', '--fail', stdout=StringIO())
+
+        broadcast.refresh_from_db()
+        self.assertEqual((broadcast.status, broadcast.total_recipients, broadcast.progress), ('failed', 1, 100))
+        self.assertEqual(ChatMessage.objects.filter(sender=self.admin).count(), 1)
+
+class ChatRealtimeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user1 = User.objects.create_user(username='typist1', mobile='1212121212', password='testpass123')
+        self.user2 = User.objects.create_user(username='typist2', mobile='2121212121', password='testpass123')
+        self.room, _ = ChatRoom.get_or_create_direct_room(self.user1, self.user2)
+
+    def test_typing_indicators_expire(self):
+        """Test typing state is kept in the cache and expires without a stop update"""
+        self.enterContext(mock.patch('chat.presence.is_shared_cache', return_value=True))
+        with self.assertNumQueries(0):
+            presence.set_typing(self.room.id, self.user1, True)
+            presence.set_typing(self.room.id, self.user2, True)
+        self.assertEqual(presence.typing_users(self.room, exclude_user_id=self.user2.id),
+                         [{'id': self.user1.id, 'username': 'typist1'}])
+
+        presence.set_typing(self.room.id, self.user2, False)
+        self.assertEqual(len(presence.typing_users(self.room)), 1)
+        self.assertFalse(UserChatStatus.objects.filter(typing_in_room=self.room).exists())
+
+        later = time.time() + presence.CHAT_TYPING_TIMEOUT + 1
+        with mock.patch('time.time', return_value=later):
+            self.assertEqual(presence.typing_users(self.room), [])
+
+    def test_presence_saves_last_seen_lazily(self):
+        """Test heartbeats stay in the cache between UserChatStatus writes"""
+        self.enterContext(mock.patch('chat.presence.is_shared_cache', return_value=True))
+        presence.mark_online(self.user1)
+        status = UserChatStatus.objects.get(user=self.user1)
+        self.assertTrue(status.is_online)
+        with self.assertNumQueries(0):
+            presence.mark_online(self.user1)
+
+        online = presence.online_users(exclude_user_id=self.user2.id)
+        self.assertEqual([user['username'] for user in online], ['typist1'])
+        self.assertEqual(presence.online_users(exclude_user_id=self.user1.id), [])
+
+        presence.mark_offline(self.user1)
+        self.assertEqual(presence.online_users(), [])
+        status.refresh_from_db()
+        self.assertFalse(status.is_online)
+
+    def test_process_local_cache_keeps_presence_in_the_database(self):
+        """Test another worker (with its own empty cache) sees presence and typing"""
+        presence.mark_online(self.user1)
+        presence.set_typing(self.room.id, self.user1, True)
+        cache.clear()
+
+        self.assertEqual([user['username'] for user in presence.online_users(exclude_user_id=self.user2.id)],
+                         ['typist1'])
+        self.assertEqual(presence.typing_users(self.room, exclude_user_id=self.user2.id),
+                         [{'id': self.user1.id, 'username': 'typist1'}])
+
+        later = timezone.now() + timedelta(seconds=presence.CHAT_TYPING_TIMEOUT + 1)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            self.assertEqual(presence.typing_users(self.room), [])
+
+        presence.set_typing(self.room.id, self.user1, False)
+        self.assertEqual(presence.typing_users(self.room), [])
+        presence.mark_offline(self.user1)
+        self.assertEqual(presence.online_users(), [])
+
+    @override_settings(CHAT_WEBSOCKETS=True)
+    def test_new_message_is_pushed_to_room_group(self):
+        """Test committed messages are sent to the consumers of their room"""
+        channel_layer = get_channel_layer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(realtime.room_group(self.room.id), channel)
+        self.addCleanup(async_to_sync(channel_layer.flush))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            message = ChatMessage.objects.create(room=self.room, sender=self.user1, message='Pushed')
+
+        event = async_to_sync(channel_layer.receive)(channel)
+        self.assertEqual(event['type'], 'chat_message')
+        self.assertEqual(event['message']['id'], str(message.id))
+        self.assertEqual(event['message']['sender_username'], 'typist1')
+
+    def test_messages_are_not_pushed_by_default(self):
+        """Test WSGI deployments (CHAT_WEBSOCKETS off) do not touch the channel layer"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            ChatMessage.objects.create(room=self.room, sender=self.user1, message='Polled')
+        self.assertEqual(callbacks, [])
+
 class ChatIntegrationTests(TestCase):
     def setUp(self):
         self.client = Client()
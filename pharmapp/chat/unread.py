@@ -0,0 +1,131 @@
+"""
+Unread chat messages, based on per-room read markers.
+
+Each participant has a ChatReadState per room holding the time of the last
+message they have read; a message is unread if somebody else sent it after
+that marker. Unread counts are therefore range counts on the
+(room, timestamp) index instead of anti-joins against every
+MessageReadStatus ever written, and reading a room updates one row.
+
+MessageReadStatus rows are only written in rooms that show who read each
+message (``ChatRoom.tracks_read_receipts``, i.e. group chats).
+
+The total for the badge is kept in pharmapp.counters (``chat_unread``):
+incremented by the signals in chat.signals on new messages and recounted
+after a read marker moves.
+"""
+import logging
+
+from datetime import datetime, timezone
+
+from django.db.models import Count, DateTimeField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from pharmapp import counters
+
+from .models import ChatMessage, ChatReadState, ChatRoom, MessageReadStatus
+
+logger = logging.getLogger(__name__)
+
+UNREAD_COUNTER = 'chat_unread'
+
+# Read marker of participants who have not read anything in a room
+NEVER_READ = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _read_marker(user_id):
+    """Last read time of ``user_id`` in the outer room (the epoch if never read)"""
+    marker = ChatReadState.objects.filter(room=OuterRef('pk'), user_id=user_id).values('last_read_at')[:1]
+    return Coalesce(Subquery(marker), Value(NEVER_READ), output_field=DateTimeField())
+
+
+def annotate_unread_counts(rooms, user):
+    """Annotate ``unread_count`` (messages ``user`` has not read) on a ChatRoom queryset"""
+    user_id = getattr(user, 'pk', user)
+    # A range count on the (room, timestamp) index per room
+    unread_in_room = ChatMessage.objects.filter(
+        room=OuterRef('pk'), timestamp__gt=OuterRef('read_marker')
+    ).exclude(sender_id=user_id).order_by().values('room').annotate(count=Count('pk')).values('count')
+    return rooms.annotate(read_marker=_read_marker(user_id)).annotate(
+        unread_count=Coalesce(Subquery(unread_in_room, output_field=IntegerField()), 0),
+    )
+
+
+def count_unread(user_id):
+    rooms = annotate_unread_counts(ChatRoom.objects.filter(participants=user_id), user_id)
+    return rooms.aggregate(total=Sum('unread_count'))['total'] or 0
+
+
+def unread_in_room(room, user):
+    """Messages of ``room`` that ``user`` has not read"""
+    marker = ChatReadState.objects.filter(room=room, user=user).values_list('last_read_at', flat=True).first()
+    return room.messages.filter(timestamp__gt=marker or NEVER_READ).exclude(sender=user)
+
+
+def unread_count(user):
+    """Unread messages badge for ``user`` (no query while the counter is cached)"""
+    return counters.get(UNREAD_COUNTER, user.pk)
+
+
+def mark_read(user, room, up_to):
+    """
+    Move the read marker of ``user`` in ``room`` forward to ``up_to``.
+
+    Returns:
+        bool: True if the marker moved
+    """
+    room_id = getattr(room, 'pk', room)
+    moved = ChatReadState.objects.filter(
+        room_id=room_id, user=user, last_read_at__lt=up_to
+    ).update(last_read_at=up_to)
+    if not moved:
+        _, moved = ChatReadState.objects.get_or_create(
+            room_id=room_id, user=user, defaults={'last_read_at': up_to}
+        )
+    if moved:
+        counters.invalidate(UNREAD_COUNTER, [user.pk])
+    return bool(moved)
+
+
+def mark_messages_read(user, messages):
+    """
+    Mark ``messages`` (and everything before them in their rooms) as read by ``user``.
+
+    Moves one read marker per room and writes MessageReadStatus receipts
+    for the messages of rooms that track them. Messages sent by ``user``
+    are ignored.
+    """
+    latest = {}
+    tracks_receipts = {}
+    receipts = []
+    for message in messages:
+        if message.sender_id == user.pk:
+            continue
+        if message.room_id not in latest or message.timestamp > latest[message.room_id]:
+            latest[message.room_id] = message.timestamp
+        if message.room_id not in tracks_receipts:
+            tracks_receipts[message.room_id] = message.room.tracks_read_receipts
+        if tracks_receipts[message.room_id]:
+            receipts.append(MessageReadStatus(message=message, user=user))
+
+    for room_id, up_to in latest.items():
+        mark_read(user, room_id, up_to)
+    if receipts:
+        MessageReadStatus.objects.bulk_create(receipts, ignore_conflicts=True)
+
+
+def record_message_created(message):
+    recipients = list(message.room.participants.exclude(pk=message.sender_id).values_list('pk', flat=True))
+    counters.adjust(UNREAD_COUNTER, 1, recipients)
+
+
+def invalidate_room(room_id, user_ids=None):
+    """Recount the unread messages of the participants of ``room_id`` (or of ``user_ids``)"""
+    if user_ids is None:
+        user_ids = list(ChatRoom.participants.through.objects.filter(
+            chatroom_id=room_id
+        ).values_list('user_id', flat=True))
+    counters.invalidate(UNREAD_COUNTER, user_ids)
+
+
+counters.register_counter(UNREAD_COUNTER, count_unread)
@@ -15,6 +15,7 @@ urlpatterns = [
 
     # Bulk messaging
     path('bulk-message/', views.bulk_message_view, name='bulk_message'),
+    path('api/broadcasts/<int:broadcast_id>/', views.broadcast_status, name='broadcast_status'),
 
     # API endpoints
     path('api/unread-count/', views.unread_messages_count, name='unread_messages_count'),
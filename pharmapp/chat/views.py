@@ -4,6 +4,7 @@ from django.contrib.auth import get_user_model
 from django.contrib import messages
 from django.db.models import Q, Count, Max
 from django.http import JsonResponse
+from django.urls import reverse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
@@ -11,7 +12,10 @@ from django.core.paginator import Paginator
 from django.template.loader import render_to_string
 from django import forms
 import json
-from .models import ChatMessage, ChatRoom, UserChatStatus, MessageReadStatus
+from .models import Broadcast, ChatMessage, ChatRoom, MessageReadStatus
+from .broadcast import is_stale, resume_broadcast, start_broadcast
+from .realtime import serialize_message_enhanced
+from . import presence, realtime, unread
 from .forms import ChatMessageForm
 
 User = get_user_model()
@@ -19,26 +23,16 @@ User = get_user_model()
 @login_required
 def chat_view(request, receiver_id=None, room_id=None):
     """Enhanced chat view supporting both direct messages and rooms"""
-    # Get or create user chat status
-    user_status, created = UserChatStatus.objects.get_or_create(
-        user=request.user,
-        defaults={'is_online': True, 'last_seen': timezone.now()}
-    )
-    user_status.is_online = True
-    user_status.last_seen = timezone.now()
-    user_status.save()
+    presence.mark_online(request.user)
 
     # Get all users for the sidebar
     users = User.objects.exclude(id=request.user.id).select_related('chat_status')
 
     # Get user's chat rooms with latest message info
-    user_rooms = ChatRoom.objects.filter(
+    user_rooms = unread.annotate_unread_counts(ChatRoom.objects.filter(
         participants=request.user
-    ).annotate(
+    ), request.user).annotate(
         latest_message_time=Max('messages__timestamp'),
-        unread_count=Count('messages', filter=Q(
-            messages__timestamp__gt=request.user.last_login or timezone.now()
-        ) & ~Q(messages__sender=request.user))
     ).order_by('-latest_message_time')
 
     selected_room = None
@@ -61,11 +55,7 @@ def chat_view(request, receiver_id=None, room_id=None):
         messages = messages_page.object_list
 
         # Mark messages as read
-        unread_messages = selected_room.messages.exclude(sender=request.user).exclude(
-            read_statuses__user=request.user
-        )
-        for message in unread_messages:
-            message.mark_as_read(request.user)
+        ChatMessage.mark_many_as_read(unread.unread_in_room(selected_room, request.user), request.user)
 
         # Update legacy is_read field for backward compatibility
         ChatMessage.objects.filter(
@@ -112,6 +102,7 @@ def chat_view(request, receiver_id=None, room_id=None):
         'selected_user': selected_user,
         'messages': messages,
         'form': form,
+        'chat_websockets': realtime.enabled(),
     }
     return render(request, 'chat/chat_interface.html', context)
 
@@ -211,34 +202,9 @@ def send_message_view(request):
 
 @login_required
 def unread_messages_count(request):
-    """Get unread messages count for the current user - optimized with caching"""
+    """Get unread messages count for the current user (served from pharmapp.counters)"""
     if request.user.is_authenticated:
-        from django.core.cache import cache
-        cache_key = f'unread_messages_count_{request.user.id}'
-        cached_count = cache.get(cache_key)
-        
-        if cached_count is not None:
-            return JsonResponse({'unread_count': cached_count})
-        
-        # Count unread messages in all rooms the user participates in - optimized with prefetch_related
-        unread_count = ChatMessage.objects.filter(
-            room__participants=request.user
-        ).exclude(sender=request.user).exclude(
-            read_statuses__user=request.user
-        ).prefetch_related('room__participants', 'read_statuses').count()
-
-        # Also count legacy unread messages for backward compatibility
-        legacy_unread = ChatMessage.objects.filter(
-            receiver=request.user,
-            is_read=False
-        ).count()
-
-        total_unread = max(unread_count, legacy_unread)
-        
-        # Cache for 15 seconds to reduce database load while maintaining near-real-time updates
-        cache.set(cache_key, total_unread, 15)
-
-        return JsonResponse({'unread_count': total_unread})
+        return JsonResponse({'unread_count': unread.unread_count(request.user)})
     return JsonResponse({'unread_count': 0})
 
 @login_required
@@ -252,19 +218,8 @@ def set_typing_status(request):
 
         if room_id:
             room = get_object_or_404(ChatRoom, id=room_id, participants=request.user)
-            user_status, created = UserChatStatus.objects.get_or_create(
-                user=request.user,
-                defaults={'is_online': True}
-            )
-
-            if is_typing:
-                user_status.typing_in_room = room
-                user_status.typing_since = timezone.now()
-            else:
-                user_status.typing_in_room = None
-                user_status.typing_since = None
-
-            user_status.save()
+            presence.set_typing(room.id, request.user, is_typing)
+            realtime.push_typing(room.id, request.user, is_typing)
 
             return JsonResponse({'success': True})
 
@@ -282,12 +237,7 @@ def get_typing_users(request, room_id):
         room = get_object_or_404(ChatRoom, id=room_id, participants=request.user)
 
         # Get users typing in this room (excluding current user)
-        typing_users = UserChatStatus.objects.filter(
-            typing_in_room=room,
-            typing_since__gte=timezone.now() - timezone.timedelta(seconds=10)  # 10 seconds timeout
-        ).exclude(user=request.user).select_related('user')
-
-        typing_usernames = [status.user.username for status in typing_users]
+        typing_usernames = [user['username'] for user in presence.typing_users(room, request.user.id)]
 
         return JsonResponse({
             'typing_users': typing_usernames,
@@ -302,18 +252,12 @@ def get_online_users(request):
     """Get list of online users"""
     try:
         # Users online in the last 5 minutes
-        online_threshold = timezone.now() - timezone.timedelta(minutes=5)
-        online_users = UserChatStatus.objects.filter(
-            is_online=True,
-            last_seen__gte=online_threshold
-        ).exclude(user=request.user).select_related('user')
-
         users_data = [{
-            'id': status.user.id,
-            'username': status.user.username,
-            'last_seen': status.last_seen.isoformat(),
-            'is_online': status.is_online
-        } for status in online_users]
+            'id': user['id'],
+            'username': user['username'],
+            'last_seen': user['last_seen'].isoformat(),
+            'is_online': True
+        } for user in presence.online_users(request.user.id, within=5 * 60)]
 
         return JsonResponse({'online_users': users_data})
 
@@ -346,21 +290,11 @@ def get_new_messages_api(request):
         messages = list(messages_query)
 
         # Get typing users
-        typing_users = UserChatStatus.objects.filter(
-            typing_in_room=room,
-            typing_since__gte=timezone.now() - timezone.timedelta(seconds=10)
-        ).exclude(user=request.user).select_related('user')
-
-        typing_data = [{
-            'id': status.user.id,
-            'username': status.user.username
-        } for status in typing_users]
+        typing_data = presence.typing_users(room, request.user.id)
 
         # Mark new messages as read
         if messages:
-            for message in messages:
-                if message.sender != request.user:
-                    message.mark_as_read(request.user)
+            ChatMessage.mark_many_as_read(messages, request.user)
 
         return JsonResponse({
             'success': True,
@@ -431,27 +365,15 @@ def get_online_users_api(request):
     """Get online users for real-time status updates"""
     try:
         # Update current user's online status
-        user_status, created = UserChatStatus.objects.get_or_create(
-            user=request.user,
-            defaults={'is_online': True, 'last_seen': timezone.now()}
-        )
-        user_status.is_online = True
-        user_status.last_seen = timezone.now()
-        user_status.save()
+        presence.mark_online(request.user)
 
         # Get online users (last seen within 2 minutes)
-        online_threshold = timezone.now() - timezone.timedelta(minutes=2)
-        online_users = UserChatStatus.objects.filter(
-            is_online=True,
-            last_seen__gte=online_threshold
-        ).exclude(user=request.user).select_related('user')
-
         users_data = [{
-            'id': status.user.id,
-            'username': status.user.username,
-            'last_seen': status.last_seen.isoformat(),
+            'id': user['id'],
+            'username': user['username'],
+            'last_seen': user['last_seen'].isoformat(),
             'is_online': True
-        } for status in online_users]
+        } for user in presence.online_users(request.user.id, within=2 * 60)]
 
         return JsonResponse({
             'success': True,
@@ -475,19 +397,8 @@ def set_typing_status_api(request):
             return JsonResponse({'error': 'Room ID required'}, status=400)
 
         room = get_object_or_404(ChatRoom, id=room_id, participants=request.user)
-        user_status, created = UserChatStatus.objects.get_or_create(
-            user=request.user,
-            defaults={'is_online': True}
-        )
-
-        if is_typing:
-            user_status.typing_in_room = room
-            user_status.typing_since = timezone.now()
-        else:
-            user_status.typing_in_room = None
-            user_status.typing_since = None
-
-        user_status.save()
+        presence.set_typing(room.id, request.user, is_typing)
+        realtime.push_typing(room.id, request.user, is_typing)
 
         return JsonResponse({'success': True})
 
@@ -497,33 +408,6 @@ def set_typing_status_api(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 
-def serialize_message_enhanced(message):
-    """Enhanced message serialization for real-time chat"""
-    return {
-        'id': str(message.id),
-        'sender_username': message.sender.username,
-        'sender_id': message.sender.id,
-        'message': message.message,
-        'timestamp': message.timestamp.isoformat(),
-        'message_type': message.message_type,
-        'status': message.status,
-        'is_read': message.is_read,
-        'file_url': message.file_attachment.url if message.file_attachment else None,
-        'edited_at': message.edited_at.isoformat() if message.edited_at else None,
-        'voice_duration': message.voice_duration,
-        'is_pinned': message.is_pinned,
-        'is_forwarded': message.is_forwarded,
-        'location_lat': str(message.location_lat) if message.location_lat else None,
-        'location_lng': str(message.location_lng) if message.location_lng else None,
-        'location_address': message.location_address,
-        'reply_to': {
-            'id': str(message.reply_to.id),
-            'message': message.reply_to.message,
-            'sender': message.reply_to.sender.username
-        } if message.reply_to else None
-    }
-
-
 @login_required
 @require_http_methods(["POST"])
 def add_reaction_api(request):
@@ -630,87 +514,70 @@ def bulk_message_view(request):
         message_text = request.POST.get('message', '').strip()
         if message_text:
             try:
-                # Log request info for debugging
                 logger.info(f"Bulk message request from user: {request.user.username} (id={request.user.id})")
-                logger.info(f"User is authenticated: {request.user.is_authenticated}")
-                logger.info(f"User is superuser: {request.user.is_superuser}")
+                broadcast = start_broadcast(request.user, message_text)
 
-                # Get all active users except the sender
-                all_users = list(User.objects.filter(is_active=True).exclude(id=request.user.id))
-                user_count = len(all_users)
-
-                logger.info(f"Found {user_count} active users to send message to")
-                logger.info(f"Users: {[u.username for u in all_users]}")
-
-                if user_count == 0:
+                if broadcast.total_recipients == 0:
                     messages.warning(request, 'No active users found to send the message to.')
-                    return redirect('chat:bulk_message')
-
-                # Create individual direct rooms and send messages to each user
-                sent_count = 0
-                failed_users = []
-                errors = []
-
-                for user in all_users:
-                    try:
-                        # Get or create direct room with each user
-                        room, created = ChatRoom.get_or_create_direct_room(request.user, user)
-                        logger.debug(f"Room for {user.username}: {'Created' if created else 'Exists'}")
-
-                        # Create message in the room
-                        # Use [BROADCAST] prefix instead of emoji to avoid MySQL utf8 encoding issues
-                        ChatMessage.objects.create(
-                            room=room,
-                            sender=request.user,
-                            message=f"[BROADCAST] {message_text}",
-                            message_type='text',
-                            receiver=user  # Legacy field
-                        )
-
-                        # Update room timestamp
-                        room.updated_at = timezone.now()
-                        room.save()
-
-                        sent_count += 1
-                        logger.debug(f"Message sent to {user.username}, count: {sent_count}")
-                    except Exception as e:
-                        error_msg = f"Error sending to {user.username}: {str(e)}"
-                        logger.error(f"{error_msg}\n{traceback.format_exc()}")
-                        failed_users.append(user.username)
-                        errors.append(error_msg)
-
-                logger.info(f"Bulk message complete: {sent_count}/{user_count} sent, {len(failed_users)} failed")
-
-                # Provide meaningful feedback based on results
-                if sent_count == user_count:
-                    messages.success(request, f'Bulk message sent to all {sent_count} users successfully.')
-                elif sent_count > 0:
-                    failed_count = user_count - sent_count
+                elif not broadcast.is_finished:
+                    messages.info(
+                        request,
+                        f'Sending bulk message to {broadcast.total_recipients} users. Progress is shown below.'
+                    )
+                    return redirect(f"{reverse('chat:bulk_message')}?broadcast={broadcast.pk}")
+                elif broadcast.sent_count == broadcast.total_recipients:
+                    messages.success(request, f'Bulk message sent to all {broadcast.sent_count} users successfully.')
+                elif broadcast.sent_count > 0:
                     messages.warning(
                         request,
-                        f'Bulk message sent to {sent_count} users but failed for {failed_count} users: {", ".join(failed_users[:5])}{"..." if len(failed_users) > 5 else ""}'
+                        f'Bulk message sent to {broadcast.sent_count} users but failed for {broadcast.failed_count} users.'
                     )
-                    logger.warning(f'Bulk message partially successful. Sent to {sent_count}/{user_count} users. Failed for: {failed_users}')
                 else:
-                    error_details = "; ".join(errors[:3]) if errors else "Unknown error - check server logs"
                     messages.error(
                         request,
-                        f'Failed to send bulk message to any of the {user_count} users. Errors: {error_details}'
+                        f'Failed to send bulk message to any of the {broadcast.total_recipients} users. '
+                        f'Errors: {broadcast.error or "Unknown error - check server logs"}'
                     )
-                    logger.error(f'Bulk message completely failed. All {user_count} failed. Errors: {errors}')
 
             except Exception as e:
-                logger.error(f"Bulk message outer loop failed: {e}\n{traceback.format_exc()}")
+                logger.error(f"Bulk message failed: {e}\n{traceback.format_exc()}")
                 messages.error(request, f'Error processing bulk message: {str(e)}')
 
             return redirect('chat:bulk_message')
 
+    broadcast = None
+    broadcast_id = request.GET.get('broadcast')
+    if broadcast_id and broadcast_id.isdigit():
+        broadcast = Broadcast.objects.filter(pk=broadcast_id, sender=request.user).first()
+
     # Get all active users for display
     all_users = User.objects.filter(is_active=True).exclude(id=request.user.id)
 
     return render(request, 'chat/bulk_message.html', {
         'all_users': all_users,
-        'user_count': all_users.count()
+        'user_count': all_users.count(),
+        'broadcast': broadcast,
+    })
+
+
+@login_required
+@require_http_methods(["GET"])
+def broadcast_status(request, broadcast_id):
+    """Progress of a broadcast started from bulk_message_view"""
+    broadcast = get_object_or_404(Broadcast, pk=broadcast_id, sender=request.user)
+    if not broadcast.is_finished and is_stale(broadcast):
+        # The worker delivering it died (timeout, recycle, deploy): carry on here
+        resume_broadcast(broadcast.pk, background=True)
+        broadcast.refresh_from_db()
+    return JsonResponse({
+        'id': broadcast.pk,
+        'status': broadcast.status,
+        'total': broadcast.total_recipients,
+        'sent': broadcast.sent_count,
+        'failed': broadcast.failed_count,
+        'progress': broadcast.progress,
+        'finished': broadcast.is_finished,
+        'error': broadcast.error,
     })
 
 
@@ -13,6 +13,7 @@ class Customer(models.Model):
     name = models.CharField(max_length=100)
     phone = models.CharField(max_length=15)
     address = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f'{self.user.username if self.user else "No User"} {self.name} {self.phone} {self.address}'
@@ -54,6 +55,7 @@ class WholesaleCustomer(models.Model):
     name = models.CharField(max_length=100)
     phone = models.CharField(max_length=15)
     address = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f'{self.user.username if self.user else "No User"} {self.name} {self.phone} {self.address}'
@@ -4,24 +4,29 @@ import hashlib
 import time
 import json
 
+from .route_metadata import route_for
+
 
 class SmartCacheMiddleware:
     """
     Middleware to cache responses for frequently accessed API endpoints
     """
+
+    # URL names of the endpoints to cache with their TTL (in seconds),
+    # looked up through pharmapp.route_metadata
+    CACHE_TTLS = {
+        'api:health_check': 60,  # Cache health check for 1 minute
+        # Notification/unread counts are served from pharmapp.counters,
+        # which is kept current, so they are not cached here
+    }
     
     def __init__(self, get_response):
         self.get_response = get_response
-        # Endpoints to cache with their TTL (in seconds)
-        self.cache_config = {
-            '/api/health/': 60,  # Cache health check for 1 minute
-            '/store/notifications/count/': 30,  # Cache notifications for 30 seconds
-            '/chat/api/unread-count/': 15,  # Cache unread count for 15 seconds
-        }
     
     def __call__(self, request):
         # Only cache GET requests for specific endpoints
-        if request.method == 'GET' and request.path in self.cache_config:
+        ttl = route_for(request)['cache_ttl'] if request.method == 'GET' else None
+        if ttl:
             cache_key = self._get_cache_key(request)
             cached_response = cache.get(cache_key)
             
@@ -33,13 +38,12 @@ class SmartCacheMiddleware:
         
         # Cache the response if it meets criteria
         if (
-            request.method == 'GET' 
-            and request.path in self.cache_config 
+            ttl
             and response.status_code == 200
             and isinstance(response, JsonResponse)
         ):
             cache_key = self._get_cache_key(request)
-            cache.set(cache_key, response, self.cache_config[request.path])
+            cache.set(cache_key, response, ttl)
         
         return response
     
@@ -0,0 +1,95 @@
+"""
+Background internet connectivity monitor.
+
+ConnectionDetectionMiddleware used to probe the internet inside the request
+path, adding up to the probe timeout to one request per refresh (and to
+every refresh while offline). The probe now runs on a daemon thread that
+publishes the result to the cache; requests only read it with
+``is_online()``.
+
+The probe target, interval and timeout come from the CONNECTIVITY_CHECK_*
+settings, so tests and offline installs can point it at a local endpoint
+(e.g. this app's own ``/api/health/``).
+"""
+import logging
+import threading
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+CONNECTION_STATUS_CACHE_KEY = 'connection_status'
+
+
+class ConnectivityMonitor:
+    """Periodically probes ``url`` and publishes True/False under CONNECTION_STATUS_CACHE_KEY"""
+
+    def __init__(self, url=None, interval=None, timeout=None):
+        self.url = url or getattr(settings, 'CONNECTIVITY_CHECK_URL', 'https://httpbin.org/status/200')
+        self.interval = interval or getattr(settings, 'CONNECTIVITY_CHECK_INTERVAL', 30)
+        self.timeout = timeout or getattr(settings, 'CONNECTIVITY_CHECK_TIMEOUT', 2.0)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def probe(self):
+        """Return True if the probe target answers with HTTP 200"""
+        try:
+            response = requests.get(self.url, timeout=self.timeout)
+            return response.status_code == 200
+        except requests.RequestException:
+            return False
+        except Exception as e:
+            logger.warning(f"Connectivity probe failed unexpectedly: {e}")
+            return False
+
+    def check_once(self):
+        """Probe now and publish the result; returns the new status"""
+        is_online = self.probe()
+        # Outlive a couple of missed intervals, then fall back to the default
+        cache.set(CONNECTION_STATUS_CACHE_KEY, is_online, self.interval * 3)
+        return is_online
+
+    def _run(self):
+        while not self._stop.is_set():
+            previous = cache.get(CONNECTION_STATUS_CACHE_KEY)
+            is_online = self.check_once()
+            if previous is not None and previous != is_online:
+                logger.info(f"Connectivity changed: {'online' if is_online else 'offline'}")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        """Start the probe thread (no-op if it is already running)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='connectivity-monitor', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+
+monitor = ConnectivityMonitor()
+
+
+def start_monitor():
+    """Start the process-wide monitor unless CONNECTIVITY_MONITOR_ENABLED is off"""
+    if getattr(settings, 'CONNECTIVITY_MONITOR_ENABLED', True):
+        monitor.start()
+
+
+def is_online():
+    """Last published status; assumed online until the first probe completes"""
+    status = cache.get(CONNECTION_STATUS_CACHE_KEY)
+    return True if status is None else status
@@ -0,0 +1,159 @@
+"""
+Per-user counters pushed to the UI (unread notifications, unread chat).
+
+The badges used to poll COUNT queries (cached for 15-30 s by
+SmartCacheMiddleware). Counts now live in the cache and are adjusted by the
+model signals that change them:
+
+    * ``adjust()`` increments/decrements a cached count when a row is
+      created, read or deleted;
+    * ``invalidate()`` drops it when a bulk ``.update()`` changed an unknown
+      number of rows; the next read recomputes it with one COUNT.
+
+Every change bumps a version number (per user, plus one shared by all
+users).
+
+By default the badges poll /api/counters/, which answers at once from the
+cache. With a process-local cache (LocMemCache) a count only follows the
+changes made in its own worker process, so it is kept for
+COUNTER_LOCAL_TTL seconds only; with a shared cache (Redis, Memcached)
+counts are kept for USER_COUNTER_TTL seconds, which bounds any drift (e.g.
+from rolled back transactions) without making them stale in normal use.
+
+Pushing the counts (api.views.counter_stream, server-sent events) holds a
+connection open per tab, which a sync WSGI worker cannot afford. It is
+opt-in: COUNTER_PUSH=True, an ASGI server and a shared cache; the stream
+waits on the version with ``wait_for_change`` (a cache read every
+COUNTER_POLL_INTERVAL seconds) and answers 204 otherwise, after which the
+badges poll.
+"""
+import asyncio
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+
+from utils.cache import is_shared_cache
+
+logger = logging.getLogger(__name__)
+
+USER_COUNTER_TTL = getattr(settings, 'USER_COUNTER_TTL', 300)
+
+# Lifetime of a count when the cache is process-local (see above)
+COUNTER_LOCAL_TTL = getattr(settings, 'COUNTER_LOCAL_TTL', 10)
+
+# Seconds between cache checks while a pushed stream waits for a change
+COUNTER_POLL_INTERVAL = getattr(settings, 'COUNTER_POLL_INTERVAL', 1.0)
+
+ALL_USERS = 'all'
+
+_counters = {}
+
+
+def register_counter(name, compute, shared=False):
+    """
+    Register a counter.
+
+    Args:
+        name: Counter name
+        compute: ``compute(user_id)`` (or ``compute()`` for shared counters)
+            returning the exact count, used when the cached value is missing
+        shared: True for one count shared by all users (e.g. system-wide
+            notifications)
+    """
+    _counters[name] = (compute, shared)
+
+
+def _key(name, user_id):
+    return f'counter:{name}:{user_id}'
+
+
+def _version_key(user_id):
+    return f'counter_version:{user_id}'
+
+
+def _ttl():
+    return USER_COUNTER_TTL if is_shared_cache() else min(USER_COUNTER_TTL, COUNTER_LOCAL_TTL)
+
+
+def push_enabled(request=None):
+    """Whether counts may be pushed (COUNTER_PUSH, a shared cache, and ``request`` served by ASGI)"""
+    if not getattr(settings, 'COUNTER_PUSH', False) or not is_shared_cache():
+        return False
+    return request is None or isinstance(request, ASGIRequest)
+
+
+def _scope(name, user_ids):
+    _, shared = _counters[name]
+    return [ALL_USERS] if shared else [user_id for user_id in user_ids if user_id is not None]
+
+
+def get(name, user_id=None):
+    """Return the count for ``user_id`` (ignored for shared counters)"""
+    compute, shared = _counters[name]
+    scope = ALL_USERS if shared else user_id
+    key = _key(name, scope)
+    value = cache.get(key)
+    if value is None:
+        value = compute() if shared else compute(user_id)
+        cache.add(key, value, _ttl())
+    return value
+
+
+def adjust(name, delta, user_ids=()):
+    """Add ``delta`` to cached counts; counts that are not cached are left to be computed"""
+    scope = _scope(name, user_ids)
+    for user_id in scope:
+        key = _key(name, user_id)
+        try:
+            if cache.incr(key, delta) < 0:
+                cache.delete(key)
+        except ValueError:
+            pass
+    _bump(scope)
+
+
+def invalidate(name, user_ids=()):
+    """Drop cached counts so the next read recomputes them"""
+    scope = _scope(name, user_ids)
+    cache.delete_many([_key(name, user_id) for user_id in scope])
+    _bump(scope)
+
+
+def _bump(scope):
+    if not scope:
+        return
+    for user_id in scope:
+        try:
+            cache.incr(_version_key(user_id))
+        except ValueError:
+            cache.set(_version_key(user_id), 1, None)
+
+
+def version(user_id):
+    """Opaque version of every counter visible to ``user_id``"""
+    versions = cache.get_many([_version_key(ALL_USERS), _version_key(user_id)])
+    return f"{versions.get(_version_key(ALL_USERS), 0)}.{versions.get(_version_key(user_id), 0)}"
+
+
+async def wait_for_change(user_id, since, timeout):
+    """
+    Wait (without holding a thread) until the counters of ``user_id`` change
+    from version ``since``.
+
+    Returns:
+        str: The new version, or ``since`` if nothing changed within ``timeout``
+    """
+    deadline = time.monotonic() + timeout
+    read_version = sync_to_async(version)
+    current = await read_version(user_id)
+    while current == since:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        await asyncio.sleep(min(remaining, COUNTER_POLL_INTERVAL))
+        current = await read_version(user_id)
+    return current
@@ -1,9 +1,8 @@
 from django.db import connections
 from django.conf import settings
-import requests
 import threading
 from django.shortcuts import render
-from django.core.cache import cache
+from .connectivity import is_online, start_monitor
 
 class OfflineMiddleware:
     def __init__(self, get_response):
@@ -24,53 +23,29 @@ class OfflineMiddleware:
         return response
 
 class ConnectionDetectionMiddleware:
+    """
+    Mark each request as online/offline from the status published by the
+    background connectivity monitor (pharmapp.connectivity); never probes
+    the network itself.
+    """
     def __init__(self, get_response):
         self.get_response = get_response
-        self.last_check = 0
-        self.cached_status = True
+        start_monitor()
 
     def __call__(self, request):
-        import time
-        
-        # Cache connectivity status for 30 seconds to avoid excessive checks
-        current_time = time.time()
-        if current_time - self.last_check > 30:
-            is_online = self._check_connectivity()
-            self.cached_status = is_online
-            self.last_check = current_time
-            
-            # Cache status in Django cache as well
-            cache.set('connection_status', is_online, 30)
-        else:
-            # Use cached status
-            is_online = self.cached_status
+        online = is_online()
 
         # Store connection status in request (request-scoped, not thread-local)
-        request.is_online = is_online
-        request.current_database = 'default' if is_online else 'offline'
+        request.is_online = online
+        request.current_database = 'default' if online else 'offline'
 
         response = self.get_response(request)
 
         # Add connection status headers
-        response['X-Connection-Status'] = 'online' if is_online else 'offline'
+        response['X-Connection-Status'] = 'online' if online else 'offline'
 
         return response
 
-    def _check_connectivity(self):
-        """
-        Check internet connectivity with improved error handling and caching.
-        """
-        try:
-            # Use a very fast connectivity check
-            response = requests.get('https://httpbin.org/status/200', timeout=0.5)
-            return response.status_code == 200
-        except requests.RequestException:
-            # If external check fails, assume offline
-            return False
-        except Exception:
-            # For any other errors, assume offline
-            return False
-
 class SyncMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
@@ -0,0 +1,244 @@
+"""
+Routing metadata shared by the request middlewares.
+
+Each middleware used to work out on its own what kind of request it was
+looking at: RoleBasedAccessMiddleware called ``resolve()`` twice,
+ActivityMiddleware guessed the action type, target model and ID with
+substring loops over the path, and SubscriptionMiddleware and
+SmartCacheMiddleware scanned their own path prefix lists.
+
+The policies stay with their middlewares:
+
+    * RoleBasedAccessMiddleware.ROLE_REQUIRED_URLS (roles per url name);
+    * ActivityMiddleware.SKIP_PATHS / IMPORTANT_GET_PATHS and the action
+      keywords below;
+    * subscription.middleware.EXEMPT_PREFIXES;
+    * SmartCacheMiddleware.CACHE_TTLS (TTL per url name).
+
+This module turns them into one table built from the URLconf when
+RouteMetadataMiddleware is loaded, with one entry per route:
+
+    name, roles, audit_skip, audit_get, audit_action, target_model,
+    cache_ttl, subscription_exempt
+
+``route_for(request)`` resolves the request path once, attaches the entry
+(``request.route``) and the ResolverMatch (``request.route_match``), and
+every middleware reads from there.
+
+Entries are keyed by the full route pattern (ResolverMatch.route), not the
+url name alone: names are not unique (``store:index`` is served both at
+``/store/`` and at the subscription-exempt ``/store/index/``) and many admin
+routes have none. The metadata only depends on the static part of a route:
+a route whose static prefix cannot decide a prefix rule (its converters
+could still match an exempt prefix) keeps ``None`` there and the request
+path decides. Paths that do not resolve are described from the path itself.
+"""
+import logging
+import re
+import threading
+
+from django.urls import Resolver404, URLPattern, URLResolver, get_resolver
+
+logger = logging.getLogger(__name__)
+
+# Action type of a logged POST, by the first keyword found in the route
+AUDIT_ACTION_KEYWORDS = (
+    (('delete',), 'DELETE'),
+    (('create', 'add'), 'CREATE'),
+    (('edit', 'update'), 'UPDATE'),
+    (('login',), 'LOGIN'),
+    (('logout',), 'LOGOUT'),
+    (('transfer',), 'TRANSFER'),
+    (('payment', 'receipt'), 'PAYMENT'),
+    (('export',), 'EXPORT'),
+    (('import',), 'IMPORT'),
+)
+
+# Audit target model, by the first route segment naming one of these
+TARGET_MODEL_CANDIDATES = (
+    'user', 'customer', 'supplier', 'item', 'product',
+    'receipt', 'expense', 'procurement', 'stock',
+)
+
+# Path converters (<int:pk>) and named regex groups ((?P<path>.*))
+_PARAMETER = re.compile(r'<[^>]*>|\(\?P<[^>]+>[^)]*\)')
+
+# Where the static part of a regex route ends
+_REGEX_SPECIAL = re.compile(r'[(\[\\*+?{|$]')
+
+_lock = threading.Lock()
+_tables = {}
+
+
+def _policies():
+    from pharmapp.cache_middleware import SmartCacheMiddleware
+    from subscription.middleware import EXEMPT_PREFIXES
+    from userauth.middleware import ActivityMiddleware, RoleBasedAccessMiddleware
+
+    return {
+        'roles': RoleBasedAccessMiddleware.ROLE_REQUIRED_URLS,
+        'skip_paths': tuple(ActivityMiddleware.SKIP_PATHS),
+        'important_get_paths': tuple(ActivityMiddleware.IMPORTANT_GET_PATHS),
+        'exempt_prefixes': tuple(EXEMPT_PREFIXES),
+        'cache_ttls': SmartCacheMiddleware.CACHE_TTLS,
+    }
+
+
+def _prefix_rule(path, static_prefix, prefixes):
+    """
+    Whether paths of a route start with one of ``prefixes``: True/False, or
+    None when only the request path can tell (``static_prefix`` is shorter
+    than a prefix it could still grow into)
+    """
+    if any(path.startswith(prefix) for prefix in prefixes):
+        return True
+    if static_prefix != path and any(prefix.startswith(static_prefix) for prefix in prefixes):
+        return None
+    return False
+
+
+def describe(route, name=None, policies=None):
+    """Metadata of a route pattern (or of a literal path that did not resolve)"""
+    policies = policies or _policies()
+    path = '/' + route.removeprefix('^')
+    special = _REGEX_SPECIAL.search(path)
+    static_prefix = (path[:special.start()] if special else path).split('<', 1)[0]
+    text = _PARAMETER.sub('*', path).lower()
+
+    audit_action = 'OTHER'
+    for keywords, action_type in AUDIT_ACTION_KEYWORDS:
+        if any(keyword in text for keyword in keywords):
+            audit_action = action_type
+            break
+
+    target_model = None
+    parts = text.strip('/').split('/')
+    if len(parts) > 1:
+        target_model = next(
+            (candidate.capitalize() for part in parts for candidate in TARGET_MODEL_CANDIDATES if candidate in part),
+            None,
+        )
+
+    return {
+        'route': route,
+        'name': name,
+        'roles': policies['roles'].get(name) if name else None,
+        'audit_skip': _prefix_rule(path, static_prefix, policies['skip_paths']),
+        'audit_get': any(pattern in text for pattern in policies['important_get_paths']),
+        'audit_action': audit_action,
+        'target_model': target_model,
+        'cache_ttl': policies['cache_ttls'].get(name) if name else None,
+        'subscription_exempt': _prefix_rule(path, static_prefix, policies['exempt_prefixes']),
+    }
+
+
+def _join(route1, route2):
+    # Same as URLResolver._join_route, so keys match ResolverMatch.route
+    return route1 + route2.removeprefix('^') if route1 else route2
+
+
+def _walk(patterns, prefix='', namespace=None):
+    for pattern in patterns:
+        route = _join(prefix, str(pattern.pattern))
+        if isinstance(pattern, URLResolver):
+            inner = namespace
+            if pattern.namespace:
+                inner = f'{namespace}:{pattern.namespace}' if namespace else pattern.namespace
+            yield from _walk(pattern.url_patterns, route, inner)
+        elif isinstance(pattern, URLPattern):
+            name = pattern.name
+            if name and namespace:
+                name = f'{namespace}:{name}'
+            yield route, name
+
+
+def build_table(resolver=None):
+    """Describe every route of the URLconf; returns {route: metadata}"""
+    resolver = resolver or get_resolver()
+    policies = _policies()
+    table = {}
+    for route, name in _walk(resolver.url_patterns):
+        # Django resolves to the first matching pattern
+        table.setdefault(route, describe(route, name, policies))
+    return table
+
+
+def routes(urlconf=None):
+    """The route table of ``urlconf`` (built on first use)"""
+    resolver = get_resolver(urlconf)
+    table = _tables.get(resolver)
+    if table is None:
+        with _lock:
+            table = _tables.get(resolver)
+            if table is None:
+                table = build_table(resolver)
+                _tables[resolver] = table
+                logger.info(f"Route metadata built for {len(table)} routes")
+    return table
+
+
+def _per_request(entry, path):
+    """Decide the prefix rules the route pattern alone could not"""
+    undecided = [field for field in ('audit_skip', 'subscription_exempt') if entry[field] is None]
+    if not undecided:
+        return entry
+    policies = _policies()
+    prefixes = {'audit_skip': policies['skip_paths'], 'subscription_exempt': policies['exempt_prefixes']}
+    return dict(entry, **{field: any(path.startswith(p) for p in prefixes[field]) for field in undecided})
+
+
+def route_for(request):
+    """Resolve the request once; returns its route metadata (also ``request.route``)"""
+    entry = getattr(request, 'route', None)
+    if entry is not None:
+        return entry
+
+    urlconf = getattr(request, 'urlconf', None)
+    try:
+        match = get_resolver(urlconf).resolve(request.path_info)
+    except Resolver404:
+        match = None
+
+    if match is None:
+        entry = describe(request.path.lstrip('/'))
+    else:
+        table = routes(urlconf)
+        entry = table.get(match.route)
+        if entry is None:
+            entry = describe(match.route, match.view_name if match.url_name else None)
+            table[match.route] = entry
+    entry = _per_request(entry, request.path)
+
+    request.route = entry
+    request.route_match = match
+    return entry
+
+
+def target_id(request):
+    """First numeric value captured from the request path (audit target ID)"""
+    match = getattr(request, 'route_match', None)
+    if match is None:
+        values = request.path.strip('/').split('/')
+    else:
+        values = list(match.args) + list(match.kwargs.values())
+    return next((str(value) for value in values if str(value).isdigit()), None)
+
+
+class RouteMetadataMiddleware:
+    """
+    Builds the route table at startup and resolves each request once; the
+    middlewares below read ``request.route``. Place it before
+    SmartCacheMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        try:
+            routes()
+        except Exception as e:
+            # A broken URLconf fails the requests with the real error
+            logger.error(f"Could not build route metadata: {e}")
+
+    def __call__(self, request):
+        route_for(request)
+        return self.get_response(request)
@@ -50,7 +50,7 @@ INSTALLED_APPS = [
     'django_htmx',
     'crispy_forms',  # Legacy - still installed but unused (using simple HTML/CSS forms instead)
     'crispy_bootstrap5',  # Legacy - still installed but unused (using simple HTML/CSS forms instead)
-    # 'channels',  # WebSocket support (disabled - not currently used)
+    'channels',  # WebSocket chat (chat.consumers), see CHANNEL_LAYERS
     'store',
     'userauth',
     'customer',
@@ -71,6 +71,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'pharmapp.csrf_debug_middleware.CSRFDebugMiddleware',  # Debug CSRF issues
     'pharmapp.request_debug_middleware.RequestDebugMiddleware',  # Debug unexpected requests
+    'pharmapp.route_metadata.RouteMetadataMiddleware',  # Resolves the route once; the middlewares below read request.route
     'pharmapp.cache_middleware.SmartCacheMiddleware',  # Smart caching for API responses
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -84,6 +85,7 @@ MIDDLEWARE = [
     'pharmapp.middleware.OfflineMiddleware',
     'userauth.middleware.ActivityMiddleware',  # Add ActivityMiddleware to log user actions
     'userauth.middleware.RoleBasedAccessMiddleware',  # Add role-based access control
+    'userauth.session_activity.SessionActivityMiddleware',  # Coalesces session writes of the session middlewares below
     'userauth.middleware.AutoLogoutMiddleware',  # Add auto-logout functionality
     # Session security middleware
     'userauth.session_middleware.SessionValidationMiddleware',  # Session validation for security
@@ -144,17 +146,24 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'pharmapp.wsgi.application'
-# ASGI_APPLICATION = 'pharmapp.asgi.application'
-
-# Channel layers configuration for WebSocket support (temporarily disabled)
-# CHANNEL_LAYERS = {
-#     'default': {
-#         'BACKEND': 'channels_redis.core.RedisChannelLayer',
-#         'CONFIG': {
-#             "hosts": [('127.0.0.1', 6379)],
-#         },
-#     },
-# }
+ASGI_APPLICATION = 'pharmapp.asgi.application'
+
+# Channel layers configuration for WebSocket support.
+# The in-memory layer needs no Redis but only reaches consumers of the same
+# process: run the ASGI application as a single process (e.g.
+# `uvicorn pharmapp.asgi:application`) and set CHAT_WEBSOCKETS=True.
+# Multi-process deployments need a shared layer such as
+# channels_redis.core.RedisChannelLayer (CHANNEL_LAYER_BACKEND/CHANNEL_LAYER_HOST).
+CHANNEL_LAYER_BACKEND = config('CHANNEL_LAYER_BACKEND', default='channels.layers.InMemoryChannelLayer')
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': CHANNEL_LAYER_BACKEND,
+    },
+}
+if CHANNEL_LAYER_BACKEND.startswith('channels_redis'):
+    CHANNEL_LAYERS['default']['CONFIG'] = {
+        'hosts': [config('CHANNEL_LAYER_HOST', default='redis://127.0.0.1:6379')],
+    }
 
 
 # Database
@@ -177,6 +186,7 @@ WSGI_APPLICATION = 'pharmapp.wsgi.application'
 #     }
 # }
 
+SESSION_CACHE_BACKEND = config('SESSION_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
@@ -186,7 +196,15 @@ CACHES = {
             'MAX_ENTRIES': 5000,  # Increased from 2000 for better caching
             'CULL_FREQUENCY': 4,  # Changed from 3 to reduce eviction frequency (removes 1/4 when full)
         }
-    }
+    },
+    # Session reads (userauth.session_backend), only used when shared by all
+    # workers, e.g. SESSION_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+    # and SESSION_CACHE_LOCATION=redis://127.0.0.1:6379/1. With the process-local
+    # default, sessions are read from and written to the database directly
+    'sessions': {
+        'BACKEND': SESSION_CACHE_BACKEND,
+        'LOCATION': config('SESSION_CACHE_LOCATION', default='sessions'),
+    },
 }
 
 # Database routing settings
@@ -332,11 +350,19 @@ MESSAGE_TAGS = {
 
 # Session Security Settings
 SESSION_COOKIE_AGE = 5200  # 40 minutes in seconds
-SESSION_SAVE_EVERY_REQUEST = True  # Reset the session expiration time on each request
+# Sessions are written when their data changes; userauth.session_activity keeps
+# per-request activity in the cache and rewrites the session (sliding its
+# expiry) at most every SESSION_ACTIVITY_SAVE_INTERVAL seconds otherwise
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_ACTIVITY_SAVE_INTERVAL = config('SESSION_ACTIVITY_SAVE_INTERVAL', default=60, cast=int)
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True  # Session expires when browser closes
 SESSION_COOKIE_HTTPONLY = True  # Prevent JavaScript access to session cookies
 SESSION_COOKIE_SAMESITE = 'Lax'  # CSRF protection
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'  # Use database sessions for better user isolation
+# Cache-first sessions with database write-behind when SESSION_CACHE_BACKEND is
+# shared (database sessions otherwise); expired rows are deleted in chunks by a
+# background worker (see the Session store section below)
+SESSION_ENGINE = 'userauth.session_backend'
+SESSION_CACHE_ALIAS = 'sessions'
 # Note: SESSION_COOKIE_SECURE is set above based on DEBUG flag (True in production, False in development)
 
 # Auto logout settings
@@ -384,3 +410,73 @@ SUBSCRIPTION_GRACE_PERIOD_DAYS = config('SUBSCRIPTION_GRACE_PERIOD_DAYS', defaul
 SUBSCRIPTION_RENEWAL_WARNING_DAYS = config('SUBSCRIPTION_RENEWAL_WARNING_DAYS', default=30, cast=int)
 # Optional: restrict superuser bypass to a specific mobile. If unset, all superusers bypass.
 SUBSCRIPTION_BYPASS_MOBILE = config('SUBSCRIPTION_BYPASS_MOBILE', default=None)
+# SubscriptionMiddleware keeps its verdict in-process until the next status
+# boundary or a subscription/payment save; other workers re-read it after this
+SUBSCRIPTION_VERDICT_MAX_AGE = config('SUBSCRIPTION_VERDICT_MAX_AGE', default=300, cast=int)
+
+# ── Connectivity monitor (pharmapp.connectivity) ──────────────────────────────
+# Probed from a background thread; requests only read the published status.
+CONNECTIVITY_CHECK_URL = config('CONNECTIVITY_CHECK_URL', default='https://httpbin.org/status/200')
+CONNECTIVITY_CHECK_INTERVAL = config('CONNECTIVITY_CHECK_INTERVAL', default=30, cast=int)
+CONNECTIVITY_CHECK_TIMEOUT = config('CONNECTIVITY_CHECK_TIMEOUT', default=2.0, cast=float)
+CONNECTIVITY_MONITOR_ENABLED = config('CONNECTIVITY_MONITOR_ENABLED', default=True, cast=bool)
+
+# ── Badge counters (pharmapp.counters) ────────────────────────────────────────
+# Unread notification/chat counts, polled from /api/counters/. Pushing them
+# over /api/counters/stream/ needs an ASGI server and a shared default cache
+# (one open connection per tab would tie up a sync WSGI worker).
+USER_COUNTER_TTL = config('USER_COUNTER_TTL', default=300, cast=int)
+COUNTER_LOCAL_TTL = config('COUNTER_LOCAL_TTL', default=10, cast=int)
+COUNTER_PUSH = config('COUNTER_PUSH', default=False, cast=bool)
+COUNTER_POLL_INTERVAL = config('COUNTER_POLL_INTERVAL', default=1.0, cast=float)
+COUNTER_STREAM_SECONDS = config('COUNTER_STREAM_SECONDS', default=55, cast=int)
+
+# ── Keyset pagination (utils.pagination) ──────────────────────────────────────
+# Seconds an estimated page total (a COUNT) is reused for the same filters
+KEYSET_COUNT_CACHE_SECONDS = config('KEYSET_COUNT_CACHE_SECONDS', default=300, cast=int)
+
+# ── Chat broadcasts (chat.broadcast) ──────────────────────────────────────────
+# Larger broadcasts are delivered on a background thread, in batches
+BROADCAST_BATCH_SIZE = config('BROADCAST_BATCH_SIZE', default=200, cast=int)
+BROADCAST_INLINE_RECIPIENTS = config('BROADCAST_INLINE_RECIPIENTS', default=25, cast=int)
+# Seconds without progress before a running broadcast is resumed (manage.py resume_broadcasts)
+BROADCAST_STALE_SECONDS = config('BROADCAST_STALE_SECONDS', default=300, cast=int)
+
+# ── Chat push (chat.realtime) ─────────────────────────────────────────────────
+# Push messages and typing indicators over WebSockets instead of polling;
+# requires the ASGI deployment described at CHANNEL_LAYERS
+CHAT_WEBSOCKETS = config('CHAT_WEBSOCKETS', default=False, cast=bool)
+
+# ── Chat presence (chat.presence) ─────────────────────────────────────────────
+# Online status and typing indicators live in the cache when it is shared by
+# all workers (Redis, Memcached); UserChatStatus only records "last seen", at
+# most once per save interval
+CHAT_PRESENCE_TIMEOUT = config('CHAT_PRESENCE_TIMEOUT', default=300, cast=int)
+CHAT_PRESENCE_SAVE_INTERVAL = config('CHAT_PRESENCE_SAVE_INTERVAL', default=300, cast=int)
+CHAT_TYPING_TIMEOUT = config('CHAT_TYPING_TIMEOUT', default=10, cast=int)
+# With a process-local cache (LocMem) presence and typing are kept in
+# UserChatStatus instead; heartbeats write "last seen" at most this often
+CHAT_PRESENCE_DB_SAVE_INTERVAL = config('CHAT_PRESENCE_DB_SAVE_INTERVAL', default=30, cast=int)
+
+# ── Activity log writer (userauth.activity_writer) ────────────────────────────
+# ActivityMiddleware entries are queued and bulk-inserted by a background
+# thread; past ACTIVITY_LOG_MAX_QUEUE pending entries they are written inline
+ACTIVITY_LOG_ASYNC = config('ACTIVITY_LOG_ASYNC', default=True, cast=bool)
+ACTIVITY_LOG_BATCH_SIZE = config('ACTIVITY_LOG_BATCH_SIZE', default=100, cast=int)
+ACTIVITY_LOG_FLUSH_INTERVAL = config('ACTIVITY_LOG_FLUSH_INTERVAL', default=2.0, cast=float)
+ACTIVITY_LOG_MAX_QUEUE = config('ACTIVITY_LOG_MAX_QUEUE', default=10000, cast=int)
+
+# ── Effective permissions (userauth.effective_permissions) ────────────────────
+# Each user's role + individual permissions are resolved once per request and,
+# with a shared cache (Redis, Memcached), cached under a version bumped whenever
+# their UserPermissions or Profile change
+PERMISSION_CACHE_SECONDS = config('PERMISSION_CACHE_SECONDS', default=3600, cast=int)
+
+# ── Session store (userauth.session_backend) ──────────────────────────────────
+# With a shared session cache, saves reach the database from a background
+# worker within the delay (creates and deletes immediately); expired sessions
+# are swept every cleanup interval
+SESSION_WRITE_BEHIND = config('SESSION_WRITE_BEHIND', default=True, cast=bool)
+SESSION_WRITE_BEHIND_DELAY = config('SESSION_WRITE_BEHIND_DELAY', default=1.0, cast=float)
+SESSION_CLEANUP_INTERVAL = config('SESSION_CLEANUP_INTERVAL', default=3600, cast=int)
+SESSION_CLEANUP_BATCH_SIZE = config('SESSION_CLEANUP_BATCH_SIZE', default=1000, cast=int)
@@ -1,6 +1,8 @@
 /**
- * Real-time Chat Implementation using Enhanced AJAX Polling
- * Provides near real-time messaging and online status functionality
+ * Real-time Chat Implementation
+ * Messages and typing indicators are pushed over a WebSocket when the server
+ * enables it (data-websocket on #room-id); otherwise, and while the socket is
+ * reconnecting, they are fetched by AJAX polling.
  */
 
 class RealtimeChat {
@@ -15,6 +17,12 @@ class RealtimeChat {
         this.onlineCheckFrequency = 10000; // Check online status every 10 seconds
         this.typingTimeout = 3000; // Stop typing indicator after 3 seconds
         this.messageSound = null;
+        this.useWebSocket = false;
+        this.socket = null;
+        this.reconnectTimer = null;
+        this.reconnectDelay = 1000; // Doubled after each failed attempt
+        this.maxReconnectDelay = 30000;
+        this.typingUsers = {};
         
         this.init();
     }
@@ -29,6 +37,8 @@ class RealtimeChat {
         const roomIdElement = document.getElementById('room-id');
         if (roomIdElement) {
             this.currentRoomId = roomIdElement.value;
+            this.useWebSocket = roomIdElement.dataset.websocket === '1' && 'WebSocket' in window;
+            this.connectSocket();
             this.startMessagePolling();
         }
     }
@@ -52,12 +62,77 @@ class RealtimeChat {
         // Initial load
         this.fetchNewMessages();
         
+        // New messages are pushed while the socket is connected
+        if (this.isSocketOpen()) return;
+        
         // Start polling
         this.pollInterval = setInterval(() => {
             this.fetchNewMessages();
         }, this.pollFrequency);
     }
 
+    isSocketOpen() {
+        return this.socket !== null && this.socket.readyState === WebSocket.OPEN;
+    }
+
+    connectSocket() {
+        if (!this.useWebSocket || !this.currentRoomId || this.socket) return;
+        
+        const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        const socket = new WebSocket(`${scheme}://${window.location.host}/ws/chat/room/${this.currentRoomId}/`);
+        this.socket = socket;
+        
+        socket.onopen = () => {
+            this.reconnectDelay = 1000;
+            // Catch up on anything sent while disconnected, then stop polling
+            this.startMessagePolling();
+        };
+        
+        socket.onmessage = (event) => {
+            let data;
+            try {
+                data = JSON.parse(event.data);
+            } catch (e) {
+                return;
+            }
+            if (data.type === 'chat_message') {
+                this.receiveMessages([data.message]);
+            } else if (data.type === 'typing_status') {
+                if (data.is_typing) {
+                    this.typingUsers[data.user_id] = {id: data.user_id, username: data.username};
+                } else {
+                    delete this.typingUsers[data.user_id];
+                }
+                this.updateTypingIndicators(Object.values(this.typingUsers));
+            }
+        };
+        
+        socket.onclose = () => {
+            if (this.socket !== socket) return; // Closed on purpose
+            this.socket = null;
+            this.typingUsers = {};
+            this.startMessagePolling();
+            this.reconnectTimer = setTimeout(() => {
+                this.reconnectTimer = null;
+                this.connectSocket();
+            }, this.reconnectDelay);
+            this.reconnectDelay = Math.min(this.reconnectDelay * 2, this.maxReconnectDelay);
+        };
+    }
+
+    disconnectSocket() {
+        if (this.reconnectTimer) {
+            clearTimeout(this.reconnectTimer);
+            this.reconnectTimer = null;
+        }
+        if (this.socket) {
+            const socket = this.socket;
+            this.socket = null;
+            socket.close();
+        }
+        this.typingUsers = {};
+    }
+
     stopMessagePolling() {
         if (this.pollInterval) {
             clearInterval(this.pollInterval);
@@ -97,22 +172,11 @@ class RealtimeChat {
         .then(response => response.json())
         .then(data => {
             if (data.success && data.messages && data.messages.length > 0) {
-                data.messages.forEach(message => {
-                    this.displayMessage(message);
-                    this.lastMessageId = message.id;
-                });
-                
-                // Play notification sound for new messages
-                if (data.messages.some(msg => msg.sender_id !== parseInt(document.body.dataset.userId))) {
-                    this.playNotificationSound();
-                }
-                
-                // Scroll to bottom
-                this.scrollToBottom();
+                this.receiveMessages(data.messages);
             }
             
             // Update typing indicators
-            if (data.typing_users) {
+            if (data.typing_users && !this.isSocketOpen()) {
                 this.updateTypingIndicators(data.typing_users);
             }
         })
@@ -121,6 +185,21 @@ class RealtimeChat {
         });
     }
 
+    receiveMessages(messages) {
+        messages.forEach(message => {
+            this.displayMessage(message);
+            this.lastMessageId = message.id;
+        });
+        
+        // Play notification sound for new messages
+        if (messages.some(msg => msg.sender_id !== parseInt(document.body.dataset.userId))) {
+            this.playNotificationSound();
+        }
+        
+        // Scroll to bottom
+        this.scrollToBottom();
+    }
+
     fetchOnlineUsers() {
         fetch('/chat/api/online-users/', {
             method: 'GET',
@@ -157,11 +236,13 @@ class RealtimeChat {
         .then(response => response.json())
         .then(data => {
             if (data.success) {
-                // Message will appear via polling
+                // Message will appear via the socket or polling
                 this.setTypingStatus(false);
                 
                 // Immediately fetch new messages to show sent message
-                setTimeout(() => this.fetchNewMessages(), 100);
+                if (!this.isSocketOpen()) {
+                    setTimeout(() => this.fetchNewMessages(), 100);
+                }
             } else {
                 console.error('Error sending message:', data.error);
                 alert('Failed to send message. Please try again.');
@@ -176,6 +257,11 @@ class RealtimeChat {
     setTypingStatus(isTyping) {
         if (!this.currentRoomId) return;
         
+        if (this.isSocketOpen()) {
+            this.socket.send(JSON.stringify({type: 'typing', is_typing: isTyping}));
+            return;
+        }
+        
         fetch('/chat/api/set-typing/', {
             method: 'POST',
             headers: {
@@ -419,11 +505,15 @@ class RealtimeChat {
     }
 
     switchRoom(roomId) {
+        if (roomId === this.currentRoomId && (this.isSocketOpen() || this.pollInterval)) return;
+        
+        this.disconnectSocket();
         this.stopMessagePolling();
         this.currentRoomId = roomId;
         this.lastMessageId = null;
         
         if (roomId) {
+            this.connectSocket();
             this.startMessagePolling();
         }
     }
@@ -452,6 +542,7 @@ class RealtimeChat {
     }
 
     destroy() {
+        this.disconnectSocket();
         this.stopMessagePolling();
         if (this.onlineStatusInterval) {
             clearInterval(this.onlineStatusInterval);
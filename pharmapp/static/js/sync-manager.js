@@ -53,44 +53,40 @@ class SyncManager {
             console.log('[SyncManager] Downloading initial data...');
             this.updateSyncStatus('downloading', 'Downloading data...');
 
-            const response = await fetch(this.endpoints.initialData, {
-                method: 'GET',
-                headers: { 'Content-Type': 'application/json' }
-            });
-
-            if (!response.ok) throw new Error('Failed to fetch initial data');
-
-            const data = await response.json();
-
-            // Store inventory items
-            if (data.inventory && data.inventory.length > 0) {
-                await window.dbManager.bulkPut(window.dbManager.stores.items, data.inventory);
-                console.log(`[SyncManager] Stored ${data.inventory.length} retail items`);
-            }
+            // Page through the change feed, starting from the last sync token
+            let token = await window.dbManager.getSyncMetadata('syncToken');
+            let firstPage = true;
+            let data;
+            do {
+                const url = token
+                    ? `${this.endpoints.initialData}?since=${encodeURIComponent(token)}`
+                    : this.endpoints.initialData;
+                const response = await fetch(url, {
+                    method: 'GET',
+                    headers: { 'Content-Type': 'application/json' }
+                });
+
+                if (response.status === 400 && token) {
+                    // Unusable sync token; the next download starts with a full snapshot
+                    await window.dbManager.updateSyncMetadata('syncToken', null);
+                }
+                if (!response.ok) throw new Error('Failed to fetch initial data');
 
-            // Store wholesale items
-            if (data.wholesale && data.wholesale.length > 0) {
-                await window.dbManager.bulkPut(window.dbManager.stores.wholesaleItems, data.wholesale);
-                console.log(`[SyncManager] Stored ${data.wholesale.length} wholesale items`);
-            }
+                data = await response.json();
 
-            // Store customers
-            if (data.customers && data.customers.length > 0) {
-                await window.dbManager.bulkPut(window.dbManager.stores.customers, data.customers);
-                console.log(`[SyncManager] Stored ${data.customers.length} customers`);
-            }
+                if (firstPage && data.full && token) {
+                    // Our token was too old for a delta; replace the whole cache
+                    for (const storeName of Object.values(this.collectionStores())) {
+                        await window.dbManager.clear(storeName);
+                    }
+                }
 
-            // Store wholesale customers
-            if (data.wholesale_customers && data.wholesale_customers.length > 0) {
-                await window.dbManager.bulkPut(window.dbManager.stores.wholesaleCustomers, data.wholesale_customers);
-                console.log(`[SyncManager] Stored ${data.wholesale_customers.length} wholesale customers`);
-            }
+                await this.storeInitialDataPage(data);
+                token = data.sync_token;
+                firstPage = false;
+            } while (data.has_more);
 
-            // Store suppliers
-            if (data.suppliers && data.suppliers.length > 0) {
-                await window.dbManager.bulkPut(window.dbManager.stores.suppliers, data.suppliers);
-                console.log(`[SyncManager] Stored ${data.suppliers.length} suppliers`);
-            }
+            await window.dbManager.updateSyncMetadata('syncToken', token);
 
             // Update last sync timestamp
             await window.dbManager.updateSyncMetadata('lastFullSync', new Date().toISOString());
@@ -106,6 +102,46 @@ class SyncManager {
         }
     }
 
+    /**
+     * IndexedDB store for each collection of the initial data feed
+     */
+    collectionStores() {
+        const stores = window.dbManager.stores;
+        return {
+            inventory: stores.items,
+            wholesale: stores.wholesaleItems,
+            customers: stores.customers,
+            wholesale_customers: stores.wholesaleCustomers,
+            suppliers: stores.suppliers
+        };
+    }
+
+    /**
+     * Store one page of the initial data feed and drop deleted rows
+     */
+    async storeInitialDataPage(data) {
+        const collectionStores = this.collectionStores();
+
+        for (const [collection, storeName] of Object.entries(collectionStores)) {
+            const rows = data[collection];
+            if (rows && rows.length > 0) {
+                await window.dbManager.bulkPut(storeName, rows);
+                console.log(`[SyncManager] Stored ${rows.length} ${collection}`);
+            }
+        }
+
+        for (const [collection, ids] of Object.entries(data.deleted || {})) {
+            const storeName = collectionStores[collection];
+            if (!storeName) continue;
+            for (const id of ids) {
+                await window.dbManager.delete(storeName, id);
+            }
+            if (ids.length > 0) {
+                console.log(`[SyncManager] Removed ${ids.length} deleted ${collection}`);
+            }
+        }
+    }
+
     /**
      * Sync pending actions to server
      */
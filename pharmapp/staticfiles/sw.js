@@ -314,14 +314,28 @@ async function syncFromServer() {
     console.log('[ServiceWorker] Syncing from server...');
 
     try {
-        const response = await fetch('/api/data/initial/');
-        if (!response.ok) throw new Error('Failed to fetch data');
+        const db = await openDatabase();
 
-        const data = await response.json();
+        // Page through the change feed, starting from the last sync token
+        let token = await getSyncMetadataValue(db, 'syncToken');
+        let data;
+        do {
+            const url = token ? `/api/data/initial/?since=${encodeURIComponent(token)}` : '/api/data/initial/';
+            const response = await fetch(url);
+            if (response.status === 400 && token) {
+                // Unusable sync token; the next sync starts with a full snapshot
+                await putSyncMetadataValue(db, 'syncToken', null);
+            }
+            if (!response.ok) throw new Error('Failed to fetch data');
 
-        // Store in IndexedDB
-        const db = await openDatabase();
-        await storeInitialData(db, data);
+            data = await response.json();
+
+            // Store in IndexedDB
+            await storeInitialData(db, data);
+            token = data.sync_token;
+        } while (data.has_more);
+
+        await putSyncMetadataValue(db, 'syncToken', token);
 
         console.log('[ServiceWorker] Server sync completed');
 
@@ -450,6 +464,26 @@ async function syncActionGroup(type, actions, db) {
     }
 }
 
+function getSyncMetadataValue(db, key) {
+    return new Promise((resolve, reject) => {
+        const transaction = db.transaction(['syncMetadata'], 'readonly');
+        const request = transaction.objectStore('syncMetadata').get(key);
+
+        request.onsuccess = () => resolve(request.result ? request.result.value : null);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+function putSyncMetadataValue(db, key, value) {
+    return new Promise((resolve, reject) => {
+        const transaction = db.transaction(['syncMetadata'], 'readwrite');
+        const request = transaction.objectStore('syncMetadata').put({ key, value, updated_at: new Date().toISOString() });
+
+        request.onsuccess = () => resolve(true);
+        request.onerror = () => reject(request.error);
+    });
+}
+
 async function storeInitialData(db, data) {
     const transaction = db.transaction(
         ['items', 'wholesaleItems', 'customers', 'wholesaleCustomers', 'suppliers'],
@@ -481,6 +515,22 @@ async function storeInitialData(db, data) {
         data.suppliers.forEach(supplier => supplierStore.put(supplier));
     }
 
+    // Rows deleted on the server since the last sync
+    const deletedStores = {
+        inventory: 'items',
+        wholesale: 'wholesaleItems',
+        customers: 'customers',
+        wholesale_customers: 'wholesaleCustomers',
+        suppliers: 'suppliers'
+    };
+    Object.entries(data.deleted || {}).forEach(([collection, ids]) => {
+        const storeName = deletedStores[collection];
+        if (storeName) {
+            const deletedStore = transaction.objectStore(storeName);
+            ids.forEach(id => deletedStore.delete(id));
+        }
+    });
+
     return new Promise((resolve, reject) => {
         transaction.oncomplete = resolve;
         transaction.onerror = () => reject(transaction.error);
@@ -0,0 +1,254 @@
+"""
+Set-based barcode resolution for batch scanning.
+
+Resolving a pallet scan one ``.get(barcode=...)`` at a time costs one query
+per code. ``resolve_barcodes`` resolves the whole batch with:
+
+    1. one ``barcode__in`` query for exact matches;
+    2. one batched fallback query for the codes left over, matching the GTIN
+       extracted by the GS1 parser against ``gtin`` (or a plain ``barcode``).
+
+Large batches are split only as far as the database's bound-parameter limit
+requires, so the query count does not grow with the number of misses.
+
+Single scans (api.views.barcode_lookup) go through ``barcode_cache``, an
+in-process map from scanned code to the item it resolved to (and the item
+values it matched on), including negative entries for codes that matched
+nothing.
+"""
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from .gs1_parser import parse_barcodes
+
+logger = logging.getLogger(__name__)
+
+# Largest batch accepted by barcode_batch_lookup
+MAX_BATCH_BARCODES = 5000
+
+# Item fields returned for each match
+LOOKUP_FIELDS = ('id', 'name', 'brand', 'price', 'stock', 'barcode', 'gtin')
+
+# Saving any of these fields can change what a scanned code resolves to
+BARCODE_FIELDS = frozenset({'barcode', 'barcode_type', 'gtin', 'batch_number', 'serial_number'})
+
+# Item values a scanned code can contain (gtin_core follows gtin)
+BARCODE_VALUE_FIELDS = ('barcode', 'gtin', 'gtin_core', 'batch_number', 'serial_number')
+
+BARCODE_CACHE_SIZE = getattr(settings, 'BARCODE_CACHE_SIZE', 10000)
+BARCODE_CACHE_TTL = getattr(settings, 'BARCODE_CACHE_TTL', 300)
+BARCODE_CACHE_MISS_TTL = getattr(settings, 'BARCODE_CACHE_MISS_TTL', 60)
+
+# Cached result for a code that matched no item
+NOT_FOUND = 'not_found'
+
+
+def normalize_barcode(barcode):
+    """Return the scanned code as stored: stripped text, or '' for empty values"""
+    if barcode is None:
+        return ''
+    return str(barcode).strip()
+
+
+def barcode_snapshot(item):
+    """The item's loaded barcode field values (deferred fields are left out)"""
+    return {
+        field: item.__dict__[field]
+        for field in BARCODE_FIELDS.union(BARCODE_VALUE_FIELDS)
+        if field in item.__dict__
+    }
+
+
+def _chunks(values, size):
+    values = list(values)
+    if not size:
+        yield values
+        return
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _in_chunk_size(params_per_value=1):
+    """Number of values per IN list that keeps a query under the parameter limit"""
+    max_params = connection.features.max_query_params
+    if not max_params:
+        return None
+    return max(1, (max_params - 10) // params_per_value)
+
+
+def _fetch(model, condition_for_chunk, values, params_per_value=1):
+    rows = []
+    for chunk in _chunks(values, _in_chunk_size(params_per_value)):
+        if chunk:
+            rows.extend(model.objects.filter(condition_for_chunk(chunk)).order_by('id').values(*LOOKUP_FIELDS))
+    return rows
+
+
+def resolve_barcodes(model, barcodes):
+    """
+    Resolve many scanned codes against one item model.
+
+    Args:
+        model: Item or WholesaleItem
+        barcodes: Iterable of scanned codes (duplicates allowed)
+
+    Returns:
+        dict: ``{'matches': {code: {'match_type', 'items'}}, 'duplicates': {code: count}}``
+        where ``items`` are value dicts ordered by id. A code with more than one
+        item is ambiguous; codes without matches are absent from ``matches``.
+    """
+    counts = Counter(code for code in (normalize_barcode(b) for b in barcodes) if code)
+    codes = list(counts)
+    matches = OrderedDict()
+
+    # Pass 1: exact barcode matches
+    for row in _fetch(model, lambda chunk: Q(barcode__in=chunk), codes):
+        match = matches.setdefault(row['barcode'], {'match_type': 'barcode', 'items': []})
+        match['items'].append(row)
+
+    # Pass 2: GTIN extracted from GS1/numeric codes that had no exact match
+    gtin_codes = {}
+    unmatched = [code for code in codes if code not in matches]
+    for code, parsed in zip(unmatched, parse_barcodes(unmatched)):
+        gtin = parsed.get('gtin')
+        if gtin and len(gtin) >= 8:
+            gtin_codes.setdefault(gtin, []).append(code)
+
+    if gtin_codes:
+        rows = _fetch(
+            model,
+            lambda chunk: Q(gtin__in=chunk) | Q(barcode__in=chunk),
+            gtin_codes,
+            params_per_value=2,
+        )
+        by_gtin = {}
+        for row in rows:
+            for key in {row['gtin'], row['barcode']}:
+                if key in gtin_codes:
+                    items = by_gtin.setdefault(key, [])
+                    if row not in items:
+                        items.append(row)
+        for gtin, items in by_gtin.items():
+            for code in gtin_codes[gtin]:
+                matches[code] = {'match_type': 'gtin', 'items': items}
+
+    return {
+        'matches': matches,
+        'duplicates': {code: count for code, count in counts.items() if count > 1},
+    }
+
+
+class BarcodeResolutionCache:
+    """
+    Per-process LRU cache of ``(item model, scanned code) -> resolution``.
+
+    A resolution is whatever the caller stores for a found code (the lookup
+    view stores the matched item id and match details); codes that matched
+    nothing are stored as ``NOT_FOUND``. When an item's barcode fields change
+    (see store.signals), ``invalidate_item`` drops the codes that resolved to
+    it and the codes containing its old or new values. That only happens in
+    the process that saved the item, so the lookup view also checks a cached
+    answer against the current row before serving it; entries expire after a
+    TTL either way.
+    """
+
+    def __init__(self, max_size=BARCODE_CACHE_SIZE, ttl=BARCODE_CACHE_TTL, miss_ttl=BARCODE_CACHE_MISS_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _key(model, code):
+        return model._meta.label_lower, normalize_barcode(code)
+
+    def get(self, model, code):
+        """Return the cached resolution, ``NOT_FOUND``, or None if the code is not cached"""
+        key = self._key(model, code)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if entry[1] == NOT_FOUND:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return entry[1]
+
+    def set(self, model, code, resolution):
+        ttl = self.miss_ttl if resolution == NOT_FOUND else self.ttl
+        key = self._key(model, code)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, resolution)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def set_not_found(self, model, code):
+        self.set(model, code, NOT_FOUND)
+
+    def invalidate(self, model=None):
+        """Drop every cached code for ``model`` (or for all models)"""
+        with self._lock:
+            if model is None:
+                self._entries.clear()
+            else:
+                label = model._meta.label_lower
+                for key in [key for key in self._entries if key[0] == label]:
+                    del self._entries[key]
+            self.invalidations += 1
+
+    def invalidate_item(self, model, item_id, values=()):
+        """
+        Drop the codes of ``model`` that resolved to ``item_id`` or contain
+        one of ``values`` (the item's old and new barcode values, so cached
+        misses a new value now matches are dropped too)
+        """
+        label = model._meta.label_lower
+        item_id = str(item_id)
+        values = {normalize_barcode(value) for value in values} - {''}
+        with self._lock:
+            stale = [
+                key for key, (_, resolution) in self._entries.items()
+                if key[0] == label and (
+                    (isinstance(resolution, dict) and str(resolution.get('item_id')) == item_id)
+                    or any(value in key[1] for value in values)
+                )
+            ]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += 1
+        return len(stale)
+
+    def stats(self):
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+barcode_cache = BarcodeResolutionCache()
@@ -0,0 +1,167 @@
+"""
+Batched checkout engine shared by retail and wholesale payment completion.
+
+Completing a payment request used to lock, validate, decrement and log every
+cart line with its own queries (4 round trips per line), taking row locks in
+cart order. This module does the same work with a fixed number of queries:
+
+    1. lock every affected item row in one query, ordered by primary key so
+       concurrent tills always acquire locks in the same order;
+    2. validate stock for all lines before writing anything;
+    3. decrement stock with one conditional ``UPDATE ... WHERE stock >= qty``
+       (threshold crossings are reported to store.stock_alerts);
+    4. ``bulk_create`` the sales items and dispensing logs.
+"""
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Case, DecimalField, F, Q, Value, When
+from django.utils import timezone
+
+from .models import DispensingLog, Item, SalesItem, WholesaleItem, WholesaleSalesItem
+from .stock_alerts import record_stock_changes
+
+
+class InsufficientStockError(Exception):
+    """Raised when a checkout line asks for more stock than is available"""
+
+    def __init__(self, item_name, available, required):
+        self.item_name = item_name
+        self.available = available
+        self.required = required
+        super().__init__(
+            f"Insufficient stock for {item_name}. Available: {available}, Required: {required}"
+        )
+
+
+def _checkout_models(wholesale):
+    """Return (item model, sales item model, payment item FK attname) for a channel"""
+    if wholesale:
+        return WholesaleItem, WholesaleSalesItem, 'wholesale_item_id'
+    return Item, SalesItem, 'retail_item_id'
+
+
+def lock_items(model, item_ids):
+    """
+    Lock the given item rows in one query and return them keyed by id.
+
+    Rows are locked in primary key order so that two tills checking out
+    overlapping baskets cannot deadlock. SQLite has no row-level locking,
+    so the plain query is used there (the write lock is taken on UPDATE).
+    """
+    queryset = model.objects.filter(pk__in=item_ids).order_by('pk')
+    if connection.vendor != 'sqlite':
+        queryset = queryset.select_for_update()
+    return {item.pk: item for item in queryset}
+
+
+def decrement_stock(model, quantities):
+    """
+    Decrement stock for several items with a single conditional UPDATE.
+
+    ``quantities`` maps item id -> quantity to deduct. Each row is only
+    updated if it still holds enough stock, so the number of updated rows
+    tells us whether every line was satisfied.
+
+    Returns:
+        int: Number of rows updated
+    """
+    if not quantities:
+        return 0
+
+    condition = Q()
+    deltas = []
+    for item_id, quantity in quantities.items():
+        condition |= Q(pk=item_id, stock__gte=quantity)
+        deltas.append(When(pk=item_id, then=Value(quantity)))
+
+    delta = Case(*deltas, default=Value(Decimal('0')),
+                 output_field=DecimalField(max_digits=10, decimal_places=2))
+    return model.objects.filter(condition).update(stock=F('stock') - delta, updated_at=timezone.now())
+
+
+def checkout_payment_items(sales, payment_items, dispenser, wholesale=False):
+    """
+    Record the sale of a payment request's items and deduct their stock.
+
+    Args:
+        sales: The Sales record the sales items belong to
+        payment_items: Iterable of PaymentRequestItem objects
+        dispenser: User recorded on the dispensing logs
+        wholesale: True to sell WholesaleItem stock, False for retail Item stock
+
+    Returns:
+        list: The created sales item objects
+
+    Raises:
+        InsufficientStockError: If any line exceeds the available stock. Nothing
+            has been written when this is raised; callers inside a transaction
+            should still roll back the sale they already created.
+    """
+    item_model, sales_item_model, item_attname = _checkout_models(wholesale)
+
+    lines = [line for line in payment_items if getattr(line, item_attname)]
+    if not lines:
+        return []
+
+    # The same item can appear on more than one line; validate the total
+    quantities = OrderedDict()
+    for line in lines:
+        item_id = getattr(line, item_attname)
+        quantities[item_id] = quantities.get(item_id, Decimal('0')) + line.quantity
+
+    locked_items = lock_items(item_model, sorted(quantities))
+
+    for item_id, quantity in quantities.items():
+        item = locked_items.get(item_id)
+        if item is None:
+            raise InsufficientStockError(f'item #{item_id}', Decimal('0'), quantity)
+        available = item.stock or Decimal('0')
+        if available < quantity:
+            raise InsufficientStockError(item.name, available, quantity)
+
+    # Deduct stock (ONLY place where stock is deducted)
+    updated = decrement_stock(item_model, quantities)
+    if updated != len(quantities):
+        # Stock changed between the read and the update (no row locks on SQLite)
+        current = item_model.objects.in_bulk(list(quantities))
+        for item_id, quantity in quantities.items():
+            item = current.get(item_id)
+            available = (item.stock if item else None) or Decimal('0')
+            if available < quantity:
+                raise InsufficientStockError(item.name if item else f'item #{item_id}', available, quantity)
+        raise InsufficientStockError('one or more items', Decimal('0'), sum(quantities.values()))
+
+    record_stock_changes(item_model, [
+        (locked_items[item_id], locked_items[item_id].stock, locked_items[item_id].stock - quantity)
+        for item_id, quantity in quantities.items()
+    ])
+
+    sales_items = sales_item_model.objects.bulk_create([
+        sales_item_model(
+            sales=sales,
+            item=locked_items[getattr(line, item_attname)],
+            price=line.unit_price,
+            quantity=line.quantity,
+            discount_amount=line.discount_amount,
+            brand=line.brand,
+        )
+        for line in lines
+    ])
+
+    DispensingLog.objects.bulk_create([
+        DispensingLog(
+            user=dispenser,
+            name=line.item_name,
+            brand=line.brand,
+            unit=line.unit,
+            quantity=line.quantity,
+            amount=line.subtotal,
+            discount_amount=line.discount_amount,
+            status='Dispensed',
+        )
+        for line in lines
+    ])
+
+    return sales_items
@@ -2,18 +2,37 @@
 GS1 Barcode Parser for Pharmaceutical Products
 Handles complex barcode formats with Application Identifiers (AIs)
 Example: 'NAVIDOXINE(01) 18906047654987(10) 250203 (17) 012028(21) NVDXN0225'
+
+parse_barcode()/parse_barcodes() use precompiled patterns, a table of AI
+handlers and an LRU memo on the raw string. GS1Parser is kept as the
+reference implementation (see the benchmark_gs1_parser command).
 """
 
 import re
 import logging
-from datetime import datetime
-from typing import Dict, Optional, List
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, List
 
 logger = logging.getLogger(__name__)
 
+# Number of trailing GTIN digits compared by partial GTIN matching
+GTIN_CORE_LENGTH = 8
+
+# Raw barcode strings remembered by parse_barcode()
+PARSE_CACHE_SIZE = 4096
+
+AI_PATTERN = re.compile(r'\((\d{2,3})\)')
+AI_VALUE_PATTERN = re.compile(r'\((\d{2,3})\)\s*([^\(]*?)(?=\s*\(\d{2,3}\)|$)')
+NON_DIGIT_PATTERN = re.compile(r'\D')
+NON_NUMERIC_PATTERN = re.compile(r'[^\d.]')
+
 class GS1Parser:
     """
     Parser for GS1 barcode format with Application Identifiers (AIs)
+    
+    Reference implementation; parse_barcode() gives the same results
+    without per-call parser state.
     """
     
     # GS1 Application Identifiers mapping
@@ -425,14 +444,212 @@ def parse_barcode(barcode: str) -> Dict:
     """
     Convenience function to parse a barcode
     
+    Results are memoized on the raw string; each call returns its own copy.
+    
     Args:
         barcode: Raw barcode string
         
     Returns:
-        Parsed barcode data dictionary
+        Parsed barcode data dictionary (same shape as GS1Parser.parse)
+    """
+    global _memo_day
+    today = date.today()
+    if today != _memo_day:
+        _parse_stripped.cache_clear()
+        _memo_day = today
+
+    result = _parse_stripped(barcode.strip() if barcode else "")
+    return dict(result, parsed_data=result['parsed_data'].copy())
+
+
+def parse_barcodes(barcodes: Iterable[str]) -> List[Dict]:
+    """
+    Parse many barcodes, e.g. a label import or a batch scan
+    
+    Args:
+        barcodes: Iterable of raw barcode strings (repeats are parsed once)
+        
+    Returns:
+        List of parsed barcode data dictionaries, in input order
+    """
+    return [parse_barcode(barcode) for barcode in barcodes]
+
+
+def _century(yy: int) -> int:
+    return 2000 + yy if yy < 50 else 1900 + yy
+
+
+def parse_gs1_date(date_str: str, today: Optional[date] = None) -> Optional[str]:
+    """
+    Parse a 6-digit GS1 date to ISO format
+    
+    Tries the same interpretations, in the same order, as
+    GS1Parser._parse_date: YYMMDD, DDMMYY, YYDDMM, then the pharmaceutical
+    combinations that give a real date within a plausible expiry range.
+    
+    Args:
+        date_str: Date value of a date AI
+        today: Reference date for the plausibility range (defaults to today)
+        
+    Returns:
+        ISO format date string or None if invalid
     """
-    parser = GS1Parser()
-    return parser.parse(barcode)
+    if not date_str or len(date_str) < 6:
+        return None
+
+    try:
+        p1 = int(date_str[:2])
+        p2 = int(date_str[2:4])
+        p3 = int(date_str[4:6])
+    except ValueError:
+        return None
+
+    # YYMMDD (standard GS1)
+    if 1 <= p2 <= 12 and 1 <= p3 <= 31:
+        return f"{_century(p1):04d}-{p2:02d}-{p3:02d}"
+
+    # DDMMYY, swapping month and year when the month cannot be one
+    mm, yy = p2, p3
+    if mm > 12 and yy <= 12:
+        mm, yy = yy, mm
+    if 1 <= mm <= 12 and 1 <= p1 <= 31:
+        return f"{_century(yy):04d}-{mm:02d}-{p1:02d}"
+
+    # YYDDMM
+    if 1 <= p3 <= 12 and 1 <= p2 <= 31:
+        return f"{_century(p1):04d}-{p3:02d}-{p2:02d}"
+
+    # Pharmaceutical conventions, as (yy, mm, dd)
+    combinations = [(p2, p3, p1), (p1, p2, p3), (p3, p2, p1), (p1, p3, p2), (p2, p1, p3)]
+    if p2 == 20:
+        combinations += [(2, p3, p1), (p3, 2, p1), (2, p1, p3)]
+
+    today = today or date.today()
+    earliest = today - timedelta(days=365)
+    latest = today + timedelta(days=3650)
+    for yy, mm, dd in combinations:
+        if 1 <= mm <= 12 and 1 <= dd <= 31:
+            try:
+                candidate = date(_century(yy), mm, dd)
+            except ValueError:
+                continue
+            if earliest <= candidate <= latest:
+                return f"{candidate.year:04d}-{mm:02d}-{dd:02d}"
+
+    return None
+
+
+def _set_date(parsed: Dict, key: str, value: str):
+    parsed_date = parse_gs1_date(value)
+    if parsed_date:
+        parsed[key] = parsed_date
+    else:
+        parsed[f'{key}_raw'] = value
+
+
+def _set_number(parsed: Dict, ai: str, value: str):
+    try:
+        parsed[f'ai_{ai}'] = float(NON_NUMERIC_PATTERN.sub('', value))
+    except ValueError:
+        parsed[f'ai_{ai}_raw'] = value
+
+
+def _set_gtin(parsed: Dict, value: str):
+    gtin = NON_DIGIT_PATTERN.sub('', value)
+    if len(gtin) >= 8:  # Minimum valid GTIN length
+        parsed['gtin'] = gtin
+
+
+# AI -> handler(parsed_data, ai, value); other AIs are stored as 'ai_<AI>'
+AI_HANDLERS = {
+    '01': lambda parsed, ai, value: _set_gtin(parsed, value),
+    '10': lambda parsed, ai, value: parsed.__setitem__('batch_number', value),
+    '11': lambda parsed, ai, value: _set_date(parsed, 'production_date', value),
+    '15': lambda parsed, ai, value: _set_date(parsed, 'best_before_date', value),
+    '17': lambda parsed, ai, value: _set_date(parsed, 'expiry_date', value),
+    '21': lambda parsed, ai, value: parsed.__setitem__('serial_number', value),
+    '37': _set_number,
+    '310': _set_number,
+    '320': _set_number,
+}
+
+
+def _confidence(original: str, is_gs1_format: bool, parsed: Dict) -> float:
+    if not original:
+        return 0.0
+    if is_gs1_format:
+        confidence = 0.7
+        if parsed.get('gtin'):
+            confidence += 0.15
+        if parsed.get('batch_number'):
+            confidence += 0.1
+        if parsed.get('serial_number'):
+            confidence += 0.05
+        return min(confidence, 1.0)
+    if parsed.get('gtin') and len(parsed['gtin']) >= 8:
+        return 0.5
+    return 0.3
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_stripped(original: str) -> Dict:
+    parsed = {}
+    product_name = None
+    is_gs1_format = False
+
+    first_ai = AI_PATTERN.search(original) if original else None
+    if first_ai:
+        is_gs1_format = True
+        product_part = original[:first_ai.start()].strip()
+        if product_part:
+            product_name = product_part
+
+        for ai, value in AI_VALUE_PATTERN.findall(original):
+            value = value.strip()
+            if not value:
+                continue
+            parsed[f'ai_{ai}_raw'] = value
+            handler = AI_HANDLERS.get(ai)
+            if handler:
+                handler(parsed, ai, value)
+            else:
+                parsed[f'ai_{ai}'] = value
+    elif original:
+        clean_barcode = NON_DIGIT_PATTERN.sub('', original)
+        if len(clean_barcode) >= 8:  # Minimum GTIN length
+            parsed['gtin'] = clean_barcode
+            parsed['simple_barcode'] = original
+
+    return {
+        'original_barcode': original,
+        'product_name': product_name,
+        'is_gs1_format': is_gs1_format,
+        'parsed_data': parsed,
+        'confidence': _confidence(original, is_gs1_format, parsed),
+        'gtin': parsed.get('gtin', ''),
+        'batch_number': parsed.get('batch_number', ''),
+        'serial_number': parsed.get('serial_number', ''),
+        'expiry_date': parsed.get('expiry_date', ''),
+    }
+
+
+# Date interpretation depends on today's date, so the memo is per day
+_memo_day = None
+
+
+def gtin_core(gtin: Optional[str]) -> Optional[str]:
+    """
+    Return the GTIN core (last 8 characters) used for partial GTIN matching
+    
+    Args:
+        gtin: Stored or scanned GTIN
+        
+    Returns:
+        The last GTIN_CORE_LENGTH characters, or None for shorter/empty values
+    """
+    if not gtin or len(gtin) < GTIN_CORE_LENGTH:
+        return None
+    return gtin[-GTIN_CORE_LENGTH:]
 
 
 def is_gs1_barcode(barcode: str) -> bool:
@@ -447,8 +664,7 @@ def is_gs1_barcode(barcode: str) -> bool:
     """
     if not barcode:
         return False
-    ai_pattern = r'\((\d{2,3})\)'
-    return bool(re.search(ai_pattern, barcode))
+    return AI_PATTERN.search(barcode) is not None
 
 
 def extract_gtin(barcode: str) -> Optional[str]:
@@ -470,7 +686,7 @@ def extract_gtin(barcode: str) -> Optional[str]:
         return parsed.get('gtin')
     
     # For simple barcodes, extract numbers
-    clean_barcode = re.sub(r'\D', '', barcode)
+    clean_barcode = NON_DIGIT_PATTERN.sub('', barcode)
     if len(clean_barcode) >= 8:
         return clean_barcode
     
@@ -0,0 +1,56 @@
+"""
+Management command to backfill the gtin_core column of retail and wholesale items
+Needed for rows whose gtin was written without Item.save() (raw imports, queryset updates)
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.gs1_parser import gtin_core
+from store.models import Item, WholesaleItem
+
+
+class Command(BaseCommand):
+    help = 'Recompute gtin_core (last 8 GTIN digits) for all items'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of items updated per query (default: 1000)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report how many items would change without saving'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = max(options['batch_size'], 1)
+        dry_run = options['dry_run']
+
+        for model in (Item, WholesaleItem):
+            changed = self.backfill(model, batch_size, dry_run)
+            verb = 'would be updated' if dry_run else 'updated'
+            self.stdout.write(self.style.SUCCESS(f'[OK] {model.__name__}: {changed} items {verb}'))
+
+    def backfill(self, model, batch_size, dry_run):
+        changed = 0
+        pending = []
+        rows = model.objects.values_list('id', 'gtin', 'gtin_core').order_by('id')
+        for item_id, gtin, current_core in rows.iterator(chunk_size=batch_size):
+            core = gtin_core(gtin)
+            if core == current_core:
+                continue
+            changed += 1
+            pending.append(model(id=item_id, gtin_core=core))
+            if len(pending) >= batch_size:
+                self.flush(model, pending, dry_run)
+                pending = []
+        self.flush(model, pending, dry_run)
+        return changed
+
+    def flush(self, model, pending, dry_run):
+        if pending and not dry_run:
+            with transaction.atomic():
+                model.objects.bulk_update(pending, ['gtin_core'])
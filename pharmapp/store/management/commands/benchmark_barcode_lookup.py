@@ -0,0 +1,59 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from api.views import barcode_batch_lookup
+from store.models import Item
+
+
+class Command(BaseCommand):
+    help = 'Benchmark barcode_batch_lookup on batches of increasing size (all changes are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='10,100,1000,3000',
+            help='Comma-separated numbers of scanned codes per request',
+        )
+        parser.add_argument(
+            '--miss-ratio',
+            type=float,
+            default=0.25,
+            help='Fraction of codes that match no item (default: 0.25)',
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        miss_ratio = min(max(options['miss_ratio'], 0.0), 1.0)
+        factory = RequestFactory()
+
+        self.stdout.write(f"{'codes':>6} {'queries':>8} {'ms':>9}")
+        with transaction.atomic():
+            max_size = max(sizes)
+            Item.objects.bulk_create([
+                Item(name=f'Barcode benchmark {i}', barcode=f'BENCH{i:08d}')
+                for i in range(max_size)
+            ], batch_size=500)
+
+            for size in sizes:
+                misses = int(size * miss_ratio)
+                codes = [f'BENCH{i:08d}' for i in range(size - misses)]
+                codes += [f'MISS{i:08d}' for i in range(misses)]
+                request = factory.post('/api/barcode/batch-lookup/', json.dumps({'barcodes': codes}),
+                                       content_type='application/json')
+
+                with CaptureQueriesContext(connection) as context:
+                    start = time.perf_counter()
+                    response = barcode_batch_lookup(request)
+                    b''.join(response.streaming_content)
+                    elapsed = time.perf_counter() - start
+
+                self.stdout.write(f'{size:>6} {len(context.captured_queries):>8} {elapsed * 1000:>9.2f}')
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS('Barcode lookup benchmark completed (database unchanged)'))
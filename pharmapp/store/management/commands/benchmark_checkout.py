@@ -0,0 +1,88 @@
+from decimal import Decimal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from store.checkout import checkout_payment_items
+from store.models import Item, PaymentRequest, PaymentRequestItem, Sales, WholesaleItem
+from userauth.models import User
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the batched checkout engine on 1/10/100-line baskets (all changes are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='1,10,100',
+            help='Comma-separated basket sizes to benchmark',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Number of checkouts per basket size',
+        )
+        parser.add_argument(
+            '--wholesale',
+            action='store_true',
+            help='Benchmark wholesale checkout instead of retail',
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        repeat = max(options['repeat'], 1)
+        wholesale = options['wholesale']
+
+        self.stdout.write(f"{'lines':>6} {'queries':>8} {'avg ms':>9}")
+        for size in sizes:
+            queries, elapsed = self.run_basket(size, repeat, wholesale)
+            self.stdout.write(f'{size:>6} {queries:>8} {elapsed * 1000 / repeat:>9.2f}')
+
+        self.stdout.write(self.style.SUCCESS('Checkout benchmark completed (database unchanged)'))
+
+    def run_basket(self, size, repeat, wholesale):
+        """Check out a basket of ``size`` lines ``repeat`` times inside a rolled back transaction"""
+        item_model = WholesaleItem if wholesale else Item
+        queries = 0
+        elapsed = 0.0
+
+        with transaction.atomic():
+            dispenser = User.objects.create_user(username='bench-checkout', mobile='bench-checkout', password=None)
+            items = item_model.objects.bulk_create([
+                item_model(name=f'Benchmark item {i}', cost=Decimal('10'), price=Decimal('12'),
+                           stock=Decimal(repeat * 10))
+                for i in range(size)
+            ])
+            payment_request = PaymentRequest.objects.create(
+                dispenser=dispenser,
+                payment_type='wholesale' if wholesale else 'retail',
+                total_amount=Decimal('12') * size,
+            )
+            lines = PaymentRequestItem.objects.bulk_create([
+                PaymentRequestItem(
+                    payment_request=payment_request,
+                    item_name=item.name,
+                    unit='Pcs',
+                    quantity=Decimal('1'),
+                    unit_price=item.price,
+                    subtotal=item.price,
+                    wholesale_item=item if wholesale else None,
+                    retail_item=None if wholesale else item,
+                )
+                for item in items
+            ])
+
+            for _ in range(repeat):
+                sales = Sales.objects.create(user=dispenser, total_amount=payment_request.total_amount)
+                with CaptureQueriesContext(connection) as context:
+                    start = time.perf_counter()
+                    checkout_payment_items(sales, lines, dispenser, wholesale=wholesale)
+                    elapsed += time.perf_counter() - start
+                queries = len(context.captured_queries)
+
+            transaction.set_rollback(True)
+
+        return queries, elapsed
@@ -0,0 +1,99 @@
+import logging
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.gs1_parser import GS1Parser, PARSE_CACHE_SIZE, _parse_stripped, parse_barcodes
+
+PRODUCT_NAMES = ['NAVIDOXINE', 'PARACETAMOL 500MG', 'AMOXIL 250', '']
+
+
+def sample_barcodes(count, distinct, seed=0):
+    """Realistic label scans: GS1 strings in the spacings seen on labels plus plain EAN-13 codes"""
+    rng = random.Random(seed)
+    labels = []
+    for i in range(distinct):
+        gtin = f'1890604{i:07d}'
+        batch = f'B{rng.randint(0, 99999):05d}'
+        expiry = f'{rng.randint(1, 28):02d}{rng.randint(1, 12):02d}{rng.randint(25, 32)}'
+        name = rng.choice(PRODUCT_NAMES)
+        layout = i % 4
+        if layout == 0:
+            labels.append(f'{name}(01) {gtin}(10) {batch} (17) {expiry}(21) SN{i:06d}')
+        elif layout == 1:
+            labels.append(f'(01){gtin}(17){expiry}(10){batch}')
+        elif layout == 2:
+            labels.append(f'{name} (01) {gtin} (11) {expiry} (310) 0.5{i % 10}')
+        else:
+            labels.append(f'590{i:010d}')
+    return [rng.choice(labels) for _ in range(count)]
+
+
+class Command(BaseCommand):
+    help = 'Compare parse_barcodes with the reference GS1Parser on a label corpus (read-only)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=20000,
+            help='Number of generated scans (default: 20000)'
+        )
+        parser.add_argument(
+            '--distinct',
+            type=int,
+            default=2000,
+            help='Number of distinct generated labels (default: 2000)'
+        )
+        parser.add_argument(
+            '--file',
+            type=str,
+            help='Use a label export instead, one barcode per line'
+        )
+
+    def handle(self, *args, **options):
+        if options['file']:
+            try:
+                with open(options['file'], encoding='utf-8') as handle:
+                    barcodes = [line.rstrip('\r\n') for line in handle if line.strip()]
+            except OSError as e:
+                raise CommandError(f'Cannot read {options["file"]}: {e}')
+        else:
+            barcodes = sample_barcodes(options['count'], max(options['distinct'], 1))
+
+        if not barcodes:
+            raise CommandError('No barcodes to parse')
+
+        # The reference parser logs every date it interprets
+        logging.disable(logging.INFO)
+        try:
+            start = time.perf_counter()
+            reference = [GS1Parser().parse(barcode) for barcode in barcodes]
+            reference_time = time.perf_counter() - start
+
+            _parse_stripped.cache_clear()
+            start = time.perf_counter()
+            cold = parse_barcodes(barcodes)
+            cold_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            parse_barcodes(barcodes)
+            warm_time = time.perf_counter() - start
+        finally:
+            logging.disable(logging.NOTSET)
+
+        mismatches = [barcode for barcode, old, new in zip(barcodes, reference, cold) if old != new]
+
+        self.stdout.write(f'{len(barcodes)} barcodes, {len(set(barcodes))} distinct, memo size {PARSE_CACHE_SIZE}')
+        self.stdout.write(f"{'parser':<22} {'ms':>9} {'us/code':>9}")
+        for label, elapsed in [('GS1Parser.parse', reference_time), ('parse_barcodes (cold)', cold_time),
+                               ('parse_barcodes (warm)', warm_time)]:
+            self.stdout.write(f'{label:<22} {elapsed * 1000:>9.2f} {elapsed * 1e6 / len(barcodes):>9.2f}')
+
+        if mismatches:
+            for barcode in mismatches[:10]:
+                self.stdout.write(self.style.ERROR(f'  [MISMATCH] {barcode!r}'))
+            raise CommandError(f'{len(mismatches)} barcodes parsed differently from GS1Parser')
+
+        self.stdout.write(self.style.SUCCESS('[OK] Results identical to GS1Parser'))
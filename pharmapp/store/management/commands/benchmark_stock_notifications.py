@@ -0,0 +1,63 @@
+from decimal import Decimal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from store.models import Item, StoreSettings, WholesaleItem, WholesaleSettings
+from store.notifications import NotificationService
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the stock notification check on large catalogues (all changes are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='1000,10000,50000',
+            help='Comma-separated numbers of SKUs (split evenly between retail and wholesale)',
+        )
+        parser.add_argument(
+            '--low-ratio',
+            type=float,
+            default=0.2,
+            help='Fraction of SKUs at or below the low stock threshold (default: 0.2)',
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        low_ratio = min(max(options['low_ratio'], 0.0), 1.0)
+
+        self.stdout.write(f"{'SKUs':>7} {'created':>8} {'queries':>8} {'ms':>9} {'rerun q':>8} {'rerun ms':>9}")
+        for size in sizes:
+            self.stdout.write(self.run_size(size, low_ratio))
+
+        self.stdout.write(self.style.SUCCESS('Stock notification benchmark completed (database unchanged)'))
+
+    def run_size(self, size, low_ratio):
+        with transaction.atomic():
+            threshold = StoreSettings.get_settings().low_stock_threshold
+            wholesale_threshold = WholesaleSettings.get_settings().low_stock_threshold
+            low_every = int(1 / low_ratio) if low_ratio else 0
+
+            for model, limit in ((Item, threshold), (WholesaleItem, wholesale_threshold)):
+                model.objects.bulk_create([
+                    model(name=f'Notification benchmark {i}', unit='Pcs',
+                          stock=Decimal(i % 2 and limit) if low_every and i % low_every == 0 else Decimal(limit + 100))
+                    for i in range(size // 2)
+                ], batch_size=1000)
+
+            results = []
+            for _ in range(2):  # The second run finds every item already notified
+                with CaptureQueriesContext(connection) as context:
+                    start = time.perf_counter()
+                    created = NotificationService.check_and_create_stock_notifications()
+                    elapsed = time.perf_counter() - start
+                results.append((created, len(context.captured_queries), elapsed))
+
+            transaction.set_rollback(True)
+
+        (created, queries, elapsed), (_, rerun_queries, rerun_elapsed) = results
+        return (f'{size:>7} {created:>8} {queries:>8} {elapsed * 1000:>9.2f} '
+                f'{rerun_queries:>8} {rerun_elapsed * 1000:>9.2f}')
@@ -0,0 +1,30 @@
+"""
+Management command to create low/out of stock notifications
+Run it from cron/Task Scheduler, or keep it running with --interval
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.notifications import check_stock_and_notify
+
+
+class Command(BaseCommand):
+    help = 'Create notifications for low and out of stock retail/wholesale items'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Keep running and re-check every N seconds (default: run once)'
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            created = check_stock_and_notify()
+            self.stdout.write(self.style.SUCCESS(f'[OK] Created {created} stock notifications'))
+            if interval <= 0:
+                break
+            time.sleep(interval)
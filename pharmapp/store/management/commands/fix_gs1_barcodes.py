@@ -5,7 +5,7 @@ Parses GS1 barcodes and extracts GTIN, batch number, and serial number into sepa
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from store.models import Item, WholesaleItem
-from store.gs1_parser import parse_barcode, is_gs1_barcode
+from store.gs1_parser import parse_barcodes, is_gs1_barcode
 import logging
 
 logger = logging.getLogger(__name__)
@@ -58,56 +58,55 @@ class Command(BaseCommand):
 
         self.stdout.write(f'Found {items_with_barcodes.count()} items with barcodes')
 
-        for item in items_with_barcodes:
-            if is_gs1_barcode(item.barcode):
-                # Parse the GS1 barcode
-                parsed = parse_barcode(item.barcode)
-
-                gtin = parsed.get('gtin', '')
-                batch_number = parsed.get('batch_number', '')
-                serial_number = parsed.get('serial_number', '')
-
-                # Check if we need to update
-                needs_update = False
-                updates = []
-
-                if gtin and not item.gtin:
-                    item.gtin = gtin
-                    needs_update = True
-                    updates.append(f'gtin={gtin}')
-
-                if batch_number and not item.batch_number:
-                    item.batch_number = batch_number
-                    needs_update = True
-                    updates.append(f'batch={batch_number}')
-
-                if serial_number and not item.serial_number:
-                    item.serial_number = serial_number
-                    needs_update = True
-                    updates.append(f'serial={serial_number}')
-
-                if needs_update and (not item.barcode_type or item.barcode_type == 'OTHER'):
-                    item.barcode_type = 'GS1'
-                    updates.append('type=GS1')
-
-                if needs_update:
-                    self.stdout.write(
-                        self.style.SUCCESS(
-                            f'  > {item.name} (ID: {item.id}): {", ".join(updates)}'
-                        )
+        gs1_items = [item for item in items_with_barcodes if is_gs1_barcode(item.barcode)]
+
+        # Parse all GS1 barcodes in one pass (repeated labels are parsed once)
+        for item, parsed in zip(gs1_items, parse_barcodes(item.barcode for item in gs1_items)):
+            gtin = parsed.get('gtin', '')
+            batch_number = parsed.get('batch_number', '')
+            serial_number = parsed.get('serial_number', '')
+
+            # Check if we need to update
+            needs_update = False
+            updates = []
+
+            if gtin and not item.gtin:
+                item.gtin = gtin
+                needs_update = True
+                updates.append(f'gtin={gtin}')
+
+            if batch_number and not item.batch_number:
+                item.batch_number = batch_number
+                needs_update = True
+                updates.append(f'batch={batch_number}')
+
+            if serial_number and not item.serial_number:
+                item.serial_number = serial_number
+                needs_update = True
+                updates.append(f'serial={serial_number}')
+
+            if needs_update and (not item.barcode_type or item.barcode_type == 'OTHER'):
+                item.barcode_type = 'GS1'
+                updates.append('type=GS1')
+
+            if needs_update:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f'  > {item.name} (ID: {item.id}): {", ".join(updates)}'
                     )
-
-                    if not dry_run:
-                        try:
-                            with transaction.atomic():
-                                item.save(update_fields=['gtin', 'batch_number', 'serial_number', 'barcode_type'])
-                                updated_count += 1
-                        except Exception as e:
-                            self.stdout.write(
-                                self.style.ERROR(f'    [ERROR] Error updating {item.name}: {str(e)}')
-                            )
-                            logger.error(f'Error updating item {item.id}: {e}', exc_info=True)
-                    else:
-                        updated_count += 1
+                )
+
+                if not dry_run:
+                    try:
+                        with transaction.atomic():
+                            item.save(update_fields=['gtin', 'batch_number', 'serial_number', 'barcode_type', 'updated_at'])
+                            updated_count += 1
+                    except Exception as e:
+                        self.stdout.write(
+                            self.style.ERROR(f'    [ERROR] Error updating {item.name}: {str(e)}')
+                        )
+                        logger.error(f'Error updating item {item.id}: {e}', exc_info=True)
+                else:
+                    updated_count += 1
 
         return updated_count
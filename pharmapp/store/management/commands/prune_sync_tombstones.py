@@ -0,0 +1,15 @@
+"""
+Management command to prune old offline sync tombstones
+Terminals whose sync token predates the retention window receive a full snapshot
+"""
+from django.core.management.base import BaseCommand
+
+from store.offline_sync import TOMBSTONE_RETENTION_DAYS, prune_tombstones
+
+
+class Command(BaseCommand):
+    help = f'Delete offline sync tombstones older than {TOMBSTONE_RETENTION_DAYS} days (OFFLINE_SYNC_TOMBSTONE_DAYS)'
+
+    def handle(self, *args, **options):
+        deleted = prune_tombstones()
+        self.stdout.write(self.style.SUCCESS(f'[OK] Pruned {deleted} sync tombstones'))
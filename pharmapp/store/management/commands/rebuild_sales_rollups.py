@@ -0,0 +1,80 @@
+"""
+Management command to rebuild the daily sales rollups used by the sales reports
+Re-aggregates closed days from receipts and payment records into SalesRollup rows
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from store.sales_rollup import first_sales_day, rebuild_days
+
+
+class Command(BaseCommand):
+    help = 'Rebuild (or backfill) the daily sales rollup tables for closed days'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            type=str,
+            help='First day to rebuild (YYYY-MM-DD). Defaults to the first day with sales'
+        )
+        parser.add_argument(
+            '--end',
+            type=str,
+            help='Last day to rebuild (YYYY-MM-DD). Defaults to yesterday'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Rebuild only the last N closed days'
+        )
+        parser.add_argument(
+            '--chunk-days',
+            type=int,
+            default=31,
+            help='Number of days rebuilt per transaction (default: 31)'
+        )
+
+    def handle(self, *args, **options):
+        yesterday = timezone.localdate() - timedelta(days=1)
+
+        end = self.parse_day(options['end']) if options['end'] else yesterday
+        if end > yesterday:
+            self.stdout.write(self.style.WARNING(f'Today is computed live; stopping at {yesterday}'))
+            end = yesterday
+
+        if options['days']:
+            start = end - timedelta(days=options['days'] - 1)
+        elif options['start']:
+            start = self.parse_day(options['start'])
+        else:
+            start = first_sales_day()
+            if start is None:
+                self.stdout.write(self.style.SUCCESS('[OK] No sales found, nothing to rebuild'))
+                return
+
+        if start > end:
+            self.stdout.write(self.style.SUCCESS('[OK] No closed days to rebuild'))
+            return
+
+        chunk_days = max(options['chunk_days'], 1)
+        total_rows = 0
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end)
+            rows = rebuild_days(chunk_start, chunk_end)
+            total_rows += rows
+            self.stdout.write(f'  {chunk_start} to {chunk_end}: {rows} rollup rows')
+            chunk_start = chunk_end + timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'[OK] Rebuilt sales rollups for {start} to {end} ({total_rows} rows)'
+        ))
+
+    def parse_day(self, value):
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Invalid date: {value} (expected YYYY-MM-DD)')
+        return day
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from store.models import Item, WholesaleItem
+from store.search_index import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the item search index (needed after bulk imports that bypass model signals)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode',
+            type=str,
+            choices=['retail', 'wholesale', 'both'],
+            default='both',
+            help='Which items to index: retail, wholesale, or both'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Terms written per INSERT (default: 500)'
+        )
+
+    def handle(self, *args, **options):
+        mode = options['mode']
+        models = []
+        if mode in ['retail', 'both']:
+            models.append(('Retail', Item))
+        if mode in ['wholesale', 'both']:
+            models.append(('Wholesale', WholesaleItem))
+
+        for label, model in models:
+            indexed = rebuild_index(model, batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'[OK] {label}: {indexed} items indexed'))
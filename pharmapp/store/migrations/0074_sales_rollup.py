@@ -0,0 +1,56 @@
+# Generated by Django 5.1.5 on 2026-10-18 06:22
+
+import datetime
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0073_expense_store_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollupDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='receipt',
+            name='date',
+            field=models.DateTimeField(db_index=True, default=datetime.datetime.now),
+        ),
+        migrations.AlterField(
+            model_name='wholesalereceipt',
+            name='date',
+            field=models.DateTimeField(db_index=True, default=datetime.datetime.now),
+        ),
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(db_index=True)),
+                ('channel', models.CharField(choices=[('retail', 'Retail'), ('wholesale', 'Wholesale')], max_length=10)),
+                ('cashier_username', models.CharField(blank=True, max_length=200, null=True)),
+                ('cashier_name', models.CharField(blank=True, max_length=200, null=True)),
+                ('sales_username', models.CharField(blank=True, max_length=200, null=True)),
+                ('payment_method', models.CharField(max_length=20)),
+                ('split_payment', models.BooleanField(default=False, help_text='True for totals taken from individual payment records')),
+                ('sales_amount', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('sales_count', models.PositiveIntegerField(default=0)),
+                ('returns_amount', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('returns_count', models.PositiveIntegerField(default=0)),
+                ('payment_amount', models.DecimalField(decimal_places=2, default=0, help_text='Payments on receipts that were not returned', max_digits=15)),
+                ('returned_payment_amount', models.DecimalField(decimal_places=2, default=0, help_text='Payments on receipts that were later returned', max_digits=15)),
+                ('cashier', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='store.cashier')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'channel'], name='store_sales_day_6e68e2_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.5 on 2026-10-18 06:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0074_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, help_text='Last change, used by the offline sync change feed'),
+        ),
+        migrations.AddField(
+            model_name='wholesaleitem',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, help_text='Last change, used by the offline sync change feed'),
+        ),
+        migrations.CreateModel(
+            name='SyncTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collection', models.CharField(max_length=50)),
+                ('object_id', models.PositiveIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['collection', 'deleted_at'], name='store_synct_collect_1acaf8_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.5 on 2026-10-18 06:45
+
+from django.db import migrations, models
+
+
+def backfill_gtin_core(apps, schema_editor):
+    for model_name in ('Item', 'WholesaleItem'):
+        model = apps.get_model('store', model_name)
+        pending = []
+        for item_id, gtin in model.objects.exclude(gtin__isnull=True).values_list('id', 'gtin').iterator():
+            if gtin and len(gtin) >= 8:
+                pending.append(model(id=item_id, gtin_core=gtin[-8:]))
+        model.objects.bulk_update(pending, ['gtin_core'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0075_offline_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='gtin_core',
+            field=models.CharField(blank=True, db_index=True, help_text='Last 8 GTIN digits, kept in sync with gtin for partial GTIN matching', max_length=8, null=True),
+        ),
+        migrations.AddField(
+            model_name='wholesaleitem',
+            name='gtin_core',
+            field=models.CharField(blank=True, db_index=True, help_text='Last 8 GTIN digits, kept in sync with gtin for partial GTIN matching', max_length=8, null=True),
+        ),
+        migrations.RunPython(backfill_gtin_core, migrations.RunPython.noop),
+    ]
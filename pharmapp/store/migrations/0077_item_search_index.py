@@ -0,0 +1,81 @@
+# Generated by Django 5.1.5 on 2026-10-18 06:54
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# A copy of store.search_index.index_terms as of this migration, so later
+# changes to the tokenizer or the models do not change what it builds
+
+TERM_MAX_LENGTH = 64
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(text):
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _NON_ALNUM.sub(' ', text.lower()).strip()
+
+
+def index_terms(values):
+    terms = set()
+    for position, value in enumerate(values):
+        text = normalize(value)
+        if not text:
+            continue
+        if position == 0:
+            terms.add(('p', text[:TERM_MAX_LENGTH]))
+        for token in text.split():
+            terms.add(('t', token[:TERM_MAX_LENGTH]))
+            terms.update(('g', token[i:i + 3]) for i in range(len(token) - 2))
+    return terms
+
+
+def build_search_index(apps, schema_editor):
+    for model_name, fields in (('Item', ('name', 'brand')), ('WholesaleItem', ('name', 'brand', 'dosage_form'))):
+        model = apps.get_model('store', model_name)
+        term_model = apps.get_model('store', f'{model_name}SearchTerm')
+        pending = []
+        for row in model.objects.values_list('id', *fields).iterator():
+            pending.extend(term_model(item_id=row[0], kind=kind, term=term) for kind, term in index_terms(row[1:]))
+        term_model.objects.bulk_create(pending, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0076_gtin_core'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('p', 'Prefix'), ('t', 'Token'), ('g', 'Trigram')], max_length=1)),
+                ('term', models.CharField(max_length=64)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='store.item')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'term'], name='store_items_kind_52f9cc_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='WholesaleItemSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('p', 'Prefix'), ('t', 'Token'), ('g', 'Trigram')], max_length=1)),
+                ('term', models.CharField(max_length=64)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='store.wholesaleitem')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'term'], name='store_whole_kind_1da190_idx')],
+            },
+        ),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-18 07:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0077_item_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['related_item', 'notification_type', 'created_at'], name='store_notif_related_15d7f5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['related_wholesale_item', 'notification_type', 'created_at'], name='store_notif_related_b579c5_idx'),
+        ),
+    ]
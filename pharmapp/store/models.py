@@ -7,6 +7,8 @@ from django.db.models.signals import post_save, pre_delete
 from customer.models import Customer, WholesaleCustomer, TransactionHistory
 from datetime import datetime
 from shortuuid.django_fields import ShortUUIDField
+from .gs1_parser import GTIN_CORE_LENGTH, gtin_core
+from .barcode_lookup import barcode_snapshot
 from userauth.models import User
 
 
@@ -121,6 +123,14 @@ class Formulation(models.Model):
         return self.dosage_form
 
 
+def sync_gtin_core(item, save_kwargs):
+    """Keep item.gtin_core in step with item.gtin, including saves limited by update_fields"""
+    item.gtin_core = gtin_core(item.gtin)
+    update_fields = save_kwargs.get('update_fields')
+    if update_fields is not None and 'gtin' in update_fields:
+        save_kwargs['update_fields'] = set(update_fields) | {'gtin_core'}
+
+
 class Item(models.Model):
     name = models.CharField(max_length=200, db_index=True)  # Add index for faster search
     dosage_form = models.CharField(max_length=200, blank=True, null=True, db_index=True)  # Add index for search
@@ -148,6 +158,10 @@ class Item(models.Model):
                            help_text="Batch/lot number from GS1 barcode")
     serial_number = models.CharField(max_length=50, blank=True, null=True, db_index=True,
                               help_text="Serial number from GS1 barcode")
+    gtin_core = models.CharField(max_length=GTIN_CORE_LENGTH, blank=True, null=True, db_index=True,
+                                 help_text="Last 8 GTIN digits, kept in sync with gtin for partial GTIN matching")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True,
+                                      help_text="Last change, used by the offline sync change feed")
 
     class Meta:
         ordering = ('name',)
@@ -166,8 +180,18 @@ class Item(models.Model):
     def save(self, *args, **kwargs):
         if not self.price or self.price == self.cost + (self.cost * Decimal(self.markup) / Decimal("100")):
             self.price = self.cost + (self.cost * Decimal(self.markup) / Decimal("100"))
+        sync_gtin_core(self, kwargs)
         super().save(*args, **kwargs)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Stock as loaded, so saves can detect threshold crossings (store.stock_alerts)
+        instance._loaded_stock = instance.__dict__.get('stock')
+        # Barcode values as loaded, so saves only drop their own cached scans (store.signals)
+        instance._loaded_barcode = barcode_snapshot(instance)
+        return instance
+
 
 
 
@@ -199,6 +223,10 @@ class WholesaleItem(models.Model):
                            help_text="Batch/lot number from GS1 barcode")
     serial_number = models.CharField(max_length=50, blank=True, null=True, db_index=True,
                               help_text="Serial number from GS1 barcode")
+    gtin_core = models.CharField(max_length=GTIN_CORE_LENGTH, blank=True, null=True, db_index=True,
+                                 help_text="Last 8 GTIN digits, kept in sync with gtin for partial GTIN matching")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True,
+                                      help_text="Last change, used by the offline sync change feed")
 
     class Meta:
         ordering = ('name',)
@@ -218,8 +246,18 @@ class WholesaleItem(models.Model):
         # Check if the price was provided; if not, calculate based on the markup
         if not self.price or self.price == self.cost + (Decimal(self.cost) * Decimal(self.markup) / 100):
             self.price = self.cost + (Decimal(self.cost) * Decimal(self.markup) / 100)
+        sync_gtin_core(self, kwargs)
         super().save(*args, **kwargs)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Stock as loaded, so saves can detect threshold crossings (store.stock_alerts)
+        instance._loaded_stock = instance.__dict__.get('stock')
+        # Barcode values as loaded, so saves only drop their own cached scans (store.signals)
+        instance._loaded_barcode = barcode_snapshot(instance)
+        return instance
+
 
 class Cart(models.Model):
     STATUS_CHOICES = [
@@ -508,7 +546,7 @@ class Receipt(models.Model):
     buyer_name = models.CharField(max_length=255, blank=True, null=True)
     buyer_address = models.CharField(max_length=255, blank=True, null=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.0'))
-    date = models.DateTimeField(default=datetime.now)
+    date = models.DateTimeField(default=datetime.now, db_index=True)
     receipt_id = ShortUUIDField(unique=True, length=5, max_length=50, alphabet='1234567890')
     printed = models.BooleanField(default=False)
     payment_method = models.CharField(max_length=20, choices=[
@@ -572,7 +610,7 @@ class WholesaleReceipt(models.Model):
     buyer_name = models.CharField(max_length=255, blank=True, null=True)
     buyer_address = models.CharField(max_length=255, blank=True, null=True)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.0'))
-    date = models.DateTimeField(default=datetime.now)
+    date = models.DateTimeField(default=datetime.now, db_index=True)
     receipt_id = ShortUUIDField(unique=True, length=5, max_length=50, alphabet='1234567890')
     # printed = models.BooleanField(default=False)
     payment_method = models.CharField(max_length=20, choices=[
@@ -824,7 +862,7 @@ class StockAdjustment(models.Model):
         item = self.item
         logger.info(f"Applying adjustment: {self.new_quantity} for item {item.name} (ID: {item.id})")
         item.stock = self.new_quantity
-        item.save(update_fields=['stock'])
+        item.save(update_fields=['stock', 'updated_at'])
         logger.info(f"Stock updated: New stock quantity = {item.stock}")
 
 
@@ -902,7 +940,7 @@ class WholesaleStockAdjustment(models.Model):
         item = self.item
         logger.info(f"Applying adjustment: {self.new_quantity} for item {item.name} (ID: {item.id})")
         item.stock = self.new_quantity
-        item.save(update_fields=['stock'])
+        item.save(update_fields=['stock', 'updated_at'])
         logger.info(f"Stock updated: New stock quantity = {item.stock}")
 
 
@@ -1003,6 +1041,118 @@ class MonthlyReport(models.Model):
         self.save()
 
 
+class SalesRollup(models.Model):
+    """
+    Pre-aggregated sales for one closed day, keyed by channel, cashier and payment method.
+
+    Rows are rebuilt per day from Receipt/WholesaleReceipt and their payment records
+    (see store.sales_rollup) so sales reports do not have to re-aggregate the whole
+    receipt history on every page load.
+    """
+    CHANNEL_CHOICES = [
+        ('retail', 'Retail'),
+        ('wholesale', 'Wholesale'),
+    ]
+
+    day = models.DateField(db_index=True)
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES)
+    cashier = models.ForeignKey('Cashier', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    cashier_username = models.CharField(max_length=200, blank=True, null=True)
+    cashier_name = models.CharField(max_length=200, blank=True, null=True)
+    sales_username = models.CharField(max_length=200, blank=True, null=True)
+    payment_method = models.CharField(max_length=20)
+    split_payment = models.BooleanField(default=False, help_text="True for totals taken from individual payment records")
+
+    sales_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    sales_count = models.PositiveIntegerField(default=0)
+    returns_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    returns_count = models.PositiveIntegerField(default=0)
+    payment_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0, help_text="Payments on receipts that were not returned")
+    returned_payment_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0, help_text="Payments on receipts that were later returned")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['day', 'channel']),
+        ]
+
+    def __str__(self):
+        return f'{self.day} {self.channel} {self.cashier_username or self.sales_username} {self.payment_method}'
+
+
+class SalesRollupDay(models.Model):
+    """Marks a closed day whose SalesRollup rows have been materialized"""
+    day = models.DateField(unique=True)
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.day} (refreshed {self.refreshed_at})'
+
+
+class SyncTombstone(models.Model):
+    """
+    Records a deleted row of an offline-synced model.
+
+    The offline change feed (api.sync_feed) sends these to terminals so rows
+    deleted on the server are also removed from their local cache.
+    """
+    collection = models.CharField(max_length=50)
+    object_id = models.PositiveIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['collection', 'deleted_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.collection} #{self.object_id} deleted {self.deleted_at}'
+
+
+class SearchTerm(models.Model):
+    """
+    One normalized term of an item's searchable text (see store.search_index).
+
+    ``prefix`` terms hold a whole field, ``token`` terms single words and
+    ``trigram`` terms three-character slices of words, so every kind of
+    match is an equality or range condition on the (kind, term) index.
+    """
+    KIND_PREFIX = 'p'
+    KIND_TOKEN = 't'
+    KIND_TRIGRAM = 'g'
+    KIND_CHOICES = [
+        (KIND_PREFIX, 'Prefix'),
+        (KIND_TOKEN, 'Token'),
+        (KIND_TRIGRAM, 'Trigram'),
+    ]
+
+    kind = models.CharField(max_length=1, choices=KIND_CHOICES)
+    term = models.CharField(max_length=64)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return f'{self.get_kind_display()}: {self.term}'
+
+
+class ItemSearchTerm(SearchTerm):
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='search_terms')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'term']),
+        ]
+
+
+class WholesaleItemSearchTerm(SearchTerm):
+    item = models.ForeignKey(WholesaleItem, on_delete=models.CASCADE, related_name='search_terms')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'term']),
+        ]
+
+
 class StoreSettings(models.Model):
     low_stock_threshold = models.PositiveIntegerField(default=10)
 
@@ -1139,6 +1289,20 @@ class PaymentRequestItem(models.Model):
         return f"{self.item_name} - {self.quantity} {self.unit}"
 
 
+class NotificationQuerySet(models.QuerySet):
+    def mark_as_read(self):
+        """Mark the unread notifications of this queryset as read with one UPDATE"""
+        from .notifications import invalidate_unread_counts
+        unread = self.filter(is_read=False).order_by()
+        user_ids = set(unread.values_list('user_id', flat=True).distinct())
+        if not user_ids:
+            return 0
+        updated = unread.update(is_read=True, read_at=timezone.now())
+        if updated:
+            invalidate_unread_counts(user_ids)
+        return updated
+
+
 class Notification(models.Model):
     """System notifications for users"""
     NOTIFICATION_TYPES = [
@@ -1178,11 +1342,16 @@ class Notification(models.Model):
     read_at = models.DateTimeField(null=True, blank=True)
     dismissed_at = models.DateTimeField(null=True, blank=True)
 
+    objects = NotificationQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['user', 'is_read', 'is_dismissed']),
             models.Index(fields=['notification_type', 'created_at']),
+            # Recent-notification lookups of the stock notification check
+            models.Index(fields=['related_item', 'notification_type', 'created_at']),
+            models.Index(fields=['related_wholesale_item', 'notification_type', 'created_at']),
         ]
 
     def __str__(self):
@@ -1202,3 +1371,11 @@ class Notification(models.Model):
             self.is_dismissed = True
             self.dismissed_at = timezone.now()
             self.save(update_fields=['is_dismissed', 'dismissed_at'])
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Read state as loaded, so saves can adjust the unread badge (store.notifications)
+        if 'is_read' in instance.__dict__ and 'is_dismissed' in instance.__dict__:
+            instance._loaded_unread = not instance.is_read and not instance.is_dismissed
+        return instance
@@ -1,12 +1,23 @@
 """
 Notification service for managing system notifications
 """
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
 from django.utils import timezone
 from django.contrib.auth import get_user_model
+from pharmapp import counters
 from .models import Notification, Item, WholesaleItem, StoreSettings, WholesaleSettings
 
 User = get_user_model()
 
+# Unread notification badge, kept in pharmapp.counters: system-wide
+# notifications share one read flag, so they are counted once for everybody
+SYSTEM_UNREAD_COUNTER = 'notifications_system'
+USER_UNREAD_COUNTER = 'notifications_user'
+
+# An item gets at most one low/out of stock notification per window
+STOCK_NOTIFICATION_WINDOW_HOURS = getattr(settings, 'STOCK_NOTIFICATION_WINDOW_HOURS', 24)
+
 
 class NotificationService:
     """Service class for managing notifications"""
@@ -25,111 +36,98 @@ class NotificationService:
             related_wholesale_item=related_wholesale_item
         )
     
+    @staticmethod
+    def _low_stock_notification(item, is_wholesale=False, stock=None):
+        """Build (without saving) a low stock notification for an item"""
+        scope = 'Wholesale' if is_wholesale else 'Retail'
+        stock = item.stock if stock is None else stock
+        return Notification(
+            notification_type='low_stock',
+            priority='high',
+            title=f"Low Stock Alert: {item.name}",
+            message=f"{scope} item '{item.name}' is running low on stock. Current stock: {stock} {item.unit}",
+            related_item=None if is_wholesale else item,
+            related_wholesale_item=item if is_wholesale else None
+        )
+    
+    @staticmethod
+    def _out_of_stock_notification(item, is_wholesale=False):
+        """Build (without saving) an out of stock notification for an item"""
+        scope = 'Wholesale' if is_wholesale else 'Retail'
+        return Notification(
+            notification_type='out_of_stock',
+            priority='critical',
+            title=f"Out of Stock: {item.name}",
+            message=f"{scope} item '{item.name}' is completely out of stock!",
+            related_item=None if is_wholesale else item,
+            related_wholesale_item=item if is_wholesale else None
+        )
+    
     @staticmethod
     def create_low_stock_notification(item, is_wholesale=False):
         """Create a low stock notification for an item"""
-        if is_wholesale:
-            title = f"Low Stock Alert: {item.name}"
-            message = f"Wholesale item '{item.name}' is running low on stock. Current stock: {item.stock} {item.unit}"
-            return NotificationService.create_notification(
-                notification_type='low_stock',
-                title=title,
-                message=message,
-                priority='high',
-                related_wholesale_item=item
-            )
-        else:
-            title = f"Low Stock Alert: {item.name}"
-            message = f"Retail item '{item.name}' is running low on stock. Current stock: {item.stock} {item.unit}"
-            return NotificationService.create_notification(
-                notification_type='low_stock',
-                title=title,
-                message=message,
-                priority='high',
-                related_item=item
-            )
+        notification = NotificationService._low_stock_notification(item, is_wholesale)
+        notification.save()
+        return notification
     
     @staticmethod
     def create_out_of_stock_notification(item, is_wholesale=False):
         """Create an out of stock notification for an item"""
-        if is_wholesale:
-            title = f"Out of Stock: {item.name}"
-            message = f"Wholesale item '{item.name}' is completely out of stock!"
-            return NotificationService.create_notification(
-                notification_type='out_of_stock',
-                title=title,
-                message=message,
-                priority='critical',
-                related_wholesale_item=item
-            )
-        else:
-            title = f"Out of Stock: {item.name}"
-            message = f"Retail item '{item.name}' is completely out of stock!"
-            return NotificationService.create_notification(
-                notification_type='out_of_stock',
-                title=title,
-                message=message,
-                priority='critical',
-                related_item=item
-            )
+        notification = NotificationService._out_of_stock_notification(item, is_wholesale)
+        notification.save()
+        return notification
     
     @staticmethod
     def check_and_create_stock_notifications():
-        """Check all items and create notifications for low/out of stock items"""
-        notifications_created = 0
-        
-        # Get settings
-        store_settings = StoreSettings.get_settings()
-        wholesale_settings = WholesaleSettings.get_settings()
-        
-        # Check retail items
-        retail_items = Item.objects.all()
-        for item in retail_items:
-            # Skip if notification already exists for this item in the last 24 hours
-            recent_notification = Notification.objects.filter(
-                related_item=item,
-                notification_type__in=['low_stock', 'out_of_stock'],
-                created_at__gte=timezone.now() - timezone.timedelta(hours=24)
-            ).exists()
-            
-            if recent_notification:
-                continue
-            
-            if item.stock == 0:
-                NotificationService.create_out_of_stock_notification(item, is_wholesale=False)
-                notifications_created += 1
-            elif item.stock <= store_settings.low_stock_threshold:
-                NotificationService.create_low_stock_notification(item, is_wholesale=False)
-                notifications_created += 1
-        
-        # Check wholesale items
-        wholesale_items = WholesaleItem.objects.all()
-        for item in wholesale_items:
-            # Skip if notification already exists for this item in the last 24 hours
+        """
+        Create notifications for low/out of stock items, set-based
+
+        For each of retail and wholesale, one query selects the items at or
+        below the threshold that have no stock notification from the last
+        STOCK_NOTIFICATION_WINDOW_HOURS (an anti-join on Notification), and
+        all new notifications are written with one bulk_create, so the query
+        count does not depend on the number of items.
+
+        Returns:
+            int: Number of notifications created
+        """
+        cutoff = timezone.now() - timezone.timedelta(hours=STOCK_NOTIFICATION_WINDOW_HOURS)
+        thresholds = [
+            (Item, 'related_item', False, StoreSettings.get_settings().low_stock_threshold),
+            (WholesaleItem, 'related_wholesale_item', True, WholesaleSettings.get_settings().low_stock_threshold),
+        ]
+
+        notifications = []
+        for model, related_field, is_wholesale, threshold in thresholds:
             recent_notification = Notification.objects.filter(
-                related_wholesale_item=item,
+                **{related_field: OuterRef('pk')},
                 notification_type__in=['low_stock', 'out_of_stock'],
-                created_at__gte=timezone.now() - timezone.timedelta(hours=24)
-            ).exists()
-            
-            if recent_notification:
-                continue
-            
-            if item.stock == 0:
-                NotificationService.create_out_of_stock_notification(item, is_wholesale=True)
-                notifications_created += 1
-            elif item.stock <= wholesale_settings.low_stock_threshold:
-                NotificationService.create_low_stock_notification(item, is_wholesale=True)
-                notifications_created += 1
-        
-        return notifications_created
+                created_at__gte=cutoff
+            )
+            items = model.objects.filter(
+                stock__lte=threshold
+            ).filter(
+                ~Exists(recent_notification)
+            ).only('id', 'name', 'stock', 'unit').order_by('pk')
+
+            for item in items.iterator(chunk_size=2000):
+                if item.stock == 0:
+                    notifications.append(NotificationService._out_of_stock_notification(item, is_wholesale))
+                else:
+                    notifications.append(NotificationService._low_stock_notification(item, is_wholesale))
+
+        Notification.objects.bulk_create(notifications, batch_size=500)
+        if notifications:
+            counters.adjust(SYSTEM_UNREAD_COUNTER, len(notifications))
+        return len(notifications)
     
     @staticmethod
     def get_unread_notifications(user=None):
         """Get unread notifications for a user or system-wide"""
         queryset = Notification.objects.filter(is_read=False, is_dismissed=False)
         if user:
-            queryset = queryset.filter(user__in=[user, None])  # User-specific or system-wide
+            # User-specific or system-wide (``user__in=[user, None]`` never matches NULL)
+            queryset = queryset.filter(Q(user=user) | Q(user__isnull=True))
         else:
             queryset = queryset.filter(user=None)  # Only system-wide
         return queryset
@@ -138,18 +136,19 @@ class NotificationService:
     def get_unread_count(user=None):
         """Get count of unread notifications"""
         return NotificationService.get_unread_notifications(user).count()
+
+    @staticmethod
+    def get_cached_unread_count(user):
+        """Unread count from pharmapp.counters (no query while the counters are cached)"""
+        count = counters.get(SYSTEM_UNREAD_COUNTER)
+        if user is not None:
+            count += counters.get(USER_UNREAD_COUNTER, user.pk)
+        return count
     
     @staticmethod
     def mark_all_as_read(user=None):
         """Mark all notifications as read for a user"""
-        queryset = Notification.objects.filter(is_read=False, is_dismissed=False)
-        if user:
-            queryset = queryset.filter(user__in=[user, None])
-        else:
-            queryset = queryset.filter(user=None)
-        
-        updated = queryset.update(is_read=True, read_at=timezone.now())
-        return updated
+        return NotificationService.get_unread_notifications(user).mark_as_read()
     
     @staticmethod
     def dismiss_old_notifications(days=30):
@@ -160,6 +159,8 @@ class NotificationService:
             is_dismissed=False
         )
         updated = old_notifications.update(is_dismissed=True, dismissed_at=timezone.now())
+        if updated:
+            invalidate_all_unread_counts()
         return updated
     
     @staticmethod
@@ -173,6 +174,57 @@ class NotificationService:
         )
 
 
+def invalidate_unread_counts(user_ids):
+    """Drop the cached counts of ``user_ids`` (None for system-wide) after a bulk change"""
+    if None in user_ids:
+        counters.invalidate(SYSTEM_UNREAD_COUNTER)
+    counters.invalidate(USER_UNREAD_COUNTER, user_ids)
+
+
+def invalidate_all_unread_counts():
+    """Drop every cached notification count, after bulk changes across users"""
+    counters.invalidate(SYSTEM_UNREAD_COUNTER)
+    user_ids = Notification.objects.filter(user__isnull=False).values_list('user_id', flat=True).distinct()
+    counters.invalidate(USER_UNREAD_COUNTER, list(user_ids))
+
+
+def record_notification_change(notification, created=False, deleted=False):
+    """Adjust the unread counts for a saved or deleted notification (see store.signals)"""
+    unread = not notification.is_read and not notification.is_dismissed
+    if deleted:
+        was_unread, unread = unread, False
+    elif created:
+        was_unread = False
+    else:
+        # Read state as loaded (Notification.from_db); None if never loaded
+        was_unread = notification.__dict__.get('_loaded_unread')
+    notification._loaded_unread = unread
+
+    system_wide = notification.user_id is None
+    if was_unread is None:
+        if system_wide:
+            counters.invalidate(SYSTEM_UNREAD_COUNTER)
+        else:
+            counters.invalidate(USER_UNREAD_COUNTER, [notification.user_id])
+    elif unread != was_unread:
+        delta = 1 if unread else -1
+        if system_wide:
+            counters.adjust(SYSTEM_UNREAD_COUNTER, delta)
+        else:
+            counters.adjust(USER_UNREAD_COUNTER, delta, [notification.user_id])
+
+
+counters.register_counter(
+    SYSTEM_UNREAD_COUNTER,
+    lambda: NotificationService.get_unread_count(None),
+    shared=True,
+)
+counters.register_counter(
+    USER_UNREAD_COUNTER,
+    lambda user_id: Notification.objects.filter(user_id=user_id, is_read=False, is_dismissed=False).count(),
+)
+
+
 def check_stock_and_notify():
     """Convenience function to check stock and create notifications"""
     return NotificationService.check_and_create_stock_notifications()
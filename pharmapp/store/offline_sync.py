@@ -0,0 +1,255 @@
+"""
+Change feed for the offline cache of the PWA terminals.
+
+Every synced model carries an ``updated_at`` column and deletions are recorded
+as SyncTombstone rows. A terminal downloads a full snapshot once and then
+passes the ``sync_token`` it was given to receive only the rows changed or
+deleted since then.
+
+Pages are read with keyset pagination on ``(updated_at, pk)`` inside a fixed
+``until`` bound taken on the first page, so rows changed while a terminal is
+paging are picked up by its next delta instead of being skipped. The next
+delta starts ``SYNC_OVERLAP_SECONDS`` before ``until`` to also cover
+transactions that were still in flight; re-sent rows are simply upserted
+again by the client.
+"""
+import base64
+import binascii
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from customer.models import Customer, WholesaleCustomer
+from supplier.models import Supplier
+from .models import Item, SyncTombstone, WholesaleItem
+
+logger = logging.getLogger(__name__)
+
+# Response key -> model, in the order collections are paged
+SYNC_COLLECTIONS = [
+    ('inventory', Item),
+    ('customers', Customer),
+    ('suppliers', Supplier),
+    ('wholesale', WholesaleItem),
+    ('wholesale_customers', WholesaleCustomer),
+]
+
+SYNC_PAGE_SIZE = getattr(settings, 'OFFLINE_SYNC_PAGE_SIZE', 2000)
+SYNC_MAX_PAGE_SIZE = getattr(settings, 'OFFLINE_SYNC_MAX_PAGE_SIZE', 10000)
+SYNC_OVERLAP_SECONDS = getattr(settings, 'OFFLINE_SYNC_OVERLAP_SECONDS', 60)
+TOMBSTONE_RETENTION_DAYS = getattr(settings, 'OFFLINE_SYNC_TOMBSTONE_DAYS', 30)
+
+TOKEN_VERSION = 1
+
+
+class InvalidSyncToken(ValueError):
+    """Raised when a sync token or page size from a terminal cannot be used"""
+
+
+def collection_for_model(model):
+    """Return the sync collection name of a model, or None if it is not synced"""
+    for name, collection_model in SYNC_COLLECTIONS:
+        if collection_model is model:
+            return name
+    return None
+
+
+def encode_token(state):
+    payload = json.dumps(state, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_token(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise InvalidSyncToken('Malformed sync token')
+
+    if not isinstance(state, dict) or state.get('v') != TOKEN_VERSION:
+        raise InvalidSyncToken('Unsupported sync token version')
+    return state
+
+
+def _parse_time(value):
+    if value is None:
+        return None
+    parsed = parse_datetime(value) if isinstance(value, str) else None
+    if parsed is None:
+        raise InvalidSyncToken('Malformed sync token')
+    return parsed
+
+
+class ChangeFeedPage:
+    """
+    One page of the change feed.
+
+    Iterate ``sections()`` to stream the page; each section is a
+    ``(kind, collection, rows)`` tuple where kind is ``'rows'`` (dicts from
+    ``.values()``) or ``'deleted'`` (primary keys). Once every section has
+    been consumed, ``has_more`` and ``sync_token`` describe how to continue.
+    """
+
+    def __init__(self, since=None, until=None, position=None, limit=None, full=None):
+        self.since = since
+        self.until = until or timezone.now()
+        self.position = position
+        self.limit = limit or SYNC_PAGE_SIZE
+        self.full = since is None if full is None else full
+        self.has_more = False
+        self.next_position = None
+        self._emitted = 0
+
+    @classmethod
+    def from_request(cls, token=None, limit=None):
+        """
+        Build the page for a ``?since=<token>&limit=<n>`` request.
+
+        Raises:
+            InvalidSyncToken: If the token or limit cannot be used
+        """
+        if limit in (None, ''):
+            limit = SYNC_PAGE_SIZE
+        else:
+            try:
+                limit = int(limit)
+            except (TypeError, ValueError):
+                raise InvalidSyncToken('limit must be an integer')
+            if limit < 1:
+                raise InvalidSyncToken('limit must be positive')
+            limit = min(limit, SYNC_MAX_PAGE_SIZE)
+
+        if not token:
+            return cls(limit=limit)
+
+        state = decode_token(token)
+        since = _parse_time(state.get('since'))
+        until = _parse_time(state.get('until'))
+        position = state.get('pos')
+        full = bool(state.get('full', since is None))
+
+        if until is None and since is not None:
+            # A delta that has not started paging yet
+            retention_start = timezone.now() - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+            if since < retention_start:
+                # Deletions older than the retention window have been pruned
+                logger.info(f"Sync token from {since} is past tombstone retention, sending full snapshot")
+                return cls(limit=limit)
+
+        if position is not None:
+            if not (isinstance(position, list) and len(position) == 3 and isinstance(position[0], int)):
+                raise InvalidSyncToken('Malformed sync token')
+            position = [position[0], _parse_time(position[1]) if position[1] else None, position[2]]
+
+        return cls(since=since, until=until, position=position, limit=limit, full=full)
+
+    def sources(self):
+        """Return the (kind, collection, model) sources paged by this feed, in order"""
+        sources = [('rows', name, model) for name, model in SYNC_COLLECTIONS]
+        if self.since is not None:
+            sources += [('deleted', name, SyncTombstone) for name, _ in SYNC_COLLECTIONS]
+        return sources
+
+    def _window(self, kind, name):
+        field = 'deleted_at' if kind == 'deleted' else 'updated_at'
+        window = Q(**{f'{field}__lte': self.until})
+        if self.since is not None:
+            window &= Q(**{f'{field}__gt': self.since})
+        if kind == 'deleted':
+            window &= Q(collection=name)
+        return window, field
+
+    def _queryset(self, kind, name, model, after):
+        window, field = self._window(kind, name)
+        queryset = model.objects.filter(window)
+        if after is not None:
+            last_time, last_pk = after
+            queryset = queryset.filter(
+                Q(**{f'{field}__gt': last_time}) | Q(**{field: last_time, 'pk__gt': last_pk})
+            )
+        queryset = queryset.order_by(field, 'pk')
+        if kind == 'deleted':
+            return queryset.values_list('deleted_at', 'pk', 'object_id')
+        return queryset.values()
+
+    def sections(self):
+        remaining = self.limit
+        start_index = self.position[0] if self.position else 0
+
+        for index, (kind, name, model) in enumerate(self.sources()):
+            if index < start_index or self.has_more:
+                yield kind, name, iter(())
+                continue
+
+            after = None
+            if self.position and index == start_index and self.position[1] is not None:
+                after = (self.position[1], self.position[2])
+
+            queryset = self._queryset(kind, name, model, after)
+            if remaining == 0:
+                if queryset.exists():
+                    self.has_more = True
+                    self.next_position = [index, None, None]
+                yield kind, name, iter(())
+                continue
+
+            self._emitted = 0
+            yield kind, name, self._page_rows(kind, index, queryset[:remaining + 1], remaining)
+            remaining -= self._emitted
+
+    def _page_rows(self, kind, index, queryset, remaining):
+        last = None
+        for row in queryset.iterator(chunk_size=500):
+            if self._emitted == remaining:
+                # One row past the page: resume after the last emitted row
+                self.has_more = True
+                self.next_position = [index, last[0].isoformat(), last[1]]
+                return
+            if kind == 'deleted':
+                last = (row[0], row[1])
+                yield row[2]
+            else:
+                last = (row['updated_at'], row['id'])
+                yield row
+            self._emitted += 1
+
+    @property
+    def sync_token(self):
+        """Token for the next request: the next page, or the next delta once complete"""
+        if self.has_more:
+            return encode_token({
+                'v': TOKEN_VERSION,
+                'since': self.since.isoformat() if self.since else None,
+                'until': self.until.isoformat(),
+                'pos': self.next_position,
+                'full': self.full,
+            })
+        next_since = self.until - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+        return encode_token({'v': TOKEN_VERSION, 'since': next_since.isoformat()})
+
+
+def record_tombstone(instance):
+    """Record the deletion of a synced model instance"""
+    name = collection_for_model(type(instance))
+    if name and instance.pk is not None:
+        SyncTombstone.objects.create(collection=name, object_id=instance.pk)
+
+
+def prune_tombstones(days=None):
+    """
+    Delete tombstones older than the retention window.
+
+    Terminals with a token older than the window get a full snapshot instead.
+
+    Returns:
+        int: Number of tombstones deleted
+    """
+    days = TOMBSTONE_RETENTION_DAYS if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = SyncTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
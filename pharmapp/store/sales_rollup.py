@@ -0,0 +1,383 @@
+"""
+Daily sales rollups backing the daily and monthly sales reports.
+
+get_daily_sales() and get_monthly_sales_with_expenses() used to run eight
+GROUP BY queries over the whole receipt and payment history on every call.
+Closed days are now materialized into SalesRollup rows (one per day, channel,
+cashier and payment method) and only today is aggregated live.
+
+Rollups are kept current by:
+    - store.signals, which re-aggregates a closed day after a receipt or payment
+      on that day is saved or deleted;
+    - materialize_closed_days(), which fills in days that closed since the last
+      report (e.g. yesterday, the first time a report is opened today);
+    - the ``rebuild_sales_rollups`` management command for backfills/repairs.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+import logging
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import (
+    Receipt, ReceiptPayment, SalesRollup, SalesRollupDay,
+    WholesaleReceipt, WholesaleReceiptPayment,
+)
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal('0.00')
+
+# Receipt statuses counted as sales by the reports ('Partially Paid' is excluded)
+REPORTED_STATUSES = ['Paid', 'Unpaid']
+
+CHANNEL_SOURCES = {
+    'retail': (Receipt, ReceiptPayment),
+    'wholesale': (WholesaleReceipt, WholesaleReceiptPayment),
+}
+
+# Whether payments on returned receipts count towards the payment method totals,
+# keyed by (period, channel, split_payment). This mirrors the report queries
+# the rollups replaced so totals are unchanged.
+INCLUDE_RETURNED_PAYMENTS = {
+    ('day', 'retail', False): False,
+    ('day', 'retail', True): True,
+    ('day', 'wholesale', False): False,
+    ('day', 'wholesale', True): False,
+    ('month', 'retail', False): True,
+    ('month', 'retail', True): True,
+    ('month', 'wholesale', False): True,
+    ('month', 'wholesale', True): True,
+}
+
+
+def _day_bounds(start, end):
+    """Return aware datetimes spanning the local days start..end (inclusive)"""
+    tz = timezone.get_current_timezone()
+    lower = timezone.make_aware(datetime.combine(start, time.min), tz)
+    upper = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz)
+    return lower, upper
+
+
+def local_day(value):
+    """Return the local calendar day of a receipt/payment date value"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            return timezone.localtime(value).date()
+        return value.date()
+    return value
+
+
+def compute_rollups(start, end):
+    """
+    Aggregate receipts and payment records for the local days start..end.
+
+    Returns:
+        list: Unsaved SalesRollup objects
+    """
+    lower, upper = _day_bounds(start, end)
+    reported = Q(status__in=REPORTED_STATUSES)
+    rows = []
+
+    for channel, (receipt_model, payment_model) in CHANNEL_SOURCES.items():
+        receipts = (
+            receipt_model.objects
+            .filter(date__gte=lower, date__lt=upper)
+            .annotate(day=TruncDate('date'),
+                      cashier_username=F('cashier__user__username'),
+                      cashier_display=F('cashier__name'),
+                      sales_username=F('sales__user__username'))
+            .values('day', 'cashier', 'cashier_username', 'cashier_display', 'sales_username', 'payment_method')
+            .annotate(
+                sales_amount=Sum('total_amount', filter=reported & Q(is_returned=False)),
+                sales_count=Count('id', filter=reported & Q(is_returned=False)),
+                returns_amount=Sum('return_amount', filter=Q(is_returned=True)),
+                returns_count=Count('id', filter=Q(is_returned=True)),
+                returned_paid=Sum('total_amount', filter=reported & Q(is_returned=True)),
+            )
+            .order_by()
+        )
+        for row in receipts:
+            is_split = row['payment_method'] == 'Split'
+            sales_amount = row['sales_amount'] or ZERO
+            rows.append(SalesRollup(
+                day=row['day'],
+                channel=channel,
+                cashier_id=row['cashier'],
+                cashier_username=row['cashier_username'],
+                cashier_name=row['cashier_display'],
+                sales_username=row['sales_username'],
+                payment_method=row['payment_method'],
+                sales_amount=sales_amount,
+                sales_count=row['sales_count'],
+                returns_amount=row['returns_amount'] or ZERO,
+                returns_count=row['returns_count'],
+                # Split receipts are broken down by their payment records below
+                payment_amount=ZERO if is_split else sales_amount,
+                returned_payment_amount=ZERO if is_split else (row['returned_paid'] or ZERO),
+            ))
+
+        payments = (
+            payment_model.objects
+            .filter(date__gte=lower, date__lt=upper, receipt__status__in=REPORTED_STATUSES)
+            .annotate(day=TruncDate('date'),
+                      cashier_ref=F('receipt__cashier'),
+                      cashier_username=F('receipt__cashier__user__username'),
+                      cashier_display=F('receipt__cashier__name'),
+                      sales_username=F('receipt__sales__user__username'))
+            .values('day', 'cashier_ref', 'cashier_username', 'cashier_display', 'sales_username', 'payment_method')
+            .annotate(
+                paid=Sum('amount', filter=Q(receipt__is_returned=False)),
+                returned_paid=Sum('amount', filter=Q(receipt__is_returned=True)),
+            )
+            .order_by()
+        )
+        for row in payments:
+            rows.append(SalesRollup(
+                day=row['day'],
+                channel=channel,
+                cashier_id=row['cashier_ref'],
+                cashier_username=row['cashier_username'],
+                cashier_name=row['cashier_display'],
+                sales_username=row['sales_username'],
+                payment_method=row['payment_method'],
+                split_payment=True,
+                payment_amount=row['paid'] or ZERO,
+                returned_payment_amount=row['returned_paid'] or ZERO,
+            ))
+
+    return rows
+
+
+@transaction.atomic
+def rebuild_days(start, end):
+    """
+    Replace the rollups for the local days start..end and mark them materialized.
+
+    Returns:
+        int: Number of rollup rows written
+    """
+    rows = compute_rollups(start, end)
+    SalesRollup.objects.filter(day__range=(start, end)).delete()
+    SalesRollup.objects.bulk_create(rows, batch_size=500)
+
+    SalesRollupDay.objects.filter(day__range=(start, end)).delete()
+    SalesRollupDay.objects.bulk_create(
+        [SalesRollupDay(day=start + timedelta(days=n)) for n in range((end - start).days + 1)],
+        batch_size=500
+    )
+    return len(rows)
+
+
+def first_sales_day():
+    """Return the earliest local day with a receipt or payment record, or None"""
+    days = []
+    for receipt_model, payment_model in CHANNEL_SOURCES.values():
+        for model in (receipt_model, payment_model):
+            first = model.objects.aggregate(first=Min('date'))['first']
+            if first is not None:
+                days.append(local_day(first))
+    return min(days) if days else None
+
+
+def materialize_closed_days(today=None):
+    """
+    Build rollups for every closed day that has not been materialized yet.
+
+    Returns:
+        int: Number of rollup rows written
+    """
+    today = today or timezone.localdate()
+    yesterday = today - timedelta(days=1)
+
+    last = SalesRollupDay.objects.aggregate(last=Max('day'))['last']
+    start = last + timedelta(days=1) if last else first_sales_day()
+    if start is None or start > yesterday:
+        return 0
+
+    logger.info(f"Materializing sales rollups for {start} to {yesterday}")
+    return rebuild_days(start, yesterday)
+
+
+def refresh_day(day):
+    """
+    Re-aggregate one closed day.
+
+    Today is always computed live, and days after the last materialized day
+    are left for materialize_closed_days() so no gap is skipped.
+    """
+    if day is None or day >= timezone.localdate():
+        return 0
+    last = SalesRollupDay.objects.aggregate(last=Max('day'))['last']
+    if last is None or day > last:
+        return 0
+    return rebuild_days(day, day)
+
+
+def _refresh_day_logged(day):
+    try:
+        refresh_day(day)
+    except Exception as e:
+        logger.error(f"Error refreshing sales rollup for {day}: {e}")
+
+
+def schedule_day_refresh(day):
+    """
+    Refresh a closed day's rollup once the current transaction commits.
+
+    Writes to today's receipts need no refresh because today is always
+    aggregated live; it is materialized once the day has closed.
+    """
+    if day is None or day >= timezone.localdate():
+        return
+    transaction.on_commit(lambda: _refresh_day_logged(day))
+
+
+def get_sales_report_rows(period='day'):
+    """
+    Return the grouped rows the sales reports are built from.
+
+    Closed days are read from SalesRollup and today is aggregated live. The
+    rows have the same shape as the GROUP BY querysets the reports used to run:
+
+        retail_sales / wholesale_sales:
+            {period, 'cashier_username', 'cashier_display', 'sales_username',
+             'cashier__id', 'total_sales', 'transaction_count'}
+        retail_returns / wholesale_returns:
+            same, with 'total_returns' instead of 'total_sales'
+        retail_payments / wholesale_payments (receipts paid with one method) and
+        retail_split_payments / wholesale_split_payments (payment records):
+            {period, 'payment_method', 'total_amount'}
+
+    Args:
+        period: 'day' (keys are dates) or 'month' (keys are aware datetimes at
+            local midnight on the first of the month, like TruncMonth)
+
+    Returns:
+        dict: Row lists keyed by the names above
+    """
+    today = timezone.localdate()
+    materialize_closed_days(today)
+
+    period_expr = TruncMonth('day') if period == 'month' else F('day')
+    closed_rows = (
+        SalesRollup.objects
+        .filter(day__lt=today)
+        .annotate(period=period_expr)
+        .values('period', 'channel', 'cashier', 'cashier_username', 'cashier_name',
+                'sales_username', 'payment_method', 'split_payment')
+        .annotate(
+            sales_amount_sum=Sum('sales_amount'),
+            sales_count_sum=Sum('sales_count'),
+            returns_amount_sum=Sum('returns_amount'),
+            returns_count_sum=Sum('returns_count'),
+            payment_amount_sum=Sum('payment_amount'),
+            returned_payment_amount_sum=Sum('returned_payment_amount'),
+        )
+        .order_by()
+    )
+    rows = [
+        {
+            'period': row['period'],
+            'channel': row['channel'],
+            'cashier': row['cashier'],
+            'cashier_username': row['cashier_username'],
+            'cashier_name': row['cashier_name'],
+            'sales_username': row['sales_username'],
+            'payment_method': row['payment_method'],
+            'split_payment': row['split_payment'],
+            'sales_amount': row['sales_amount_sum'] or ZERO,
+            'sales_count': row['sales_count_sum'] or 0,
+            'returns_amount': row['returns_amount_sum'] or ZERO,
+            'returns_count': row['returns_count_sum'] or 0,
+            'payment_amount': row['payment_amount_sum'] or ZERO,
+            'returned_payment_amount': row['returned_payment_amount_sum'] or ZERO,
+        }
+        for row in closed_rows
+    ]
+    rows += [
+        {
+            'period': rollup.day,
+            'channel': rollup.channel,
+            'cashier': rollup.cashier_id,
+            'cashier_username': rollup.cashier_username,
+            'cashier_name': rollup.cashier_name,
+            'sales_username': rollup.sales_username,
+            'payment_method': rollup.payment_method,
+            'split_payment': rollup.split_payment,
+            'sales_amount': rollup.sales_amount,
+            'sales_count': rollup.sales_count,
+            'returns_amount': rollup.returns_amount,
+            'returns_count': rollup.returns_count,
+            'payment_amount': rollup.payment_amount,
+            'returned_payment_amount': rollup.returned_payment_amount,
+        }
+        for rollup in compute_rollups(today, today)
+    ]
+
+    def period_key(value):
+        if period == 'month':
+            first_of_month = value.replace(day=1)
+            return timezone.make_aware(datetime.combine(first_of_month, time.min))
+        return value
+
+    # [sales_amount, sales_count, returns_amount, returns_count] per cashier group
+    cashier_totals = defaultdict(lambda: [ZERO, 0, ZERO, 0])
+    payment_totals = defaultdict(lambda: ZERO)
+
+    for row in rows:
+        key = period_key(row['period'])
+        channel = row['channel']
+        if row['split_payment']:
+            include_returned = INCLUDE_RETURNED_PAYMENTS[(period, channel, True)]
+        else:
+            include_returned = INCLUDE_RETURNED_PAYMENTS[(period, channel, False)]
+            cashier_key = (channel, key, row['cashier'], row['cashier_username'],
+                           row['cashier_name'], row['sales_username'])
+            totals = cashier_totals[cashier_key]
+            totals[0] += row['sales_amount']
+            totals[1] += row['sales_count']
+            totals[2] += row['returns_amount']
+            totals[3] += row['returns_count']
+            if row['payment_method'] == 'Split':
+                continue
+
+        amount = row['payment_amount']
+        if include_returned:
+            amount += row['returned_payment_amount']
+        payment_totals[(channel, row['split_payment'], key, row['payment_method'])] += amount
+
+    report = {name: [] for name in (
+        'retail_sales', 'wholesale_sales', 'retail_returns', 'wholesale_returns',
+        'retail_payments', 'wholesale_payments', 'retail_split_payments', 'wholesale_split_payments',
+    )}
+
+    for (channel, key, cashier_id, cashier_username, cashier_name, sales_username), totals in cashier_totals.items():
+        sales_amount, sales_count, returns_amount, returns_count = totals
+        cashier_fields = {
+            period: key,
+            'cashier_username': cashier_username,
+            'cashier_display': cashier_name,
+            'sales_username': sales_username,
+            'cashier__id': cashier_id,
+        }
+        if sales_count:
+            report[f'{channel}_sales'].append(
+                dict(cashier_fields, total_sales=sales_amount, transaction_count=sales_count)
+            )
+        if returns_count:
+            report[f'{channel}_returns'].append(
+                dict(cashier_fields, total_returns=returns_amount, transaction_count=returns_count)
+            )
+
+    for (channel, split_payment, key, payment_method), amount in payment_totals.items():
+        name = f'{channel}_split_payments' if split_payment else f'{channel}_payments'
+        report[name].append({period: key, 'payment_method': payment_method, 'total_amount': amount})
+
+    return report
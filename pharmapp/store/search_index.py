@@ -0,0 +1,204 @@
+"""
+Ranked item search backed by a token/trigram index.
+
+Searching with ``name__icontains`` cannot use the indexes on ``name`` and
+``brand``, so every keystroke in the dispense and store search boxes scans
+the item table. Instead each Item and WholesaleItem keeps a set of
+normalized ItemSearchTerm/WholesaleItemSearchTerm rows (maintained by
+store.signals) and ``ranked_search`` matches them in one query:
+
+    * prefix  - the query starts the item name ("para" -> "Paracetamol 500mg")
+    * token   - a query word starts a word of the name/brand ("500" -> "Paracetamol 500mg")
+    * trigram - enough three-letter slices match, which covers substrings
+                and small typos ("cetamol", "paracetmol")
+
+Prefix and token matches are range conditions and trigram matches equality
+conditions on the (kind, term) index, so the same query runs unchanged on
+SQLite and MySQL. Rows created with ``bulk_create`` or changed with
+``.update()`` bypass the signals; run ``rebuild_search_index`` after such
+imports.
+"""
+import logging
+import math
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, FilteredRelation, IntegerField, Max, Q, Value, When
+
+from .models import Item, ItemSearchTerm, SearchTerm, WholesaleItem, WholesaleItemSearchTerm
+
+logger = logging.getLogger(__name__)
+
+# Model -> (term model, indexed fields)
+SEARCH_INDEXES = {
+    Item: (ItemSearchTerm, ('name', 'brand')),
+    WholesaleItem: (WholesaleItemSearchTerm, ('name', 'brand', 'dosage_form')),
+}
+
+# Fraction of the query's trigrams an item needs for a fuzzy match
+SEARCH_TRIGRAM_MATCH = getattr(settings, 'SEARCH_TRIGRAM_MATCH', 0.6)
+
+TERM_MAX_LENGTH = SearchTerm._meta.get_field('term').max_length
+
+RANK_PREFIX = 3
+RANK_TOKEN = 2
+RANK_TRIGRAM = 1
+
+# Upper bound for "starts with" range conditions on the term column
+_RANGE_END = '\uffff'
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(text):
+    """Lowercase ``text``, strip accents and replace punctuation with single spaces"""
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _NON_ALNUM.sub(' ', text.lower()).strip()
+
+
+def trigrams(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+def index_terms(values):
+    """
+    Return the ``(kind, term)`` pairs indexed for the given field values.
+
+    Args:
+        values: Iterable of field values, name first (None and blanks are skipped)
+    """
+    terms = set()
+    for position, value in enumerate(values):
+        text = normalize(value)
+        if not text:
+            continue
+        if position == 0:
+            # Only the first field (the name) ranks as a prefix match
+            terms.add((SearchTerm.KIND_PREFIX, text[:TERM_MAX_LENGTH]))
+        for token in text.split():
+            terms.add((SearchTerm.KIND_TOKEN, token[:TERM_MAX_LENGTH]))
+            terms.update((SearchTerm.KIND_TRIGRAM, trigram) for trigram in trigrams(token))
+    return terms
+
+
+def index_item(item):
+    """
+    Bring the search terms of one Item or WholesaleItem up to date.
+
+    Returns:
+        bool: True if any terms were written
+    """
+    term_model, fields = SEARCH_INDEXES[type(item)]
+    terms = index_terms(getattr(item, field) for field in fields)
+    existing = set(term_model.objects.filter(item_id=item.pk).values_list('kind', 'term'))
+    if terms == existing:
+        return False
+
+    with transaction.atomic():
+        stale = existing - terms
+        if stale:
+            stale_filter = Q()
+            for kind, term in stale:
+                stale_filter |= Q(kind=kind, term=term)
+            term_model.objects.filter(stale_filter, item_id=item.pk).delete()
+        term_model.objects.bulk_create([
+            term_model(item_id=item.pk, kind=kind, term=term) for kind, term in terms - existing
+        ])
+    return True
+
+
+def rebuild_index(model, batch_size=500):
+    """
+    Rebuild the search terms of every row of ``model``.
+
+    Returns:
+        int: Number of items indexed
+    """
+    term_model, fields = SEARCH_INDEXES[model]
+    indexed = 0
+    with transaction.atomic():
+        term_model.objects.all().delete()
+        pending = []
+        for row in model.objects.order_by().values_list('id', *fields).iterator(chunk_size=batch_size):
+            pending.extend(term_model(item_id=row[0], kind=kind, term=term) for kind, term in index_terms(row[1:]))
+            indexed += 1
+            if len(pending) >= batch_size:
+                term_model.objects.bulk_create(pending, batch_size=batch_size)
+                pending = []
+        term_model.objects.bulk_create(pending, batch_size=batch_size)
+    logger.info(f"Rebuilt search index for {indexed} {model._meta.verbose_name_plural}")
+    return indexed
+
+
+def _starts_with(kind, prefix):
+    prefix = prefix[:TERM_MAX_LENGTH]
+    return Q(kind=kind, term__gte=prefix, term__lt=prefix + _RANGE_END)
+
+
+def _prefixed(condition, relation):
+    """Return ``condition`` (on term fields) as a condition on ``relation``"""
+    prefixed = Q(_connector=condition.connector, _negated=condition.negated)
+    for child in condition.children:
+        if isinstance(child, Q):
+            prefixed.children.append(_prefixed(child, relation))
+        else:
+            prefixed.children.append((f'{relation}__{child[0]}', child[1]))
+    return prefixed
+
+
+def ranked_search(queryset, query):
+    """
+    Search items by name/brand, best matches first.
+
+    Args:
+        queryset: Item or WholesaleItem queryset to search in (e.g. ``stock__gt=0``)
+        query: Text typed by the user
+
+    Returns:
+        QuerySet: Matching items annotated with ``search_rank`` (3 prefix,
+        2 token, 1 trigram) and ``search_hits``, ordered by rank, hits and
+        name. Slice it to limit the results.
+    """
+    text = normalize(query)
+    if not text:
+        return queryset.none()
+
+    tokens = text.split()
+    query_trigrams = set()
+    for token in tokens:
+        query_trigrams |= trigrams(token)
+
+    condition = _starts_with(SearchTerm.KIND_PREFIX, text)
+    for token in tokens:
+        condition |= _starts_with(SearchTerm.KIND_TOKEN, token)
+    if query_trigrams:
+        condition |= Q(kind=SearchTerm.KIND_TRIGRAM, term__in=sorted(query_trigrams))
+
+    term_model, _ = SEARCH_INDEXES[queryset.model]
+    matched_ids = term_model.objects.filter(condition).values('item_id')
+
+    # Items are found through the (kind, term) index; the filtered relation
+    # then joins only their matching terms for ranking
+    results = queryset.filter(pk__in=matched_ids).annotate(
+        matched_terms=FilteredRelation('search_terms', condition=_prefixed(condition, 'search_terms')),
+    ).annotate(
+        search_rank=Max(Case(
+            When(matched_terms__kind=SearchTerm.KIND_PREFIX, then=Value(RANK_PREFIX)),
+            When(matched_terms__kind=SearchTerm.KIND_TOKEN, then=Value(RANK_TOKEN)),
+            default=Value(RANK_TRIGRAM),
+            output_field=IntegerField(),
+        )),
+        search_hits=Count('matched_terms'),
+        search_trigram_hits=Count('matched_terms', filter=Q(matched_terms__kind=SearchTerm.KIND_TRIGRAM)),
+    )
+
+    required_trigrams = max(1, math.ceil(len(query_trigrams) * SEARCH_TRIGRAM_MATCH))
+    return results.filter(
+        Q(search_rank__gte=RANK_TOKEN) | Q(search_trigram_hits__gte=required_trigrams)
+    ).order_by('-search_rank', '-search_hits', 'name', 'pk')
+
@@ -0,0 +1,101 @@
+"""
+Signal handlers for the store app.
+"""
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from customer.models import Customer, WholesaleCustomer
+from supplier.models import Supplier
+from store.models import Item, WholesaleItem, Receipt, WholesaleReceipt, ReceiptPayment, WholesaleReceiptPayment, Notification
+from store.barcode_lookup import BARCODE_FIELDS, BARCODE_VALUE_FIELDS, barcode_cache, barcode_snapshot
+from store.offline_sync import record_tombstone
+from store.search_index import SEARCH_INDEXES, index_item
+from store.stock_alerts import record_item_save
+from store.notifications import record_notification_change
+from store.sales_rollup import local_day, schedule_day_refresh
+
+
+@receiver(post_save, sender=Receipt)
+@receiver(post_delete, sender=Receipt)
+@receiver(post_save, sender=WholesaleReceipt)
+@receiver(post_delete, sender=WholesaleReceipt)
+@receiver(post_save, sender=ReceiptPayment)
+@receiver(post_delete, sender=ReceiptPayment)
+@receiver(post_save, sender=WholesaleReceiptPayment)
+@receiver(post_delete, sender=WholesaleReceiptPayment)
+def refresh_sales_rollup(sender, instance, **kwargs):
+    """
+    Re-aggregate the sales rollup for the day a receipt or payment belongs to.
+
+    Only closed days are refreshed (today is aggregated live by the reports).
+    Moving a receipt to another date leaves the old day stale until
+    ``rebuild_sales_rollups`` is run for it.
+    """
+    schedule_day_refresh(local_day(instance.date))
+
+
+@receiver(post_delete, sender=Item)
+@receiver(post_delete, sender=WholesaleItem)
+@receiver(post_delete, sender=Customer)
+@receiver(post_delete, sender=WholesaleCustomer)
+@receiver(post_delete, sender=Supplier)
+def record_sync_tombstone(sender, instance, **kwargs):
+    """Record deleted offline-synced rows so terminals drop them on their next delta sync"""
+    record_tombstone(instance)
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+@receiver(post_save, sender=WholesaleItem)
+@receiver(post_delete, sender=WholesaleItem)
+def invalidate_barcode_cache(sender, instance, signal, created=False, update_fields=None, **kwargs):
+    """
+    Drop the cached barcode resolutions an item save or delete may have changed.
+
+    Saves that leave the barcode fields as loaded (stock edits, transfers,
+    sync) keep the cache, since lookups re-read the matched item anyway.
+    Otherwise only the codes that resolved to the item or contain its old or
+    new barcode values are dropped.
+    """
+    if update_fields and BARCODE_FIELDS.isdisjoint(update_fields):
+        return
+    loaded = getattr(instance, '_loaded_barcode', None) or {}
+    current = barcode_snapshot(instance)
+    if signal is post_save and not created and loaded == current and BARCODE_FIELDS.issubset(loaded):
+        return
+    barcode_cache.invalidate_item(
+        sender,
+        instance.pk,
+        [loaded.get(field) for field in BARCODE_VALUE_FIELDS] + [current.get(field) for field in BARCODE_VALUE_FIELDS],
+    )
+    instance._loaded_barcode = current
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=WholesaleItem)
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    """Re-index an item's name/brand terms; deleted items lose theirs by cascade"""
+    _, fields = SEARCH_INDEXES[sender]
+    if update_fields and not set(fields) & set(update_fields):
+        return
+    index_item(instance)
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=WholesaleItem)
+def detect_stock_threshold_crossing(sender, instance, update_fields=None, **kwargs):
+    """Alert when a save takes an item's stock to the low stock threshold or zero"""
+    if update_fields and 'stock' not in update_fields:
+        return
+    record_item_save(instance)
+
+
+@receiver(post_save, sender=Notification)
+def count_notification_save(sender, instance, created, **kwargs):
+    """Keep the unread notification badge (pharmapp.counters) in step"""
+    record_notification_change(instance, created=created)
+
+
+@receiver(post_delete, sender=Notification)
+def count_notification_delete(sender, instance, **kwargs):
+    record_notification_change(instance, deleted=True)
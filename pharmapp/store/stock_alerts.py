@@ -0,0 +1,138 @@
+"""
+Event-driven low/out of stock alerts.
+
+Instead of waiting for the periodic sweep (store.notifications), stock
+mutations report ``(item, old stock, new stock)`` here and a notification is
+created only when an item crosses a level:
+
+    * into ``low_stock`` when stock drops to the low stock threshold;
+    * into ``out_of_stock`` when stock drops to zero (or below).
+
+Item/WholesaleItem saves are reported by a post_save signal (store.signals),
+which compares against the stock the instance was loaded with. Queryset
+``.update()`` paths report explicitly (see store.checkout).
+
+Repeated alerts for the same item and level are suppressed for
+STOCK_ALERT_WINDOW_SECONDS: first through the cache, then, like the sweep,
+by the unread notification of the same type already stored for the item
+(written by another process, before a restart, or by the sweep). Notifications are created once the
+surrounding transaction commits, so a rolled back sale neither notifies nor
+starts a suppression window.
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Notification, StoreSettings, WholesaleItem, WholesaleSettings
+from pharmapp import counters
+from .notifications import STOCK_NOTIFICATION_WINDOW_HOURS, SYSTEM_UNREAD_COUNTER, NotificationService
+
+logger = logging.getLogger(__name__)
+
+STOCK_ALERT_WINDOW_SECONDS = getattr(settings, 'STOCK_ALERT_WINDOW_SECONDS',
+                                     STOCK_NOTIFICATION_WINDOW_HOURS * 3600)
+
+LEVEL_OK = 0
+LEVEL_LOW = 1
+LEVEL_OUT = 2
+
+
+def stock_level(stock, threshold):
+    if stock <= 0:
+        return LEVEL_OUT
+    if stock <= threshold:
+        return LEVEL_LOW
+    return LEVEL_OK
+
+
+def low_stock_threshold(model):
+    settings_model = WholesaleSettings if model is WholesaleItem else StoreSettings
+    return settings_model.get_settings().low_stock_threshold
+
+
+def record_stock_changes(model, changes):
+    """
+    Emit alerts for items whose stock crossed the low stock threshold or zero.
+
+    Crossings are evaluated and written after the surrounding transaction
+    commits, so callers holding row locks pay no extra queries.
+
+    Args:
+        model: Item or WholesaleItem
+        changes: Iterable of ``(item, old_stock, new_stock)``; ``item`` needs
+            ``pk``, ``name`` and ``unit``. Unknown (None) stock is ignored.
+    """
+    drops = [
+        (item, old, new) for item, old, new in changes
+        if old is not None and new is not None and new < old
+    ]
+    if drops:
+        transaction.on_commit(lambda: _emit_alerts(model, drops))
+
+
+def record_item_save(instance):
+    """Report a saved Item/WholesaleItem against the stock it was loaded with"""
+    model = type(instance)
+    old = instance.__dict__.get('_loaded_stock')
+    new = instance.stock
+    if hasattr(new, 'resolve_expression'):
+        if old is None:
+            return
+        # Saved as an F() expression; read back the value it produced
+        new = model.objects.filter(pk=instance.pk).values_list('stock', flat=True).first()
+    instance._loaded_stock = new
+    record_stock_changes(model, [(instance, old, new)])
+
+
+def _alert_key(model, item_id, notification_type):
+    return f'stock_alert:{model._meta.label_lower}:{item_id}:{notification_type}'
+
+
+def _already_alerted(model, crossings):
+    """``(item id, notification type)`` pairs with an unread alert inside the window"""
+    related_field = 'related_wholesale_item' if model is WholesaleItem else 'related_item'
+    cutoff = timezone.now() - timedelta(seconds=STOCK_ALERT_WINDOW_SECONDS)
+    return set(
+        Notification.objects.filter(
+            **{f'{related_field}__in': {item.pk for item, _, _ in crossings}},
+            notification_type__in={notification_type for _, _, notification_type in crossings},
+            is_read=False,
+            created_at__gte=cutoff,
+        ).values_list(f'{related_field}_id', 'notification_type')
+    )
+
+
+def _emit_alerts(model, drops):
+    threshold = low_stock_threshold(model)
+    is_wholesale = model is WholesaleItem
+    crossings = []
+    for item, old, new in drops:
+        level = stock_level(new, threshold)
+        if level <= stock_level(old, threshold):
+            continue
+        notification_type = 'out_of_stock' if level == LEVEL_OUT else 'low_stock'
+        if not cache.add(_alert_key(model, item.pk, notification_type), True, STOCK_ALERT_WINDOW_SECONDS):
+            continue
+        crossings.append((item, new, notification_type))
+    if not crossings:
+        return
+
+    # The cache only knows this process's alerts since it started
+    alerted = _already_alerted(model, crossings)
+    notifications = []
+    for item, new, notification_type in crossings:
+        if (item.pk, notification_type) in alerted:
+            continue
+        if notification_type == 'out_of_stock':
+            notifications.append(NotificationService._out_of_stock_notification(item, is_wholesale))
+        else:
+            notifications.append(NotificationService._low_stock_notification(item, is_wholesale, stock=new))
+
+    if notifications:
+        Notification.objects.bulk_create(notifications)
+        counters.adjust(SYSTEM_UNREAD_COUNTER, len(notifications))
+        logger.info(f"Created {len(notifications)} stock alerts for {model._meta.verbose_name_plural}")
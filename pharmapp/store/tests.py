@@ -1,10 +1,26 @@
+import json
 from django.test import TestCase, Client
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from decimal import Decimal
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+from django.utils import timezone
+from django.core.cache import cache
 from supplier.models import Supplier, Procurement, ProcurementItem, WholesaleProcurement, WholesaleProcurementItem
 from userauth.models import Profile
+from store.models import (
+    Item, Sales, PaymentRequest, PaymentRequestItem, DispensingLog,
+    Receipt, ReceiptPayment, SalesRollup, SalesRollupDay, SyncTombstone,
+    WholesaleItem, ItemSearchTerm, Notification, StoreSettings, WholesaleSettings
+)
+from store.checkout import checkout_payment_items, InsufficientStockError
+from store.sales_rollup import get_sales_report_rows
+from store.offline_sync import ChangeFeedPage, InvalidSyncToken
+from store.gs1_parser import GS1Parser, parse_barcode, parse_barcodes
+from store.search_index import ranked_search
+from store.notifications import NotificationService
+from store.views import get_daily_sales
+from utils.pagination import KeysetPaginator
 
 User = get_user_model()
 
@@ -199,3 +215,464 @@ class SupplierAnalyticsIntegrationTestCase(TestCase):
         self.assertContains(response, 'Performance Dashboard')
         self.assertContains(response, 'Advanced Search')
         self.assertContains(response, 'Supplier Comparison')
+
+
+class CheckoutEngineTestCase(TestCase):
+    """Test cases for the batched checkout engine"""
+
+    def setUp(self):
+        """Set up a dispenser, a payment request and some stocked items"""
+        self.dispenser = User.objects.create_user(
+            username='dispenser',
+            mobile='5550001111',
+            password='testpass123'
+        )
+        self.items = [
+            Item.objects.create(name=f'Checkout Item {i}', cost=Decimal('10.00'),
+                                price=Decimal('12.00'), stock=Decimal('20'))
+            for i in range(10)
+        ]
+        self.payment_request = PaymentRequest.objects.create(
+            dispenser=self.dispenser,
+            payment_type='retail',
+            total_amount=Decimal('0')
+        )
+
+    def make_lines(self, items, quantity=Decimal('2')):
+        return [
+            PaymentRequestItem.objects.create(
+                payment_request=self.payment_request,
+                item_name=item.name,
+                unit='Pcs',
+                quantity=quantity,
+                unit_price=item.price,
+                subtotal=item.price * quantity,
+                retail_item=item
+            )
+            for item in items
+        ]
+
+    def make_sales(self):
+        return Sales.objects.create(user=self.dispenser, total_amount=Decimal('0'))
+
+    def test_checkout_deducts_stock_and_records_lines(self):
+        """Test stock is deducted and sales items/dispensing logs are created"""
+        lines = self.make_lines(self.items[:3])
+        sales = self.make_sales()
+
+        checkout_payment_items(sales, lines, self.dispenser)
+
+        for item in self.items[:3]:
+            item.refresh_from_db()
+            self.assertEqual(item.stock, Decimal('18'))
+        self.assertEqual(sales.sales_items.count(), 3)
+        self.assertEqual(DispensingLog.objects.filter(user=self.dispenser).count(), 3)
+
+    def test_query_count_is_independent_of_basket_size(self):
+        """Test a 10-line basket costs the same number of queries as a 1-line basket"""
+        single = self.make_lines(self.items[:1])
+        basket = self.make_lines(self.items)
+
+        first_sales, second_sales = self.make_sales(), self.make_sales()
+
+        # lock + update + sales items + dispensing logs
+        with self.assertNumQueries(4):
+            checkout_payment_items(first_sales, single, self.dispenser)
+        with self.assertNumQueries(4):
+            checkout_payment_items(second_sales, basket, self.dispenser)
+
+    def test_insufficient_stock_writes_nothing(self):
+        """Test an oversized line raises before any stock or log is written"""
+        lines = self.make_lines(self.items[:2]) + self.make_lines(self.items[2:3], quantity=Decimal('50'))
+        sales = self.make_sales()
+
+        with self.assertRaises(InsufficientStockError) as ctx:
+            checkout_payment_items(sales, lines, self.dispenser)
+
+        self.assertEqual(ctx.exception.item_name, self.items[2].name)
+        self.items[0].refresh_from_db()
+        self.assertEqual(self.items[0].stock, Decimal('20'))
+        self.assertFalse(sales.sales_items.exists())
+        self.assertFalse(DispensingLog.objects.exists())
+
+    def test_repeated_item_lines_are_validated_together(self):
+        """Test two lines for the same item cannot oversell it"""
+        lines = self.make_lines([self.items[0]], quantity=Decimal('15'))
+        lines += self.make_lines([self.items[0]], quantity=Decimal('15'))
+
+        with self.assertRaises(InsufficientStockError):
+            checkout_payment_items(self.make_sales(), lines, self.dispenser)
+
+
+class SalesRollupTestCase(TestCase):
+    """Test cases for the daily sales rollup tables behind the sales reports"""
+
+    def setUp(self):
+        """Set up receipts on a closed day and on today"""
+        self.user = User.objects.create_user(
+            username='rollup',
+            mobile='5550002222',
+            password='testpass123'
+        )
+        self.today = timezone.localdate()
+        self.past_day = self.today - timedelta(days=3)
+        self.past_receipt = self.make_receipt(self.past_day, Decimal('100.00'), 'Cash')
+        self.make_receipt(self.past_day, Decimal('50.00'), 'Transfer')
+        self.make_receipt(self.today, Decimal('30.00'), 'Cash')
+
+        split = self.make_receipt(self.past_day, Decimal('80.00'), 'Split')
+        ReceiptPayment.objects.create(receipt=split, amount=Decimal('60.00'),
+                                      payment_method='Cash', date=split.date)
+        ReceiptPayment.objects.create(receipt=split, amount=Decimal('20.00'),
+                                      payment_method='Wallet', date=split.date)
+
+    def make_receipt(self, day, amount, payment_method):
+        sales = Sales.objects.create(user=self.user, total_amount=amount)
+        noon = timezone.make_aware(datetime.combine(day, datetime.min.time()).replace(hour=12))
+        return Receipt.objects.create(sales=sales, total_amount=amount, payment_method=payment_method,
+                                      status='Paid', date=noon)
+
+    def daily_totals(self):
+        return {day: data['total_sales'] for day, data in get_daily_sales()}
+
+    def test_report_materializes_closed_days(self):
+        """Test reading the report builds rollups for closed days and keeps today live"""
+        totals = self.daily_totals()
+
+        self.assertEqual(totals[self.past_day], Decimal('230.00'))
+        self.assertEqual(totals[self.today], Decimal('30.00'))
+        self.assertTrue(SalesRollupDay.objects.filter(day=self.past_day).exists())
+        self.assertFalse(SalesRollup.objects.filter(day=self.today).exists())
+
+    def test_split_payments_come_from_payment_records(self):
+        """Test split receipts report their individual payment methods"""
+        rows = get_sales_report_rows('day')
+        split_methods = {row['payment_method']: row['total_amount'] for row in rows['retail_split_payments']
+                         if row['day'] == self.past_day}
+
+        self.assertEqual(split_methods, {'Cash': Decimal('60.00'), 'Wallet': Decimal('20.00')})
+
+    def test_editing_a_closed_day_refreshes_its_rollup(self):
+        """Test saving a receipt from a closed day re-aggregates that day"""
+        self.daily_totals()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.past_receipt.total_amount = Decimal('150.00')
+            self.past_receipt.save()
+
+        self.assertEqual(self.daily_totals()[self.past_day], Decimal('280.00'))
+
+
+class OfflineSyncFeedTestCase(TestCase):
+    """Test cases for the offline sync change feed behind api/data/initial/"""
+
+    def setUp(self):
+        """Set up a small catalogue"""
+        self.client = Client()
+        self.items = [
+            Item.objects.create(name=f'Sync Item {i}', cost=Decimal('5.00'), price=Decimal('6.00'), stock=Decimal('3'))
+            for i in range(7)
+        ]
+
+    def fetch(self, token=None, limit=None):
+        params = {}
+        if token:
+            params['since'] = token
+        if limit:
+            params['limit'] = limit
+        response = self.client.get(reverse('api:get_initial_data'), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_full_snapshot_is_paged_without_gaps(self):
+        """Test paging a snapshot returns every row exactly once"""
+        seen = []
+        token = None
+        pages = 0
+        while True:
+            data = self.fetch(token, limit=3)
+            pages += 1
+            self.assertTrue(data['full'])
+            seen += [row['id'] for row in data['inventory']]
+            token = data['sync_token']
+            if not data['has_more']:
+                break
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(sorted(seen), sorted(item.id for item in self.items))
+
+    def test_delta_returns_only_changed_and_deleted_rows(self):
+        """Test a delta token returns rows changed and deleted since the snapshot"""
+        token = self.fetch()['sync_token']
+
+        # Move the snapshot outside the overlap window
+        Item.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        changed, deleted = self.items[0], self.items[1]
+        changed.stock = Decimal('1')
+        changed.save()
+        deleted_id = deleted.id
+        deleted.delete()
+
+        data = self.fetch(token)
+
+        self.assertFalse(data['full'])
+        self.assertEqual([row['id'] for row in data['inventory']], [changed.id])
+        self.assertEqual(data['inventory'][0]['stock'], '1.00')
+        self.assertEqual(data['deleted']['inventory'], [deleted_id])
+        self.assertTrue(SyncTombstone.objects.filter(collection='inventory', object_id=deleted_id).exists())
+
+    def test_invalid_token_is_rejected(self):
+        """Test a malformed token returns 400 instead of a snapshot"""
+        response = self.client.get(reverse('api:get_initial_data'), {'since': 'not-a-token'})
+        self.assertEqual(response.status_code, 400)
+        with self.assertRaises(InvalidSyncToken):
+            ChangeFeedPage.from_request('not-a-token')
+
+
+class GS1ParserTestCase(TestCase):
+    """Test cases for the memoized GS1 parser"""
+
+    BARCODES = [
+        'NAVIDOXINE(01) 18906047654987(10) 250203 (17) 012028(21) NVDXN0225',
+        '(01)18906047654987(17)280201(10)B12',
+        'AMOXIL (01) 08906047654987 (11) 311299 (310) 0.5kg (99) X',
+        '(01)123(17)999999(15)',
+        '5901234123457',
+        '12-34',
+        '',
+        None,
+    ]
+
+    def test_results_match_reference_parser(self):
+        """Test parse_barcodes returns exactly what GS1Parser.parse returns"""
+        expected = [GS1Parser().parse(barcode) for barcode in self.BARCODES]
+        self.assertEqual(parse_barcodes(self.BARCODES), expected)
+        # Served from the memo the second time
+        self.assertEqual(parse_barcodes(self.BARCODES), expected)
+
+    def test_memoized_results_are_copies(self):
+        """Test callers mutating a result do not affect later parses"""
+        first = parse_barcode(self.BARCODES[0])
+        first['gtin'] = ''
+        first['parsed_data']['gtin'] = ''
+
+        second = parse_barcode(self.BARCODES[0])
+        self.assertEqual(second['gtin'], '18906047654987')
+        self.assertEqual(second['parsed_data']['gtin'], '18906047654987')
+
+
+class SearchIndexTestCase(TestCase):
+    """Test cases for the ranked item search index"""
+
+    def setUp(self):
+        for name, brand in [('Paracetamol 500mg', 'Emzor'), ('Panadol Extra', 'GSK'),
+                            ('Ibuprofen', 'Para Pharma'), ('Amoxicillin', 'Beecham')]:
+            Item.objects.create(name=name, brand=brand, stock=Decimal('5'))
+
+    def names(self, query, queryset=None):
+        return [item.name for item in ranked_search(Item.objects.all() if queryset is None else queryset, query)]
+
+    def test_results_are_ranked_prefix_token_fuzzy(self):
+        """Test name prefixes rank above word matches, and substrings and typos still match"""
+        self.assertEqual(self.names('para'), ['Paracetamol 500mg', 'Ibuprofen'])
+        self.assertEqual(self.names('500'), ['Paracetamol 500mg'])
+        self.assertEqual(self.names('cetamol'), ['Paracetamol 500mg'])
+        self.assertEqual(self.names('paracetmol'), ['Paracetamol 500mg'])
+        self.assertEqual(self.names('zzz'), [])
+
+    def test_search_is_one_query_and_follows_saves(self):
+        """Test a search costs one query and renamed or deleted items are re-indexed"""
+        with self.assertNumQueries(1):
+            self.assertEqual(self.names('amox', Item.objects.filter(stock__gt=0)), ['Amoxicillin'])
+
+        item = Item.objects.get(name='Amoxicillin')
+        item.name = 'Augmentin'
+        item.save()
+        self.assertEqual(self.names('amox'), [])
+        self.assertEqual(self.names('augm'), ['Augmentin'])
+
+        item.delete()
+        self.assertFalse(ItemSearchTerm.objects.filter(item_id=item.id).exists())
+
+    def test_wholesale_search_shares_the_index(self):
+        """Test wholesale items are searched the same way, including dosage form"""
+        WholesaleItem.objects.create(name='Ciprofloxacin', brand='Bayer', dosage_form='Tablet',
+                                     stock=Decimal('2'))
+
+        self.assertEqual(self.names('cipro', WholesaleItem.objects.all()), ['Ciprofloxacin'])
+        self.assertEqual(self.names('tablet', WholesaleItem.objects.all()), ['Ciprofloxacin'])
+
+
+class StockNotificationTestCase(TestCase):
+    """Test cases for the set-based stock notification check"""
+
+    def setUp(self):
+        StoreSettings.get_settings()
+        WholesaleSettings.get_settings()
+
+    def create_items(self, count):
+        for i in range(count):
+            Item.objects.create(name=f'Retail {i}', unit='Pcs', stock=Decimal(i % 3))
+            WholesaleItem.objects.create(name=f'Wholesale {i}', unit='Ctn', stock=Decimal('0' if i % 2 else '500'))
+
+    def test_query_count_does_not_depend_on_catalogue_size(self):
+        """Test settings, one select per item table and one insert, for any number of items"""
+        self.create_items(3)
+        with self.assertNumQueries(5):
+            self.assertEqual(NotificationService.check_and_create_stock_notifications(), 4)
+
+        self.create_items(30)
+        with self.assertNumQueries(5):
+            self.assertEqual(NotificationService.check_and_create_stock_notifications(), 45)
+
+    def test_recently_notified_items_are_skipped(self):
+        """Test the anti-join skips items notified within the window"""
+        self.create_items(2)
+        NotificationService.check_and_create_stock_notifications()
+
+        with self.assertNumQueries(4):
+            self.assertEqual(NotificationService.check_and_create_stock_notifications(), 0)
+
+        Notification.objects.update(created_at=timezone.now() - timedelta(hours=25))
+        self.assertEqual(NotificationService.check_and_create_stock_notifications(), 3)
+
+        out_of_stock = Notification.objects.get(related_item__name='Retail 0', created_at__gte=timezone.now() - timedelta(hours=1))
+        self.assertEqual(out_of_stock.notification_type, 'out_of_stock')
+        self.assertEqual(out_of_stock.message, "Retail item 'Retail 0' is completely out of stock!")
+        low = Notification.objects.filter(related_item__name='Retail 1').first()
+        self.assertEqual(low.message, "Retail item 'Retail 1' is running low on stock. Current stock: 1.00 Pcs")
+
+
+class NotificationReadTestCase(TestCase):
+    """Test cases for bulk mark-as-read of notifications"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reader', mobile='0700000001', password='pass12345')
+
+    def test_mark_as_read_is_one_update(self):
+        """Test a queryset of unread notifications is marked read with one select and one update"""
+        for i in range(5):
+            Notification.objects.create(user=self.user, notification_type='system_message', title=f'U{i}', message='m')
+            Notification.objects.create(notification_type='system_message', title=f'S{i}', message='m')
+        self.assertEqual(NotificationService.get_cached_unread_count(self.user), 10)
+
+        with self.assertNumQueries(2):
+            self.assertEqual(NotificationService.get_unread_notifications(self.user).mark_as_read(), 10)
+
+        self.assertEqual(NotificationService.get_cached_unread_count(self.user), 0)
+        self.assertFalse(Notification.objects.filter(read_at__isnull=True).exists())
+
+
+class StockAlertTestCase(TestCase):
+    """Test cases for stock threshold alerts raised by stock mutations"""
+
+    def setUp(self):
+        cache.clear()
+        settings = StoreSettings.get_settings()
+        settings.low_stock_threshold = 5
+        settings.save()
+        self.item = Item.objects.create(name='Alert Item', unit='Pcs', stock=Decimal('8'))
+
+    def set_stock(self, stock):
+        item = Item.objects.get(pk=self.item.pk)
+        item.stock = Decimal(stock)
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+
+    def alerts(self):
+        return list(Notification.objects.filter(related_item=self.item).order_by('id')
+                    .values_list('notification_type', flat=True))
+
+    def test_alerts_only_on_crossings(self):
+        """Test a notification is created when stock crosses the threshold and zero, not on every change"""
+        self.set_stock('6')
+        self.assertEqual(self.alerts(), [])
+
+        self.set_stock('5')
+        self.set_stock('3')
+        self.assertEqual(self.alerts(), ['low_stock'])
+
+        self.set_stock('0')
+        self.assertEqual(self.alerts(), ['low_stock', 'out_of_stock'])
+
+    def test_repeat_crossings_are_deduplicated(self):
+        """Test restocking and selling down again within the window does not re-alert"""
+        self.set_stock('4')
+        self.set_stock('20')
+        self.set_stock('2')
+        self.assertEqual(self.alerts(), ['low_stock'])
+
+    def test_stored_alerts_suppress_duplicates_without_the_cache(self):
+        """Test an unread alert written by the sweep or another process is not repeated"""
+        self.set_stock('4')
+        NotificationService.check_and_create_stock_notifications()
+        cache.clear()  # a restart, or another worker
+        self.set_stock('20')
+        self.set_stock('3')
+        self.assertEqual(self.alerts(), ['low_stock'])
+
+        Notification.objects.filter(related_item=self.item).update(is_read=True)
+        cache.clear()
+        self.set_stock('20')
+        self.set_stock('3')
+        self.assertEqual(self.alerts(), ['low_stock', 'low_stock'])
+
+    def test_checkout_reports_crossings(self):
+        """Test stock sold through the checkout engine raises alerts after commit"""
+        dispenser = User.objects.create_user(username='alert-dispenser', mobile='5550002222', password='testpass123')
+        payment_request = PaymentRequest.objects.create(dispenser=dispenser, payment_type='retail',
+                                                        total_amount=Decimal('8'))
+        line = PaymentRequestItem.objects.create(payment_request=payment_request, item_name=self.item.name,
+                                                 unit='Pcs', quantity=Decimal('8'), unit_price=Decimal('1'),
+                                                 subtotal=Decimal('8'), retail_item=self.item)
+        sales = Sales.objects.create(user=dispenser, total_amount=Decimal('8'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            checkout_payment_items(sales, [line], dispenser)
+
+        self.assertEqual(self.alerts(), ['out_of_stock'])
+
+
+class KeysetPaginationTestCase(TestCase):
+    """Test cases for cursor pagination on (created_at, id)"""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='dispenser', mobile='0700000009', password='pass12345')
+        now = timezone.now()
+        # Pairs of rows share a timestamp, so the id tie-breaker matters
+        for i in range(7):
+            DispensingLog.objects.create(user=user, name=f'Drug {i}', created_at=now - timedelta(minutes=i // 2))
+        self.expected = list(DispensingLog.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+    def paginator(self, **kwargs):
+        return KeysetPaginator(DispensingLog.objects.all(), 3, ordering=('-created_at', '-id'), **kwargs)
+
+    def test_pages_cover_every_row_once(self):
+        """Test following next cursors visits each row once, in order"""
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(1):
+                page = self.paginator().page(cursor)
+            seen.extend(log.pk for log in page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, self.expected)
+        self.assertTrue(page.has_previous)
+
+        previous = self.paginator().page(page.previous_cursor)
+        self.assertEqual([log.pk for log in previous], self.expected[3:6])
+        self.assertTrue(previous.has_next and previous.has_previous)
+
+    def test_invalid_cursor_and_estimated_count(self):
+        """Test a malformed cursor shows the first page and the count is cached"""
+        page = self.paginator(count=True).page('not-a-cursor')
+        self.assertEqual([log.pk for log in page], self.expected[:3])
+        self.assertFalse(page.has_previous)
+        self.assertEqual(page.count, 7)
+
+        DispensingLog.objects.filter(pk=self.expected[0]).delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.paginator(count=True).count, 7)
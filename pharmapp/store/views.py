@@ -1,6 +1,7 @@
 from django.views.decorators.http import require_http_methods
 from django.core.cache import cache
 from django.core.paginator import Paginator
+from utils.pagination import KeysetPaginator, pagination_params
 from django.db import transaction, IntegrityError
 from collections import defaultdict
 from decimal import Decimal
@@ -43,6 +44,13 @@ from .models import TransferRequest, WholesaleItem
 # Import GS1 barcode parser
 from .gs1_parser import parse_barcode, is_gs1_barcode
 
+# Batched checkout engine for payment completion
+from .checkout import checkout_payment_items, InsufficientStockError
+
+# Pre-aggregated daily sales for the sales reports
+from .sales_rollup import get_sales_report_rows
+from .search_index import ranked_search
+
 # Import ActivityLog for audit trail
 from userauth.models import ActivityLog
 
@@ -78,8 +86,9 @@ def get_cached_search_results(cache_key):
             
         # Check if it's a list of primary keys (from queryset caching)
         if isinstance(cached_data, list) and len(cached_data) > 0 and isinstance(cached_data[0], int):
-            # Reconstruct the queryset from primary keys
-            return Item.objects.filter(pk__in=cached_data).order_by('name')
+            # Reconstruct the queryset from primary keys, keeping the cached (ranked) order
+            cached_order = Case(*[When(pk=pk, then=position) for position, pk in enumerate(cached_data)])
+            return Item.objects.filter(pk__in=cached_data).order_by(cached_order)
         
         # Return as-is if it's already a list of items
         return cached_data
@@ -155,15 +164,7 @@ def login_view(request):
                         'user_type': 'Salesperson'  # Default role for users without profile
                     })
 
-                # Set user chat status to online
-                from chat.models import UserChatStatus
-                user_chat_status, created = UserChatStatus.objects.get_or_create(
-                    user=user,
-                    defaults={'is_online': True, 'last_seen': timezone.now()}
-                )
-                user_chat_status.is_online = True
-                user_chat_status.last_seen = timezone.now()
-                user_chat_status.save()
+                # Chat presence is recorded by the user_logged_in signal (chat.signals)
 
                 next_url = request.GET.get('next', 'store:dashboard')
                 messages.success(request, f'Welcome back, {user.username or user.mobile}!')
@@ -260,19 +261,7 @@ def dashboard(request):
 
 
 def logout_user(request):
-    # Set user chat status to offline before logout
-    if request.user.is_authenticated:
-        from chat.models import UserChatStatus
-        try:
-            user_chat_status = UserChatStatus.objects.filter(user=request.user).first()
-            if user_chat_status:
-                user_chat_status.is_online = False
-                user_chat_status.last_seen = timezone.now()
-                user_chat_status.save()
-        except Exception:
-            # Silently handle any errors to avoid breaking logout process
-            pass
-    
+    # Chat presence is cleared by the user_logged_out signal (chat.signals)
     logout(request)
     return redirect('store:dashboard')
 
@@ -479,28 +468,17 @@ def search_item(request):
             # Check if query looks like a barcode (numeric, 8-14 digits)
             is_barcode = query.isdigit() and 8 <= len(query) <= 14
 
-            # Optimized search with better performance
-            # Use istartswith for better index utilization, fallback to icontains
+            # Ranked name/brand search through the search index
             if len(query) >= 2:  # Only search if query is meaningful
                 if is_barcode:
                     # Try barcode lookup first
                     items = Item.objects.filter(barcode=query).order_by('name')[:50]
                     if not items.exists():
                         # Fallback to name/brand search if barcode not found
-                        items = Item.objects.filter(
-                            Q(name__istartswith=query) |
-                            Q(brand__istartswith=query) |
-                            Q(name__icontains=query) |
-                            Q(brand__icontains=query)
-                        ).distinct().order_by('name')[:50]
+                        items = ranked_search(Item.objects.all(), query)[:50]
                 else:
                     # Regular name/brand search
-                    items = Item.objects.filter(
-                        Q(name__istartswith=query) |  # Faster prefix search
-                        Q(brand__istartswith=query) |
-                        Q(name__icontains=query) |  # Fallback for partial matches
-                        Q(brand__icontains=query)
-                    ).distinct().order_by('name')[:50]  # Limit results for performance
+                    items = ranked_search(Item.objects.all(), query)[:50]  # Limit results for performance
             else:
                 items = Item.objects.none()  # Don't search for very short queries
         else:
@@ -627,10 +605,8 @@ def dispense(request):
                         # Use cached results directly
                         results = cached_results
                     else:
-                        # Optimized database query
-                        results = Item.objects.filter(
-                            Q(name__icontains=q) | Q(brand__icontains=q)
-                        ).filter(stock__gt=0).order_by('name')[:50]  # Only show items with stock > 0, limit for performance
+                        # Ranked search of items with stock > 0, limited for performance
+                        results = ranked_search(Item.objects.filter(stock__gt=0), q)[:50]
 
                         # Cache the results for 5 minutes
                         cache_search_results(cache_key, results)
@@ -707,14 +683,10 @@ def dispense_search_items(request):
                             results = barcode_results
                         else:
                             # Fallback to name/brand search if barcode not found
-                            results = Item.objects.filter(
-                                Q(name__icontains=query) | Q(brand__icontains=query)
-                            ).filter(stock__gt=0).order_by('name')[:50]
+                            results = ranked_search(Item.objects.filter(stock__gt=0), query)[:50]
                     else:
                         # Regular name/brand search
-                        results = Item.objects.filter(
-                            Q(name__icontains=query) | Q(brand__icontains=query)
-                        ).filter(stock__gt=0).order_by('name')[:50]
+                        results = ranked_search(Item.objects.filter(stock__gt=0), query)[:50]
 
                     # Cache the results for 5 minutes
                     cache_search_results(cache_key, results)
@@ -1906,49 +1878,16 @@ def complete_payment_request(request, request_id):
                 print(f"Receipt customer: {receipt.customer}")
                 print(f"==========================\n")
 
-                # Create sales items from payment request items
-                for payment_item in payment_request.items.all():
-                    if payment_item.retail_item:
-                        # Lock the item row for update to prevent race conditions (skip for SQLite)
-                        if connection.vendor == 'sqlite':
-                            item = Item.objects.get(id=payment_item.retail_item.id)
-                        else:
-                            item = Item.objects.select_for_update().get(id=payment_item.retail_item.id)
-
-                        # Validate stock availability before deduction
-                        if item.stock < payment_item.quantity:
-                            # Rollback will happen automatically due to @transaction.atomic
-                            messages.error(
-                                request,
-                                f"Insufficient stock for {item.name}. Available: {item.stock}, Required: {payment_item.quantity}"
-                            )
-                            return redirect('store:cashier_dashboard')
-
-                        SalesItem.objects.create(
-                            sales=sales,
-                            item=item,
-                            price=payment_item.unit_price,
-                            quantity=payment_item.quantity,
-                            discount_amount=payment_item.discount_amount,
-                            brand=payment_item.brand
-                        )
+                # Create sales items, deduct stock and log dispensing in one batch
+                payment_items = list(payment_request.items.all())
+                try:
+                    checkout_payment_items(sales, payment_items, payment_request.dispenser)
+                except InsufficientStockError as e:
+                    # Returning normally would commit the sale created above
+                    transaction.set_rollback(True)
+                    messages.error(request, str(e))
+                    return redirect('store:cashier_dashboard')
 
-                        # Deduct stock (ONLY place where stock is deducted)
-                        item.stock -= payment_item.quantity
-                        item.save()
-                        
-                        # Create dispensing log
-                        DispensingLog.objects.create(
-                            user=payment_request.dispenser,
-                            name=payment_item.item_name,
-                            brand=payment_item.brand,
-                            unit=payment_item.unit,
-                            quantity=payment_item.quantity,
-                            amount=payment_item.subtotal,
-                            discount_amount=payment_item.discount_amount,
-                            status='Dispensed'
-                        )
-                
                 # Handle wallet deduction for single payment
                 if payment_type == 'single' and payment_method == 'Wallet' and payment_request.customer:
                     try:
@@ -2097,9 +2036,9 @@ def complete_payment_request(request, request_id):
                 try:
                     cart_items = Cart.objects.filter(user=payment_request.dispenser)
                     # Remove cart items that correspond to the payment request items
-                    for payment_item in payment_request.items.all():
-                        if payment_item.retail_item:
-                            cart_items.filter(item=payment_item.retail_item).delete()
+                    cart_items.filter(
+                        item_id__in=[p.retail_item_id for p in payment_items if p.retail_item_id]
+                    ).delete()
                     
                     # Comprehensive cart session cleanup after receipt generation
                     from store.cart_utils import cleanup_cart_session_after_receipt
@@ -2961,129 +2900,18 @@ def get_daily_sales():
     # This ensures the real cashier (who processed payment) is shown, not the dispenser
     # Fallback to receipt creator if cashier is null
     
-    # Get retail sales with cashier information (with fallback to receipt creator)
-    # We need to include both cashier and user info in the query
-    retail_sales = (
-        Receipt.objects
-        .filter(Q(status='Paid') | Q(status='Unpaid'))
-        .filter(is_returned=False)
-        .select_related('cashier__user', 'sales__user')  # Preload for performance
-        .annotate(day=TruncDay('date'))
-        .annotate(cashier_username=F('cashier__user__username'), 
-                  cashier_display=F('cashier__name'),
-                  sales_username=F('sales__user__username'))
-        .values('day', 'cashier_username', 'cashier_display', 'sales_username', 'cashier__id')
-        .annotate(
-            total_sales=Sum('total_amount'),
-            transaction_count=Count('id', distinct=True)
-        )
-    )
-
-    # Get retail returns (to subtract from totals)
-    retail_returns = (
-        Receipt.objects
-        .filter(is_returned=True)
-        .select_related('cashier__user', 'sales__user')
-        .annotate(day=TruncDay('date'))
-        .annotate(cashier_username=F('cashier__user__username'), 
-                  cashier_display=F('cashier__name'),
-                  sales_username=F('sales__user__username'))
-        .values('day', 'cashier_username', 'cashier_display', 'sales_username', 'cashier__id')
-        .annotate(
-            total_returns=Sum('return_amount'),
-            transaction_count=Count('id', distinct=True)
-        )
-    )
-
-    # Get wholesale sales with cashier information (with fallback to receipt creator)
-    wholesale_sales = (
-        WholesaleReceipt.objects
-        .filter(Q(status='Paid') | Q(status='Unpaid'))
-        .filter(is_returned=False)
-        .select_related('cashier__user', 'sales__user')
-        .annotate(day=TruncDay('date'))
-        .annotate(cashier_username=F('cashier__user__username'), 
-                  cashier_display=F('cashier__name'),
-                  sales_username=F('sales__user__username'))
-        .values('day', 'cashier_username', 'cashier_display', 'sales_username', 'cashier__id')
-        .annotate(
-            total_sales=Sum('total_amount'),
-            transaction_count=Count('id', distinct=True)
-        )
-    )
-
-    # Get wholesale returns (to subtract from totals)
-    wholesale_returns = (
-        WholesaleReceipt.objects
-        .filter(is_returned=True)
-        .select_related('cashier__user', 'sales__user')
-        .annotate(day=TruncDay('date'))
-        .annotate(cashier_username=F('cashier__user__username'), 
-                  cashier_display=F('cashier__name'),
-                  sales_username=F('sales__user__username'))
-        .values('day', 'cashier_username', 'cashier_display', 'sales_username', 'cashier__id')
-        .annotate(
-            total_returns=Sum('return_amount'),
-            transaction_count=Count('id', distinct=True)
-        )
-    )
-
-    # Get retail sales by payment method - using TruncDay to match the day format from sales queries
-    # First, get regular payment methods from receipts that aren't split payments and aren't returned
-    payment_method_sales = (
-        Receipt.objects
-        .filter(Q(status='Paid') | Q(status='Unpaid'))  # Include both paid and unpaid receipts
-        .filter(is_returned=False)  # Exclude returned receipts
-        .exclude(payment_method='Split')  # Exclude split payments, we'll handle them separately
-        .annotate(day=TruncDay('date'))
-        .values('day', 'payment_method')
-        .annotate(
-            total_amount=Sum('total_amount')
-        )
-        .order_by('day', 'payment_method')
-    )
-
-    # Now get the split payments from ReceiptPayment records
-    # This includes split payments for both walk-in and registered customers
-    split_payment_sales = (
-        ReceiptPayment.objects
-        .filter(Q(receipt__status='Paid') | Q(receipt__status='Unpaid'))
-        .annotate(day=TruncDay('date'))
-        .values('day', 'payment_method')
-        .annotate(
-            total_amount=Sum('amount')
-        )
-        .order_by('day', 'payment_method')
-    )
-
-    # Get wholesale sales by payment method - using TruncDay to match the day format
-    # First, get regular payment methods from receipts that aren't split payments
-    wholesale_payment_method_sales = (
-        WholesaleReceipt.objects
-        .filter(Q(status='Paid') | Q(status='Unpaid'))  # Include both paid and unpaid receipts
-        .filter(is_returned=False)  # Exclude returned wholesale receipts
-        .exclude(payment_method='Split')  # Exclude split payments, we'll handle them separately
-        .annotate(day=TruncDay('date'))
-        .values('day', 'payment_method')
-        .annotate(
-            total_amount=Sum('total_amount')
-        )
-        .order_by('day', 'payment_method')
-    )
-
-    # Now get the split payments from WholesaleReceiptPayment records
-    # This includes split payments for both walk-in and registered customers
-    wholesale_split_payment_sales = (
-        WholesaleReceiptPayment.objects
-        .filter(Q(receipt__status='Paid') | Q(receipt__status='Unpaid'))
-        .filter(receipt__is_returned=False)  # Exclude payments for returned receipts
-        .annotate(day=TruncDay('date'))
-        .values('day', 'payment_method')
-        .annotate(
-            total_amount=Sum('amount')
-        )
-        .order_by('day', 'payment_method')
-    )
+    # Closed days come from the SalesRollup table, only today is aggregated live
+    report_rows = get_sales_report_rows('day')
+    retail_sales = report_rows['retail_sales']
+    retail_returns = report_rows['retail_returns']
+    wholesale_sales = report_rows['wholesale_sales']
+    wholesale_returns = report_rows['wholesale_returns']
+
+    # Payment method totals: receipts paid with a single method, then split payment records
+    payment_method_sales = report_rows['retail_payments']
+    split_payment_sales = report_rows['retail_split_payments']
+    wholesale_payment_method_sales = report_rows['wholesale_payments']
+    wholesale_split_payment_sales = report_rows['wholesale_split_payments']
 
     # Combine results with cashier information
     combined_sales = defaultdict(lambda: {
@@ -3704,121 +3532,18 @@ def get_monthly_sales_with_expenses():
     # This ensures the real cashier (who processed payment) is shown, not the sales creator
     # Fallback to receipt creator if cashier is null
     
-    # Fetch retail sales data per month with cashier information from receipts (with fallback)
-    regular_sales = (
-        Receipt.objects
-        .filter(Q(status='Paid') | Q(status='Unpaid'))
-        .filter(is_returned=False)
-        .select_related('cashier__user', 'sales__user')  # Preload for performance
-        .annotate(month=TruncMonth('date'))
-        .annotate(cashier_username=F('cashier__user__username'), 
-                  cashier_display=F('cashier__name'),
-                  sales_username=F('sales__user__username'))
-        .values('month', 'cashier_username', 'cashier_display', 'sales_username', 'cashier__id')
-        .annotate(
-            total_sales=Sum('total_amount'),
-            transaction_count=Count('id', distinct=True)
-        )
-    )
-
-    # Fetch wholesale sales data per month with cashier information from wholesale receipts (with fallback)
-    wholesale_sales = (
-        WholesaleReceipt.objects
-        .filter(Q(status='Paid') | Q(status='Unpaid'))
-        .filter(is_returned=False)
-        .select_related('cashier__user', 'sales__user')
-        .annotate(month=TruncMonth('date'))
-        .annotate(cashier_username=F('cashier__user__username'), 
-                  cashier_display=F('cashier__name'),
-                  sales_username=F('sales__user__username'))
-        .values('month', 'cashier_username', 'cashier_display', 'sales_username', 'cashier__id')
-        .annotate(
-            total_sales=Sum('total_amount'),
-            transaction_count=Count('id', distinct=True)
-        )
-    )
-
-    # Get retail returns to subtract from totals (with fallback)
-    retail_returns = (
-        Receipt.objects
-        .filter(is_returned=True)
-        .select_related('cashier__user', 'sales__user')
-        .annotate(month=TruncMonth('date'))
-        .annotate(cashier_username=F('cashier__user__username'), 
-                  cashier_display=F('cashier__name'),
-                  sales_username=F('sales__user__username'))
-        .values('month', 'cashier_username', 'cashier_display', 'sales_username', 'cashier__id')
-        .annotate(
-            total_returns=Sum('return_amount'),
-            transaction_count=Count('id', distinct=True)
-        )
-    )
-
-    # Get wholesale returns to subtract from totals (with fallback)
-    wholesale_returns = (
-        WholesaleReceipt.objects
-        .filter(is_returned=True)
-        .select_related('cashier__user', 'sales__user')
-        .annotate(month=TruncMonth('date'))
-        .annotate(cashier_username=F('cashier__user__username'), 
-                  cashier_display=F('cashier__name'),
-                  sales_username=F('sales__user__username'))
-        .values('month', 'cashier_username', 'cashier_display', 'sales_username', 'cashier__id')
-        .annotate(
-            total_returns=Sum('return_amount'),
-            transaction_count=Count('id', distinct=True)
-        )
-    )
-
-    # Get monthly payment method data for retail (non-split payments)
-    monthly_payment_method_sales = (
-        Receipt.objects
-        .filter(Q(status='Paid') | Q(status='Unpaid'))
-        .exclude(payment_method='Split')
-        .annotate(month=TruncMonth('date'))
-        .values('month', 'payment_method')
-        .annotate(
-            total_amount=Sum('total_amount')
-        )
-        .order_by('month', 'payment_method')
-    )
-
-    # Get monthly split payment data for retail
-    monthly_split_payment_sales = (
-        ReceiptPayment.objects
-        .filter(Q(receipt__status='Paid') | Q(receipt__status='Unpaid'))
-        .annotate(month=TruncMonth('date'))
-        .values('month', 'payment_method')
-        .annotate(
-            total_amount=Sum('amount')
-        )
-        .order_by('month', 'payment_method')
-    )
-
-    # Get monthly payment method data for wholesale (non-split payments)
-    monthly_wholesale_payment_method_sales = (
-        WholesaleReceipt.objects
-        .filter(Q(status='Paid') | Q(status='Unpaid'))
-        .exclude(payment_method='Split')
-        .annotate(month=TruncMonth('date'))
-        .values('month', 'payment_method')
-        .annotate(
-            total_amount=Sum('total_amount')
-        )
-        .order_by('month', 'payment_method')
-    )
-
-    # Get monthly split payment data for wholesale
-    monthly_wholesale_split_payment_sales = (
-        WholesaleReceiptPayment.objects
-        .filter(Q(receipt__status='Paid') | Q(receipt__status='Unpaid'))
-        .annotate(month=TruncMonth('date'))
-        .values('month', 'payment_method')
-        .annotate(
-            total_amount=Sum('amount')
-        )
-        .order_by('month', 'payment_method')
-    )
+    # Closed days come from the SalesRollup table, only today is aggregated live
+    report_rows = get_sales_report_rows('month')
+    regular_sales = report_rows['retail_sales']
+    wholesale_sales = report_rows['wholesale_sales']
+    retail_returns = report_rows['retail_returns']
+    wholesale_returns = report_rows['wholesale_returns']
+
+    # Payment method totals: receipts paid with a single method, then split payment records
+    monthly_payment_method_sales = report_rows['retail_payments']
+    monthly_split_payment_sales = report_rows['retail_split_payments']
+    monthly_wholesale_payment_method_sales = report_rows['wholesale_payments']
+    monthly_wholesale_split_payment_sales = report_rows['wholesale_split_payments']
 
     # Get monthly expenses as a dictionary: {month_date: total_expense}
     monthly_expenses = get_monthly_expenses()
@@ -4848,22 +4573,13 @@ def dispensing_log(request):
                     logs = logs.filter(user=user_filter)
                 # For regular users, this filter is ignored as they can see all data but can't filter by specific users
 
-        # Apply pagination
-        page = request.GET.get('page', 1)
+        # Apply keyset pagination: deep pages cost the same as the first
         per_page = 50  # Set items per page
-        
-        # Create the paginator
-        paginator = Paginator(logs, per_page)
-        
-        try:
-            page_obj = paginator.page(int(page))
-        except (ValueError, KeyError, TypeError):
-            page_obj = paginator.page(1)
-
-        # Create search params without the page parameter to avoid circular links
-        from urllib.parse import urlencode
-        search_params_dict = {k: v for k, v in request.GET.items() if k != 'page'}
-        search_params = urlencode(search_params_dict) if search_params_dict else ''
+        paginator = KeysetPaginator(logs, per_page, ordering=('-created_at', '-id'), count=True)
+        page_obj = paginator.page(request.GET.get('cursor'))
+
+        # Create search params without the cursor to avoid circular links
+        search_params = pagination_params(request)
         
         if request.headers.get('HX-Request'):
             # HTMX request - check for pagination or full refresh
@@ -5188,7 +4904,6 @@ def dispensing_log_stats(request):
 @never_cache
 def receipt_list(request):
     if request.user.is_authenticated:
-        from django.core.paginator import Paginator
         from utils.date_utils import filter_queryset_by_date, get_date_filter_context
 
         # Get the date query from the GET request
@@ -5206,14 +4921,14 @@ def receipt_list(request):
         if date_query and date_context['is_valid_date']:
             receipts_queryset = filter_queryset_by_date(receipts_queryset, 'date', date_query)
 
-        # Add pagination (50 receipts per page)
-        paginator = Paginator(receipts_queryset, 50)
-        page_number = request.GET.get('page', 1)
-        receipts = paginator.get_page(page_number)
+        # Add keyset pagination (50 receipts per page)
+        paginator = KeysetPaginator(receipts_queryset, 50, ordering=('-date', '-id'), count=True)
+        receipts = paginator.page(request.GET.get('cursor'))
 
         return render(request, 'partials/receipt_list.html', {
             'receipts': receipts,
-            'is_paginated': paginator.num_pages > 1
+            'is_paginated': receipts.has_other_pages(),
+            'search_params': pagination_params(request),
         })
     else:
         return redirect('store:index')
@@ -6394,7 +6109,7 @@ def bulk_adjust_stock(request, stock_check_id):
                     item.item.stock += discrepancy
                     item.status = 'adjusted'
                     item.save()
-                    Item.objects.filter(id=item.item.id).update(stock=item.item.stock)
+                    Item.objects.filter(id=item.item.id).update(stock=item.item.stock, updated_at=timezone.now())
 
             messages.success(request, f"Stock adjusted for {stock_items.count()} items.")
             return redirect('store:store')
@@ -7546,21 +7261,22 @@ def wallet_transaction_history(request, customer_id):
         except Wallet.DoesNotExist:
             pass
 
-        # Calculate totals by transaction type
-        totals = {
-            'deposit': transactions.filter(transaction_type='deposit').aggregate(
-                total=Sum('amount'))['total'] or Decimal('0.0'),
-            'purchase': transactions.filter(transaction_type='purchase').aggregate(
-                total=Sum('amount'))['total'] or Decimal('0.0'),
-            'debit': transactions.filter(transaction_type='debit').aggregate(
-                total=Sum('amount'))['total'] or Decimal('0.0'),
-            'refund': transactions.filter(transaction_type='refund').aggregate(
-                total=Sum('amount'))['total'] or Decimal('0.0'),
-        }
+        # Calculate totals by transaction type (one aggregate query)
+        totals = transactions.aggregate(**{
+            kind: Sum('amount', filter=Q(transaction_type=kind))
+            for kind in ('deposit', 'purchase', 'debit', 'refund')
+        })
+        totals = {key: value or Decimal('0.0') for key, value in totals.items()}
+
+        # Keyset pagination (50 transactions per page)
+        paginator = KeysetPaginator(transactions, 50, ordering=('-date', '-id'), count=True)
+        page_obj = paginator.page(request.GET.get('cursor'))
 
         context = {
             'customer': customer,
-            'transactions': transactions,
+            'transactions': page_obj,
+            'page_obj': page_obj,
+            'search_params': pagination_params(request),
             'wallet_balance': wallet_balance,
             'totals': totals,
             'transaction_types': TransactionHistory.TRANSACTION_TYPES,
@@ -7618,21 +7334,22 @@ def wholesale_wallet_transaction_history(request, customer_id):
         except WholesaleCustomerWallet.DoesNotExist:
             pass
 
-        # Calculate totals by transaction type
-        totals = {
-            'deposit': transactions.filter(transaction_type='deposit').aggregate(
-                total=Sum('amount'))['total'] or Decimal('0.0'),
-            'purchase': transactions.filter(transaction_type='purchase').aggregate(
-                total=Sum('amount'))['total'] or Decimal('0.0'),
-            'debit': transactions.filter(transaction_type='debit').aggregate(
-                total=Sum('amount'))['total'] or Decimal('0.0'),
-            'refund': transactions.filter(transaction_type='refund').aggregate(
-                total=Sum('amount'))['total'] or Decimal('0.0'),
-        }
+        # Calculate totals by transaction type (one aggregate query)
+        totals = transactions.aggregate(**{
+            kind: Sum('amount', filter=Q(transaction_type=kind))
+            for kind in ('deposit', 'purchase', 'debit', 'refund')
+        })
+        totals = {key: value or Decimal('0.0') for key, value in totals.items()}
+
+        # Keyset pagination (50 transactions per page)
+        paginator = KeysetPaginator(transactions, 50, ordering=('-date', '-id'), count=True)
+        page_obj = paginator.page(request.GET.get('cursor'))
 
         context = {
             'customer': customer,
-            'transactions': transactions,
+            'transactions': page_obj,
+            'page_obj': page_obj,
+            'search_params': pagination_params(request),
             'wallet_balance': wallet_balance,
             'totals': totals,
             'transaction_types': TransactionHistory.TRANSACTION_TYPES,
@@ -7913,9 +7630,7 @@ def notification_list(request):
         ).order_by('-created_at')
 
         # Mark notifications as read when viewed
-        unread_notifications = notifications.filter(is_read=False)
-        for notification in unread_notifications:
-            notification.mark_as_read()
+        notifications.mark_as_read()
 
         return render(request, 'store/notifications.html', {
             'notifications': notifications
@@ -7926,18 +7641,10 @@ def notification_list(request):
 
 @login_required
 def notification_count_api(request):
-    """API endpoint to get unread notification count - optimized with caching"""
+    """API endpoint to get unread notification count (served from pharmapp.counters)"""
     if request.user.is_authenticated:
         from .notifications import NotificationService
-        from django.core.cache import cache
-        cache_key = f'notification_count_{request.user.id}'
-        count = cache.get(cache_key)
-        
-        if count is None:
-            count = NotificationService.get_unread_count(request.user)
-            # Cache for 30 seconds to reduce database load
-            cache.set(cache_key, count, 30)
-            
+        count = NotificationService.get_cached_unread_count(request.user)
         return JsonResponse({'count': count})
     return JsonResponse({'count': 0})
 
@@ -0,0 +1,91 @@
+"""
+Process-level cache of the subscription verdict used by SubscriptionMiddleware.
+
+The middleware used to query Subscription.get_current() and call
+sync_status() (which may write) on every authenticated, non-exempt request,
+plus another query and possible write when no current subscription existed.
+The verdict only changes when a subscription or payment is saved, or when
+the calendar crosses the current subscription's end date or grace end date,
+so it is now computed once and kept in this process until:
+
+    * the day after ``valid_until`` (the next status boundary);
+    * a Subscription or PaymentRecord is saved or deleted in this process
+      (see subscription.signals); or
+    * SUBSCRIPTION_VERDICT_MAX_AGE seconds have passed, so other worker
+      processes pick up renewals too.
+
+Computing the verdict never writes: stored statuses are persisted by
+``manage.py sync_subscriptions`` (and the subscription admin/pages).
+"""
+import logging
+import threading
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIPTION_VERDICT_MAX_AGE = getattr(settings, 'SUBSCRIPTION_VERDICT_MAX_AGE', 300)
+
+_lock = threading.Lock()
+_verdict = None
+
+
+def compute_verdict(today=None):
+    """
+    Decide from the database whether access is allowed on ``today``.
+
+    Returns:
+        dict: ``status`` (trial/active/grace/expired, or None without any
+        subscription), ``valid_until`` (last day access is allowed, or None),
+        ``allowed`` and ``recheck_on`` (first day the verdict may change)
+    """
+    from .models import Subscription
+
+    today = today or date.today()
+    sub = Subscription.get_current()
+    if sub is None:
+        latest = Subscription.objects.order_by('-end_date').values_list('status', flat=True).first()
+        # Only a save can bring access back
+        return {'status': latest, 'valid_until': None, 'allowed': False, 'recheck_on': None}
+
+    status = sub.effective_status(today)
+    if status in ('trial', 'active'):
+        valid_until, recheck_on = sub.grace_end_date, sub.end_date + timedelta(days=1)
+    elif status == 'grace':
+        valid_until = sub.grace_end_date
+        recheck_on = valid_until + timedelta(days=1)
+    else:
+        valid_until, recheck_on = None, None
+    return {
+        'status': status,
+        'valid_until': valid_until,
+        'allowed': status != 'expired',
+        'recheck_on': recheck_on,
+    }
+
+
+def get_verdict():
+    """The cached verdict, recomputed when it is due"""
+    global _verdict
+    verdict = _verdict
+    today = date.today()
+    if verdict is not None and (
+        time.monotonic() - verdict['computed_at'] < SUBSCRIPTION_VERDICT_MAX_AGE
+        and (verdict['recheck_on'] is None or today < verdict['recheck_on'])
+    ):
+        return verdict
+
+    with _lock:
+        verdict = dict(compute_verdict(today), computed_at=time.monotonic())
+        if _verdict is None or _verdict['status'] != verdict['status']:
+            logger.info(f"Subscription verdict: {verdict['status']} (valid until {verdict['valid_until']})")
+        _verdict = verdict
+    return verdict
+
+
+def invalidate():
+    """Forget the cached verdict (after a subscription or payment change)"""
+    global _verdict
+    _verdict = None
@@ -1,7 +1,9 @@
 """
 Management command: sync subscription statuses and fire expiry notifications.
 
-Run daily via cron:
+SubscriptionMiddleware only reads subscriptions (see subscription.gate), so
+this is what persists trial/active -> grace -> expired transitions and fires
+their notifications. Run daily via cron:
     python manage.py sync_subscriptions
 
 Or via Windows Task Scheduler / systemd timer.
@@ -36,13 +38,7 @@ class Command(BaseCommand):
             old_status = sub.status
             if dry_run:
                 # Compute what status would be without saving
-                today = date.today()
-                if sub.end_date >= today:
-                    new_status = 'trial' if sub.status == 'trial' else 'active'
-                elif sub.grace_end_date >= today:
-                    new_status = 'grace'
-                else:
-                    new_status = 'expired'
+                new_status = sub.effective_status()
                 if new_status != old_status:
                     self.stdout.write(
                         f'  {sub.pharmacy_name}: {old_status} → {new_status} (dry run)'
@@ -4,6 +4,10 @@ from django.core.cache import cache
 from django.http import JsonResponse
 from django.shortcuts import redirect
 
+from pharmapp.route_metadata import route_for
+
+from .gate import get_verdict
+
 _ENFORCEMENT_CACHE_KEY = 'subscription_enforcement_enabled'
 _ENFORCEMENT_CACHE_TTL = 60  # seconds
 
@@ -52,18 +56,9 @@ class SubscriptionMiddleware:
     def __call__(self, request):
         if not _enforcement_enabled():
             return self.get_response(request)
-        if self._should_check(request):
-            from .models import Subscription
-            sub = Subscription.get_current()
-            if sub:
-                sub.sync_status()
-                if not sub.is_active:
-                    return self._block(request)
-            else:
-                any_sub = Subscription.objects.order_by('-end_date').first()
-                if any_sub:
-                    any_sub.sync_status()
-                return self._block(request)
+        # Cached verdict; status transitions are persisted by sync_subscriptions
+        if self._should_check(request) and not get_verdict()['allowed']:
+            return self._block(request)
         return self.get_response(request)
 
     def _should_check(self, request):
@@ -73,7 +68,8 @@ class SubscriptionMiddleware:
             bypass_mobile = getattr(settings, 'SUBSCRIPTION_BYPASS_MOBILE', None)
             if bypass_mobile is None or getattr(request.user, 'mobile', None) == bypass_mobile:
                 return False
-        if any(request.path.startswith(p) for p in EXEMPT_PREFIXES):
+        # EXEMPT_PREFIXES, decided once per route (pharmapp.route_metadata)
+        if route_for(request)['subscription_exempt']:
             return False
         return True
 
@@ -87,16 +87,18 @@ class Subscription(models.Model):
 
     # ── methods ─────────────────────────────────────────────────────────────
 
-    def sync_status(self):
-        """Recalculate and persist status. Returns True if status changed."""
-        today = date.today()
+    def effective_status(self, today=None):
+        """The status the dates call for on ``today``, whatever is stored."""
+        today = today or date.today()
         if self.end_date >= today:
-            new_status = 'trial' if self.status == 'trial' else 'active'
-        elif self.grace_end_date >= today:
-            new_status = 'grace'
-        else:
-            new_status = 'expired'
+            return 'trial' if self.status == 'trial' else 'active'
+        if self.grace_end_date >= today:
+            return 'grace'
+        return 'expired'
 
+    def sync_status(self):
+        """Recalculate and persist status. Returns True if status changed."""
+        new_status = self.effective_status()
         if new_status != self.status:
             self.status = new_status
             self.save(update_fields=['status', 'updated_at'])
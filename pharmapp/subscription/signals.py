@@ -1,7 +1,8 @@
-from django.db.models.signals import pre_save, post_save
+from django.db.models.signals import post_delete, pre_save, post_save
 from django.dispatch import receiver
 
-from .models import Subscription
+from . import gate
+from .models import PaymentRecord, Subscription
 
 _STATUS_PRIORITY = {
     'grace': 'high',
@@ -63,3 +64,10 @@ def _notify_on_status_change(sender, instance, created, **kwargs):
         )
     except Exception:
         pass
+
+
+@receiver([post_save, post_delete], sender=Subscription)
+@receiver([post_save, post_delete], sender=PaymentRecord)
+def _invalidate_verdict(sender, **kwargs):
+    """Have SubscriptionMiddleware re-read the subscription on its next request."""
+    gate.invalidate()
@@ -0,0 +1,78 @@
+from datetime import date, timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+
+from subscription import gate
+from subscription.middleware import SubscriptionMiddleware
+from subscription.models import Subscription
+
+User = get_user_model()
+
+
+class SubscriptionGateTestCase(TestCase):
+    """Test cases for the cached subscription verdict"""
+
+    def setUp(self):
+        cache.clear()
+        gate.invalidate()
+        self.addCleanup(gate.invalidate)
+        self.user = User.objects.create_user(
+            username='cashier',
+            mobile='08077777777',
+            password='cashierpass123'
+        )
+        self.middleware = SubscriptionMiddleware(lambda request: HttpResponse('ok'))
+
+    def _subscription(self, end_date, status='active'):
+        return Subscription.objects.create(
+            pharmacy_name='Test Pharmacy',
+            status=status,
+            start_date=end_date - timedelta(days=364),
+            end_date=end_date,
+            grace_period_days=7,
+        )
+
+    def _get(self, path='/store/dashboard/'):
+        request = RequestFactory().get(path)
+        request.user = self.user
+        return self.middleware(request)
+
+    def test_verdict_is_cached_between_requests(self):
+        self._subscription(date.today() + timedelta(days=30))
+        self.assertEqual(self._get().status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self._get().status_code, 200)
+        self.assertEqual(gate.get_verdict()['valid_until'], date.today() + timedelta(days=37))
+
+    def test_requests_do_not_persist_status_transitions(self):
+        sub = self._subscription(date.today() - timedelta(days=3))
+        verdict = gate.get_verdict()
+        self.assertEqual((verdict['status'], verdict['allowed']), ('grace', True))
+        self.assertEqual(self._get().status_code, 200)
+
+        sub.refresh_from_db()
+        self.assertEqual(sub.status, 'active')
+
+    def test_verdict_expires_at_the_next_status_boundary(self):
+        end_date = date.today() + timedelta(days=1)
+        self._subscription(end_date)
+        self.assertEqual(gate.get_verdict()['recheck_on'], end_date + timedelta(days=1))
+
+        after_grace = end_date + timedelta(days=8)
+        with mock.patch('subscription.gate.date') as fake_date, \
+                mock.patch('subscription.models.date') as model_date:
+            fake_date.today.return_value = model_date.today.return_value = after_grace
+            self.assertFalse(gate.get_verdict()['allowed'])
+            self.assertEqual(self._get().url, '/subscription/expired/')
+
+    def test_renewal_lifts_the_block_immediately(self):
+        sub = self._subscription(date.today() - timedelta(days=30), status='expired')
+        self.assertEqual(self._get().status_code, 302)
+        self.assertEqual(self._get('/api/sales/').status_code, 402)
+
+        sub.renew(recorded_by=self.user, amount=150000, payment_method='cash')
+        self.assertEqual(self._get().status_code, 200)
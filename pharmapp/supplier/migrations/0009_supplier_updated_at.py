@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 06:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supplier', '0008_procurementitem_barcode_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supplier',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
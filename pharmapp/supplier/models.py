@@ -113,6 +113,7 @@ class Supplier(models.Model):
     name = models.CharField(max_length=255)
     phone = models.CharField(max_length=15, blank=True, null=True)
     contact_info = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
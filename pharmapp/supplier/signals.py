@@ -35,7 +35,7 @@ def transfer_barcode_to_retail_item(sender, instance, created, **kwargs):
             # Only update if item doesn't have a barcode
             if not item.barcode:
                 item.barcode = instance.barcode
-                item.save(update_fields=['barcode'])
+                item.save(update_fields=['barcode', 'updated_at'])
                 print(f"[Signal] Transferred barcode {instance.barcode} to retail item {item.name}")
 
     except Exception as e:
@@ -69,7 +69,7 @@ def transfer_barcode_to_wholesale_item(sender, instance, created, **kwargs):
             # Only update if item doesn't have a barcode
             if not item.barcode:
                 item.barcode = instance.barcode
-                item.save(update_fields=['barcode'])
+                item.save(update_fields=['barcode', 'updated_at'])
                 print(f"[Signal] Transferred barcode {instance.barcode} to wholesale item {item.name}")
 
     except Exception as e:
@@ -0,0 +1,188 @@
+"""
+Batched, off-request ActivityLog writes.
+
+ActivityMiddleware used to INSERT one ActivityLog row inside every POST
+(every checkout and cart action) and every "important" GET. Entries are now
+put on an in-process queue and written with ``bulk_create`` by a daemon
+thread, whenever ACTIVITY_LOG_BATCH_SIZE entries are waiting or every
+ACTIVITY_LOG_FLUSH_INTERVAL seconds, whichever comes first.
+
+    * When the queue holds ACTIVITY_LOG_MAX_QUEUE entries (the database is
+      slow or down), further entries are written synchronously, so audit
+      entries are not dropped and memory stays bounded.
+    * Entries logged inside a transaction are queued when it commits: the
+      writer's own connection could not see rows it has not committed yet.
+    * The queue is flushed when the process exits.
+
+``stats()`` reports the queue depth and write counters (shown on the
+ActivityLog admin page). ACTIVITY_LOG_ASYNC=False restores synchronous
+writes.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY_LOG_BATCH_SIZE = getattr(settings, 'ACTIVITY_LOG_BATCH_SIZE', 100)
+ACTIVITY_LOG_FLUSH_INTERVAL = getattr(settings, 'ACTIVITY_LOG_FLUSH_INTERVAL', 2.0)
+ACTIVITY_LOG_MAX_QUEUE = getattr(settings, 'ACTIVITY_LOG_MAX_QUEUE', 10000)
+
+
+class ActivityLogWriter:
+    """Queues unsaved ActivityLog instances and bulk-inserts them from a background thread"""
+
+    def __init__(self, batch_size=None, flush_interval=None, max_queue=None, background=True):
+        self.batch_size = batch_size or ACTIVITY_LOG_BATCH_SIZE
+        self.flush_interval = flush_interval or ACTIVITY_LOG_FLUSH_INTERVAL
+        self.background = background
+        self._queue = queue.Queue(maxsize=max_queue or ACTIVITY_LOG_MAX_QUEUE)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.enqueued = 0
+        self.written = 0
+        self.sync_writes = 0
+        self.failed = 0
+        self.last_flush_at = None
+
+    def log(self, entry):
+        """Write ``entry`` (an unsaved ActivityLog) soon; returns immediately"""
+        if connection.in_atomic_block:
+            transaction.on_commit(lambda: self._enqueue(entry))
+        else:
+            self._enqueue(entry)
+
+    def _enqueue(self, entry):
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self._write_now(entry)
+            return
+        with self._lock:
+            self.enqueued += 1
+        if self.background:
+            self.start()
+            if self._queue.qsize() >= self.batch_size:
+                self._wake.set()
+
+    def _write_now(self, entry):
+        try:
+            entry.save()
+            with self._lock:
+                self.sync_writes += 1
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            logger.error(f"Could not write activity log entry '{entry.action}': {e}")
+
+    def flush(self):
+        """Write every queued entry now; returns the number written"""
+        from .models import ActivityLog
+
+        total = 0
+        with self._flush_lock:
+            while True:
+                batch = []
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    break
+                try:
+                    ActivityLog.objects.bulk_create(batch)
+                    written = len(batch)
+                except Exception as e:
+                    logger.error(f"Bulk write of {len(batch)} activity log entries failed, retrying one by one: {e}")
+                    close_old_connections()
+                    written = 0
+                    for entry in batch:
+                        entry.pk = None
+                        try:
+                            entry.save()
+                            written += 1
+                        except Exception:
+                            with self._lock:
+                                self.failed += 1
+                with self._lock:
+                    self.written += written
+                total += written
+            self.last_flush_at = time.time()
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Activity log writer flush failed: {e}", exc_info=True)
+            finally:
+                close_old_connections()
+
+    def start(self):
+        """Start the writer thread (no-op if it is already running)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='activity-log-writer', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        """Stop the thread and write whatever is still queued"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'max_queue': self._queue.maxsize,
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'sync_writes': self.sync_writes,
+                'failed': self.failed,
+                'last_flush_at': self.last_flush_at,
+                'running': self.running,
+            }
+
+
+writer = ActivityLogWriter()
+atexit.register(writer.stop)
+
+
+def log_activity(**fields):
+    """Queue an ActivityLog entry (written synchronously if ACTIVITY_LOG_ASYNC is off)"""
+    from .models import ActivityLog
+
+    entry = ActivityLog(**fields)
+    if getattr(settings, 'ACTIVITY_LOG_ASYNC', True):
+        writer.log(entry)
+    else:
+        entry.save()
+    return entry
+
+
+def stats():
+    return writer.stats()
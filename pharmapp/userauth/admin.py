@@ -5,6 +5,7 @@ from django import forms
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
 from .models import *
+from . import activity_writer
 
 class TimePeriodFilter(admin.SimpleListFilter):
     title = 'time period'
@@ -178,6 +179,7 @@ class ActivityLogAdmin(admin.ModelAdmin):
         extra_context.update({
             'today_count': today_count,
             'active_users': active_users,
+            'writer_stats': activity_writer.stats(),
         })
 
         return super().changelist_view(request, extra_context=extra_context)
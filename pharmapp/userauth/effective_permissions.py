@@ -0,0 +1,120 @@
+"""
+Effective-permission resolution for User.has_permission.
+
+has_permission used to look up the UserPermission override for every check
+(``custom_permissions.get(permission=...)``). can_operate_retail and friends
+check two or three permissions each and the sidebar's template filters call
+them over and over, so one page could run dozens of identical queries.
+
+A user's effective permissions (their role's USER_PERMISSIONS with their
+UserPermission grants and revocations applied) are now resolved once into a
+frozenset:
+
+    * kept on the user instance for the rest of the request;
+    * cached across requests under ``effective_permissions:<user_id>:<version>``
+      for PERMISSION_CACHE_SECONDS, where the version lives in
+      ``effective_permissions_version:<user_id>`` and is bumped whenever one
+      of the user's UserPermission rows or their Profile is saved or deleted
+      (see the receivers in userauth.models).
+
+The cross-request layer needs a cache shared by every worker process
+(utils.cache): with a process-local cache (the LocMemCache default) the
+version bump would only reach the process that saved the change, and the
+others would keep serving a revoked permission. Without one, the set is
+resolved once per request only.
+
+Every permission helper, decorator and template filter goes through
+User.has_permission, and with it through this module.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from utils.cache import is_shared_cache
+
+logger = logging.getLogger(__name__)
+
+PERMISSION_CACHE_SECONDS = getattr(settings, 'PERMISSION_CACHE_SECONDS', 3600)
+
+# Attribute holding the resolved set on a User instance (one per request)
+_INSTANCE_ATTR = '_effective_permissions'
+
+
+def _version_key(user_id):
+    return f'effective_permissions_version:{user_id}'
+
+
+def _permissions_key(user_id, version):
+    return f'effective_permissions:{user_id}:{version}'
+
+
+def permissions_version(user_id):
+    """The current version of ``user_id``'s permissions"""
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # A fresh stamp, never an earlier one: sets cached under an evicted
+        # version must not come back
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def resolve_permissions(user):
+    """Role permissions of ``user`` with their individual overrides applied"""
+    from .models import USER_PERMISSIONS
+
+    user_type = user.profile.user_type
+    if not user_type:
+        return frozenset()
+
+    permissions = set(USER_PERMISSIONS.get(user_type, []))
+    for permission, granted in user.custom_permissions.values_list('permission', 'granted'):
+        if granted:
+            permissions.add(permission)
+        else:
+            permissions.discard(permission)
+    return frozenset(permissions)
+
+
+def effective_permissions(user):
+    """
+    The effective permissions of ``user`` (not a superuser), as a frozenset.
+
+    Resolved at most once per user instance, and (with a shared cache) from
+    the cache while the user's permissions version is unchanged.
+    """
+    permissions = getattr(user, _INSTANCE_ATTR, None)
+    if permissions is not None:
+        return permissions
+
+    if not is_shared_cache():
+        permissions = resolve_permissions(user)
+        setattr(user, _INSTANCE_ATTR, permissions)
+        return permissions
+
+    key = _permissions_key(user.pk, permissions_version(user.pk))
+    permissions = cache.get(key)
+    if permissions is None:
+        permissions = resolve_permissions(user)
+        cache.set(key, permissions, PERMISSION_CACHE_SECONDS)
+    setattr(user, _INSTANCE_ATTR, permissions)
+    return permissions
+
+
+def forget_permissions(user):
+    """Drop the set resolved on the ``user`` instance"""
+    user.__dict__.pop(_INSTANCE_ATTR, None)
+
+
+def invalidate_permissions(user_id):
+    """Make later requests re-resolve ``user_id``'s permissions (in every process with a shared cache)"""
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        cache.set(_version_key(user_id), time.time_ns(), None)
+    # The role context of userauth.context_processors.user_roles derives from them too
+    cache.delete(f'user_permissions_{user_id}')
+    logger.debug(f"Permissions of user {user_id} invalidated")
@@ -0,0 +1,80 @@
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from userauth import session_activity
+from userauth.models import User
+
+
+class Command(BaseCommand):
+    help = 'Benchmark django_session writes per authenticated request (all changes are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Number of requests per run (default: 200)',
+        )
+        parser.add_argument(
+            '--think-time',
+            type=float,
+            default=5.0,
+            help='Simulated seconds between two requests of the user (default: 5)',
+        )
+        parser.add_argument(
+            '--path',
+            default='/api/health/',
+            help='Path requested (default: /api/health/)',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=None,
+            help='SESSION_ACTIVITY_SAVE_INTERVAL of the coalesced run (default: the setting)',
+        )
+
+    def handle(self, *args, **options):
+        requests = max(options['requests'], 1)
+        interval = options['interval']
+        if interval is None:
+            interval = session_activity.SESSION_ACTIVITY_SAVE_INTERVAL
+
+        self.stdout.write(f"{'run':<22} {'requests':>8} {'writes':>7} {'writes/req':>10} {'queries/req':>11}")
+        for label, run_interval in (('every request (before)', 0), (f'coalesced ({interval}s)', interval)):
+            writes, queries = self.run(requests, options['think_time'], options['path'], run_interval)
+            self.stdout.write(
+                f'{label:<22} {requests:>8} {writes:>7} {writes / requests:>10.3f} {queries / requests:>11.2f}'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Session write benchmark completed (database unchanged)'))
+
+    def run(self, requests, think_time, path, interval):
+        """Replay ``requests`` requests ``think_time`` seconds apart; returns (session writes, queries)"""
+        clock = [1_000_000_000.0]
+        writes = queries = 0
+
+        # Write-through: count every session save, even those the session
+        # engine would otherwise write behind
+        with transaction.atomic(), \
+                override_settings(SESSION_ACTIVITY_SAVE_INTERVAL=interval, SESSION_WRITE_BEHIND=False), \
+                mock.patch.object(session_activity, '_clock', lambda: clock[0]):
+            user = User.objects.create_user(username='bench-session', mobile='bench-session', password=None)
+            client = Client()
+            client.force_login(user)
+
+            for _ in range(requests):
+                clock[0] += think_time
+                with CaptureQueriesContext(connection) as context:
+                    client.get(path)
+                queries += len(context.captured_queries)
+                writes += sum(
+                    1 for query in context.captured_queries
+                    if 'django_session' in query['sql'] and query['sql'].lstrip().upper().startswith(('UPDATE', 'INSERT'))
+                )
+
+            transaction.set_rollback(True)
+        return writes, queries
@@ -36,6 +36,9 @@ class Command(BaseCommand):
             from django.contrib.sessions.models import Session
             session_count = Session.objects.count()
             Session.objects.all().delete()
+            # Cache-first engines (userauth.session_backend) would keep serving them
+            from django.core.cache import caches
+            caches[getattr(settings, 'SESSION_CACHE_ALIAS', 'default')].clear()
             self.stdout.write(self.style.SUCCESS(f'Cleared {session_count} existing sessions.'))
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Failed to clear sessions: {e}'))
@@ -58,6 +61,8 @@ class Command(BaseCommand):
         session_engine = getattr(settings, 'SESSION_ENGINE', 'django.contrib.sessions.backends.db')
         if session_engine == 'django.contrib.sessions.backends.db':
             self.stdout.write(self.style.SUCCESS('Using database sessions (recommended for security).'))
+        elif session_engine == 'userauth.session_backend':
+            self.stdout.write(self.style.SUCCESS('Using cache-first sessions backed by the database.'))
         else:
             self.stdout.write(self.style.WARNING(f'Using session engine: {session_engine}'))
 
@@ -1,10 +1,12 @@
 from django.utils.deprecation import MiddlewareMixin
 from .models import ActivityLog, User  # Import User from our models
+from . import activity_writer, session_activity
+from pharmapp import route_metadata
 from django.contrib.auth import logout
 from django.conf import settings
 from django.utils import timezone
 from django.shortcuts import redirect
-from django.urls import resolve, reverse
+from django.urls import reverse
 from django.http import HttpResponseForbidden
 from django.contrib import messages
 
@@ -40,37 +42,21 @@ class ActivityMiddleware(MiddlewareMixin):
     def process_request(self, request):
         # Only log for authenticated users
         if request.user.is_authenticated:
+            # Classified once per route (pharmapp.route_metadata)
+            route = route_metadata.route_for(request)
+
             # Skip logging for certain paths
-            if any(request.path.startswith(path) for path in self.SKIP_PATHS):
+            if route['audit_skip']:
                 return None
 
             # Skip most GET requests (only log important views)
             if request.method == 'GET':
                 # Only log if path matches important patterns
-                if not any(pattern in request.path for pattern in self.IMPORTANT_GET_PATHS):
+                if not route['audit_get']:
                     return None
                 action_type = 'VIEW'
             elif request.method == 'POST':
-                if 'delete' in request.path.lower():
-                    action_type = 'DELETE'
-                elif 'create' in request.path.lower() or 'add' in request.path.lower():
-                    action_type = 'CREATE'
-                elif 'edit' in request.path.lower() or 'update' in request.path.lower():
-                    action_type = 'UPDATE'
-                elif 'login' in request.path.lower():
-                    action_type = 'LOGIN'
-                elif 'logout' in request.path.lower():
-                    action_type = 'LOGOUT'
-                elif 'transfer' in request.path.lower():
-                    action_type = 'TRANSFER'
-                elif 'payment' in request.path.lower() or 'receipt' in request.path.lower():
-                    action_type = 'PAYMENT'
-                elif 'export' in request.path.lower():
-                    action_type = 'EXPORT'
-                elif 'import' in request.path.lower():
-                    action_type = 'IMPORT'
-                else:
-                    action_type = 'OTHER'
+                action_type = route['audit_action']
             else:
                 action_type = 'OTHER'
 
@@ -81,36 +67,16 @@ class ActivityMiddleware(MiddlewareMixin):
             if request.GET and not any(param in request.GET for param in ['password', 'token', 'key']):
                 action += f" Params: {dict(request.GET)}"
 
-            # Try to determine target model from URL
-            target_model = None
-            target_id = None
-
-            # Extract model name from URL path segments
-            path_parts = request.path.strip('/').split('/')
-            if len(path_parts) > 1:
-                # Try to identify model name from URL
-                model_candidates = ['user', 'customer', 'supplier', 'item', 'product',
-                                   'receipt', 'expense', 'procurement', 'stock']
-                for part in path_parts:
-                    for candidate in model_candidates:
-                        if candidate in part.lower():
-                            target_model = candidate.capitalize()
-                            break
-                    if target_model:
-                        break
-
-            # Try to extract ID from URL if it's a numeric segment
-            for part in path_parts:
-                if part.isdigit():
-                    target_id = part
-                    break
+            # Target model from the route, ID from its numeric path parameter
+            target_model = route['target_model']
+            target_id = route_metadata.target_id(request)
 
             # Get IP address and user agent
             ip_address = self._get_client_ip(request)
             user_agent = request.META.get('HTTP_USER_AGENT', '')
 
-            # Create the activity log using the helper method
-            ActivityLog.log_activity(
+            # Queued and bulk-written off the request (userauth.activity_writer)
+            activity_writer.log_activity(
                 user=request.user,
                 action=action,
                 action_type=action_type,
@@ -155,97 +121,87 @@ class RoleBasedAccessMiddleware:
     Middleware to enforce role-based access control.
     Restricts access to specific URLs based on user roles.
     """
+    # URL names that require specific roles (see pharmapp.route_metadata)
+    ROLE_REQUIRED_URLS = {
+        # User Management
+        'userauth:register': ['Admin'],
+        # Note: activity_dashboard now uses permission-based checking in the view
+        'userauth:permissions_management': ['Admin'],
+        'userauth:generate_test_logs': ['Admin'],
+        'userauth:user_list': ['Admin'],
+        'userauth:edit_user': ['Admin'],
+        'userauth:delete_user': ['Admin'],
+        'userauth:toggle_user_status': ['Admin'],
+        'admin:index': ['Admin'],
+        'admin:app_list': ['Admin'],
+
+        # Stock Management - Now accessible to all authenticated users
+        # 'store:create_stock_check': ['Admin', 'Manager', 'Pharm-Tech'],
+        # 'store:update_stock_check': ['Admin', 'Manager', 'Pharm-Tech'],
+        # 'store:list_stock_checks': ['Admin', 'Manager', 'Pharm-Tech'],
+        # 'wholesale:create_wholesale_stock_check': ['Admin', 'Manager', 'Pharm-Tech'],
+        # 'wholesale:update_wholesale_stock_check': ['Admin', 'Manager', 'Pharm-Tech'],
+        # 'wholesale:list_wholesale_stock_checks': ['Admin', 'Manager', 'Pharm-Tech'],
+
+        # Financial Management
+        # Note: expense_list and add_expense are now accessible to all authenticated users
+        # Only edit and delete operations are restricted to Admin/Manager
+        'store:edit_expense_form': ['Admin', 'Manager'],
+        'store:update_expense': ['Admin', 'Manager'],
+        'store:delete_expense': ['Admin', 'Manager'],
+        'store:daily_sales': ['Admin', 'Manager'],
+        'store:monthly_sales': ['Admin', 'Manager'],
+        'store:sales_by_payment_method': ['Admin', 'Manager'],
+
+        # Procurement Management - Now handled by permission-based decorators in views
+        # 'store:add_procurement': ['Admin', 'Manager', 'Pharm-Tech'],
+        # 'store:procurement_list': ['Admin', 'Manager', 'Pharm-Tech'],
+        'store:edit_procurement': ['Admin', 'Manager'],
+        'store:delete_procurement': ['Admin', 'Manager'],
+
+        # Supplier Management
+        'store:register_supplier_view': ['Admin', 'Manager'],
+        'store:supplier_list': ['Admin', 'Manager', 'Pharm-Tech'],
+        'store:edit_supplier': ['Admin', 'Manager'],
+        'store:delete_supplier': ['Admin', 'Manager'],
+
+        # Customer Management
+        'store:register_customer_view': ['Admin', 'Manager', 'Pharmacist', 'Pharm-Tech'],
+        'store:customer_list': ['Admin', 'Manager', 'Pharmacist', 'Pharm-Tech', 'Salesperson'],
+        'store:edit_customer': ['Admin', 'Manager', 'Pharmacist'],
+        'store:delete_customer': ['Admin', 'Manager'],
+
+        # Inventory Management
+        'store:delete_item': ['Admin', 'Manager'],
+        'wholesale:delete_wholesale_item': ['Admin', 'Manager'],
+        'store:transfer_multiple_store_items': ['Admin', 'Manager', 'Pharm-Tech'],
+        'wholesale:transfer_multiple_wholesale_items': ['Admin', 'Manager', 'Pharm-Tech'],
+        'store:adjust_prices': ['Admin', 'Manager'],
+
+        # Sales Management
+        'store:generate_receipt': ['Admin', 'Manager', 'Pharmacist', 'Pharm-Tech', 'Salesperson'],
+        'store:receipt_list': ['Admin', 'Manager', 'Pharmacist', 'Pharm-Tech', 'Salesperson'],
+        'wholesale:generate_wholesale_receipt': ['Admin', 'Manager', 'Pharmacist', 'Pharm-Tech', 'Salesperson'],
+        'wholesale:wholesale_receipt_list': ['Admin', 'Manager', 'Pharmacist', 'Pharm-Tech', 'Salesperson'],
+
+        # Dispensing
+        'store:dispense_medication': ['Admin', 'Pharmacist'],
+        'store:dispensing_log': ['Admin', 'Manager', 'Pharmacist'],
+    }
+
     def __init__(self, get_response):
         self.get_response = get_response
-        # URL patterns that require specific roles
-        self.role_required_urls = {
-            # User Management
-            'userauth:register': ['Admin'],
-            # Note: activity_dashboard now uses permission-based checking in the view
-            'userauth:permissions_management': ['Admin'],
-            'userauth:generate_test_logs': ['Admin'],
-            'userauth:user_list': ['Admin'],
-            'userauth:edit_user': ['Admin'],
-            'userauth:delete_user': ['Admin'],
-            'userauth:toggle_user_status': ['Admin'],
-            'admin:index': ['Admin'],
-            'admin:app_list': ['Admin'],
-
-            # Stock Management - Now accessible to all authenticated users
-            # 'store:create_stock_check': ['Admin', 'Manager', 'Pharm-Tech'],
-            # 'store:update_stock_check': ['Admin', 'Manager', 'Pharm-Tech'],
-            # 'store:list_stock_checks': ['Admin', 'Manager', 'Pharm-Tech'],
-            # 'wholesale:create_wholesale_stock_check': ['Admin', 'Manager', 'Pharm-Tech'],
-            # 'wholesale:update_wholesale_stock_check': ['Admin', 'Manager', 'Pharm-Tech'],
-            # 'wholesale:list_wholesale_stock_checks': ['Admin', 'Manager', 'Pharm-Tech'],
-
-            # Financial Management
-            # Note: expense_list and add_expense are now accessible to all authenticated users
-            # Only edit and delete operations are restricted to Admin/Manager
-            'store:edit_expense_form': ['Admin', 'Manager'],
-            'store:update_expense': ['Admin', 'Manager'],
-            'store:delete_expense': ['Admin', 'Manager'],
-            'store:daily_sales': ['Admin', 'Manager'],
-            'store:monthly_sales': ['Admin', 'Manager'],
-            'store:sales_by_payment_method': ['Admin', 'Manager'],
-
-            # Procurement Management - Now handled by permission-based decorators in views
-            # 'store:add_procurement': ['Admin', 'Manager', 'Pharm-Tech'],
-            # 'store:procurement_list': ['Admin', 'Manager', 'Pharm-Tech'],
-            'store:edit_procurement': ['Admin', 'Manager'],
-            'store:delete_procurement': ['Admin', 'Manager'],
-
-            # Supplier Management
-            'store:register_supplier_view': ['Admin', 'Manager'],
-            'store:supplier_list': ['Admin', 'Manager', 'Pharm-Tech'],
-            'store:edit_supplier': ['Admin', 'Manager'],
-            'store:delete_supplier': ['Admin', 'Manager'],
-
-            # Customer Management
-            'store:register_customer_view': ['Admin', 'Manager', 'Pharmacist', 'Pharm-Tech'],
-            'store:customer_list': ['Admin', 'Manager', 'Pharmacist', 'Pharm-Tech', 'Salesperson'],
-            'store:edit_customer': ['Admin', 'Manager', 'Pharmacist'],
-            'store:delete_customer': ['Admin', 'Manager'],
-
-            # Inventory Management
-            'store:delete_item': ['Admin', 'Manager'],
-            'wholesale:delete_wholesale_item': ['Admin', 'Manager'],
-            'store:transfer_multiple_store_items': ['Admin', 'Manager', 'Pharm-Tech'],
-            'wholesale:transfer_multiple_wholesale_items': ['Admin', 'Manager', 'Pharm-Tech'],
-            'store:adjust_prices': ['Admin', 'Manager'],
-
-            # Sales Management
-            'store:generate_receipt': ['Admin', 'Manager', 'Pharmacist', 'Pharm-Tech', 'Salesperson'],
-            'store:receipt_list': ['Admin', 'Manager', 'Pharmacist', 'Pharm-Tech', 'Salesperson'],
-            'wholesale:generate_wholesale_receipt': ['Admin', 'Manager', 'Pharmacist', 'Pharm-Tech', 'Salesperson'],
-            'wholesale:wholesale_receipt_list': ['Admin', 'Manager', 'Pharmacist', 'Pharm-Tech', 'Salesperson'],
-
-            # Dispensing
-            'store:dispense_medication': ['Admin', 'Pharmacist'],
-            'store:dispensing_log': ['Admin', 'Manager', 'Pharmacist'],
-        }
 
     def __call__(self, request):
         # Skip middleware for unauthenticated users (they'll be redirected to login)
         if not request.user.is_authenticated:
             return self.get_response(request)
 
-        # Get the current URL name
-        try:
-            current_url_name = resolve(request.path_info).url_name
-            namespace = resolve(request.path_info).namespace
-            if namespace:
-                current_url = f"{namespace}:{current_url_name}"
-            else:
-                current_url = current_url_name
-        except:
-            # If URL can't be resolved, just continue
-            return self.get_response(request)
+        # Resolved once per request (pharmapp.route_metadata)
+        allowed_roles = route_metadata.route_for(request)['roles']
 
         # Check if this URL has role restrictions
-        if current_url in self.role_required_urls:
-            allowed_roles = self.role_required_urls[current_url]
-
+        if allowed_roles:
             # Check if user has a profile
             if not hasattr(request.user, 'profile') or not request.user.profile:
                 # Create a default profile for users without one
@@ -276,8 +232,11 @@ class AutoLogoutMiddleware:
 
     def __call__(self, request):
         if request.user.is_authenticated:
+            # last_activity lives in the session activity side store, which
+            # writes the session itself at most once per save interval
+            activity = session_activity.get(request)
             # Check for auto-logout based on inactivity
-            last_activity_str = request.session.get('last_activity')
+            last_activity_str = activity.get('last_activity')
             if last_activity_str:
                 try:
                     # Parse the last activity with timezone
@@ -294,10 +253,10 @@ class AutoLogoutMiddleware:
                         request.session.flush()
                 except ValueError:
                     # Handle any parsing errors gracefully
-                    request.session.pop('last_activity', None)
+                    activity.pop('last_activity')
 
             # Save the current time with timezone in ISO format (only for authenticated users)
-            request.session['last_activity'] = timezone.now().isoformat()
+            activity.set('last_activity', timezone.now().isoformat())
 
         response = self.get_response(request)
         return response
\ No newline at end of file
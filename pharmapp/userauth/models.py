@@ -1,9 +1,11 @@
 from django.db import models
 from django.dispatch import receiver
 from django.utils import timezone
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.contrib.auth.models import AbstractUser
 
+from .effective_permissions import effective_permissions, forget_permissions, invalidate_permissions
+
 
 USER_TYPE = [
     ('Admin', 'Admin'),
@@ -127,38 +129,16 @@ class User(AbstractUser):
             # Refresh to get the new profile
             self.refresh_from_db()
 
-        if not self.profile.user_type:
-            return False
-
-        # Check role-based permissions first
-        user_permissions = USER_PERMISSIONS.get(self.profile.user_type, [])
-        has_role_permission = permission in user_permissions
-
-        # Check individual permissions (these can override role permissions)
-        try:
-            custom_permission = self.custom_permissions.get(permission=permission)
-            # Individual permission overrides role permission
-            return custom_permission.granted
-        except UserPermission.DoesNotExist:
-            # No individual permission set, use role-based permission
-            return has_role_permission
+        # Role permissions with individual overrides applied, resolved once
+        # per request and cached until they change
+        return permission in effective_permissions(self)
 
     def get_permissions(self):
         """Get all effective permissions for the user (role-based + individual)"""
         if not hasattr(self, 'profile') or not self.profile.user_type:
             return []
 
-        # Start with role-based permissions
-        role_permissions = set(USER_PERMISSIONS.get(self.profile.user_type, []))
-
-        # Apply individual permission overrides
-        for custom_perm in self.custom_permissions.all():
-            if custom_perm.granted:
-                role_permissions.add(custom_perm.permission)
-            else:
-                role_permissions.discard(custom_perm.permission)
-
-        return list(role_permissions)
+        return list(effective_permissions(self))
 
     def get_role_permissions(self):
         """Get only role-based permissions"""
@@ -262,6 +242,15 @@ class UserPermission(models.Model):
         return f'{self.user.username} - {self.permission} ({status})'
 
 
+@receiver([post_save, post_delete], sender=UserPermission)
+@receiver([post_save, post_delete], sender=Profile)
+def invalidate_effective_permissions(sender, instance, **kwargs):
+    """Bump the user's permissions version when their overrides or role change"""
+    invalidate_permissions(instance.user_id)
+    if sender.user.is_cached(instance):
+        forget_permissions(instance.user)
+
+
 class ActivityLog(models.Model):
     """
     Model to track user activities in the system.
@@ -0,0 +1,135 @@
+"""
+Session activity side store: coalesces writes of the ``django_session`` row.
+
+AutoLogoutMiddleware, SessionValidationMiddleware and
+UserActivityTrackingMiddleware each update ``request.session`` on every
+authenticated request (last_activity, last_validation, the user_activity
+page counter, ...). With SESSION_SAVE_EVERY_REQUEST and the database session
+backend, every page view, HTMX poll and API call rewrote the session row.
+
+Those volatile fields now live in the cache under
+``session_activity:<session_key>`` (see VOLATILE_KEYS), read and written
+through the per-request ``SessionActivity`` returned by ``get(request)``.
+SessionActivityMiddleware, placed around the three middlewares, saves them
+when the response goes out and only lets the session row be rewritten when:
+
+    * the request changed persisted session data itself (login, cart,
+      validation key, ...) or a middleware flagged a security-relevant
+      change (``persist=True``, e.g. an IP address change); or
+    * SESSION_ACTIVITY_SAVE_INTERVAL seconds have passed since the last
+      write, which also slides the session's expiry date forward.
+
+Each write copies the volatile fields into the session too, so a cache
+flush loses at most one interval of activity. SESSION_ACTIVITY_SAVE_INTERVAL=0
+writes the session on every request, as before. ``manage.py
+benchmark_session_writes`` compares both.
+
+The side store needs a cache shared by every worker process (utils.cache).
+A process-local copy (the LocMemCache default) would go stale as soon as
+another worker serves the user, and AutoLogoutMiddleware would log out an
+active user from the idle time of an old copy. Without a shared cache the
+fields are read from the session itself and only the write interval is
+kept: activity recorded between two writes is not carried over.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from utils.cache import is_shared_cache
+
+logger = logging.getLogger(__name__)
+
+SESSION_ACTIVITY_SAVE_INTERVAL = getattr(settings, 'SESSION_ACTIVITY_SAVE_INTERVAL', 60)
+
+# Session fields kept in the side store between session writes
+VOLATILE_KEYS = ('last_activity', 'last_validation', 'user_activity')
+
+# Session field holding the time of the last session write
+SAVED_AT_KEY = '_activity_saved_at'
+
+
+def _clock():
+    return time.time()
+
+
+def _cache_key(session_key):
+    return f'session_activity:{session_key}'
+
+
+class SessionActivity:
+    """The volatile session fields of one request"""
+
+    def __init__(self, session):
+        self.session = session
+        self.session_key = session.session_key
+        self.shared = is_shared_cache()
+        stored = cache.get(_cache_key(self.session_key)) if self.session_key and self.shared else None
+        if stored is None:
+            # Sessions written before the side store, or after a cache flush
+            stored = {name: session[name] for name in VOLATILE_KEYS if name in session}
+        self.data = stored
+        self.persist = False
+
+    def get(self, name, default=None):
+        return self.data.get(name, default)
+
+    def set(self, name, value, persist=False):
+        """Set a volatile field; ``persist`` forces a session write this request"""
+        self.data[name] = value
+        self.persist = self.persist or persist
+
+    def pop(self, name):
+        self.data.pop(name, None)
+
+    def commit(self):
+        """Save the fields and decide whether the session row is rewritten"""
+        session = self.session
+        session_key = session.session_key
+        if session_key != self.session_key and self.session_key and self.shared:
+            cache.delete(_cache_key(self.session_key))
+        if not session_key or '_auth_user_id' not in session:
+            # Flushed (logged out): nothing left to track
+            return
+
+        if self.shared:
+            cache.set(_cache_key(session_key), self.data, settings.SESSION_COOKIE_AGE)
+
+        now = _clock()
+        interval = getattr(settings, 'SESSION_ACTIVITY_SAVE_INTERVAL', SESSION_ACTIVITY_SAVE_INTERVAL)
+        due = now - session.get(SAVED_AT_KEY, 0) >= interval
+        if session.modified or self.persist or due:
+            session.update(self.data)
+            session[SAVED_AT_KEY] = now
+
+
+def get(request):
+    """The request's SessionActivity (created on first use)"""
+    activity = getattr(request, '_session_activity', None)
+    if activity is None:
+        activity = SessionActivity(request.session)
+        request._session_activity = activity
+    return activity
+
+
+class SessionActivityMiddleware:
+    """
+    Commits the request's SessionActivity once the inner middlewares and the
+    view are done. Must wrap AutoLogoutMiddleware, SessionValidationMiddleware
+    and UserActivityTrackingMiddleware, and run with SESSION_SAVE_EVERY_REQUEST
+    off, so the session row is only written when commit() asks for it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        activity = getattr(request, '_session_activity', None)
+        if activity is not None:
+            try:
+                activity.commit()
+            except Exception as e:
+                logger.error(f"Could not save session activity: {e}")
+        return response
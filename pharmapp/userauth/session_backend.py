@@ -0,0 +1,343 @@
+"""
+Cache-first session engine with database write-behind (SESSION_ENGINE =
+'userauth.session_backend').
+
+The database engine read the ``django_session`` row on every request and
+SessionCleanupMiddleware swept the whole table for expired rows inline,
+every 100 requests, on whichever request happened to be the 100th.
+
+This engine builds on Django's cached_db engine:
+
+    * reads are served from the SESSION_CACHE_ALIAS cache and fall back to
+      the database on a miss (a restart, an eviction, another worker);
+    * creating and deleting a session (login, logout, key rotation) write
+      the database immediately, so a key is never handed out twice and a
+      logged-out session cannot come back;
+    * other saves update the cache at once and are written to the database
+      by a background worker after at most SESSION_WRITE_BEHIND_DELAY
+      seconds, coalesced per session, and when the process exits. Saves
+      inside a transaction are queued when it commits. Set
+      SESSION_WRITE_BEHIND=False to write through instead;
+    * the same worker deletes expired sessions every SESSION_CLEANUP_INTERVAL
+      seconds in chunks of SESSION_CLEANUP_BATCH_SIZE rows (also what
+      ``manage.py clearsessions`` does with this engine).
+
+A row read from the database on a miss may be older than a save still
+waiting to be written: a save deferred by this process is served instead,
+and the worker drops the cache entry of every row it writes, so a row read
+before another process's write reaches the database is not kept past it.
+
+The cache layer needs a session cache shared by every worker process (see
+SESSION_CACHE_BACKEND). With a process-local one (the LocMemCache default)
+a worker would keep serving a session another worker changed or logged
+out, so sessions are read from and written to the database directly, as
+by Django's db engine; the chunked cleanup still applies. ``stats()``
+reports the cache hit rate and the write-behind and cleanup counters
+(``/api/session-store/stats/``).
+"""
+import atexit
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.core.cache import caches
+from django.db import close_old_connections, connection, router, transaction
+from django.utils import timezone
+
+from utils.cache import is_shared_cache
+
+logger = logging.getLogger(__name__)
+
+SESSION_WRITE_BEHIND_DELAY = getattr(settings, 'SESSION_WRITE_BEHIND_DELAY', 1.0)
+SESSION_CLEANUP_INTERVAL = getattr(settings, 'SESSION_CLEANUP_INTERVAL', 3600)
+SESSION_CLEANUP_BATCH_SIZE = getattr(settings, 'SESSION_CLEANUP_BATCH_SIZE', 1000)
+
+
+class SessionStoreWorker:
+    """Writes deferred session saves to the database and deletes expired sessions"""
+
+    def __init__(self, delay=None, cleanup_interval=None, batch_size=None, background=True):
+        self.background = background
+        self.delay = delay or SESSION_WRITE_BEHIND_DELAY
+        self.cleanup_interval = cleanup_interval or SESSION_CLEANUP_INTERVAL
+        self.batch_size = batch_size or SESSION_CLEANUP_BATCH_SIZE
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._next_cleanup = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.deferred_writes = 0
+        self.db_writes = 0
+        self.lost_writes = 0
+        self.expired_deleted = 0
+        self.last_cleanup_at = None
+
+    def count_read(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    # ── write-behind ────────────────────────────────────────────────────────
+
+    def defer(self, model, session_key, session_data, expire_date):
+        """Write the session row later; a newer save of the same session replaces it"""
+        with self._lock:
+            self._pending[session_key] = (model, session_data, expire_date)
+            self.deferred_writes += 1
+        if self.background:
+            self.start()
+
+    def pending_data(self, session_key):
+        """The encoded data of a deferred save of ``session_key``, or None"""
+        with self._lock:
+            pending = self._pending.get(session_key)
+        return pending[1] if pending else None
+
+    def discard(self, session_key):
+        """Forget a deferred write (the session was deleted)"""
+        with self._lock:
+            self._pending.pop(session_key, None)
+
+    def flush(self):
+        """Write every deferred save now; returns the number of rows written"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            written = []
+            for session_key, (model, session_data, expire_date) in pending.items():
+                try:
+                    # update(), never insert: a session deleted since must stay deleted
+                    if model.objects.using(router.db_for_write(model)).filter(
+                        session_key=session_key
+                    ).update(session_data=session_data, expire_date=expire_date):
+                        written.append(session_key)
+                except Exception as e:
+                    with self._lock:
+                        self.lost_writes += 1
+                    logger.error(f"Could not write session {session_key[:8]}… to the database: {e}")
+            with self._lock:
+                self.db_writes += len(written)
+                # Entries of sessions saved again since are still the newest
+                stale = [key for key in written if key not in self._pending]
+            self._drop_cached(stale)
+            return len(written)
+
+    def _drop_cached(self, session_keys):
+        # Another process may have cached the row these writes replaced
+        if not session_keys:
+            return
+        try:
+            caches[settings.SESSION_CACHE_ALIAS].delete_many(
+                [SessionStore.cache_key_prefix + key for key in session_keys]
+            )
+        except Exception as e:
+            logger.error(f"Could not drop {len(session_keys)} written sessions from the cache: {e}")
+
+    # ── expiry cleanup ──────────────────────────────────────────────────────
+
+    def clear_expired(self, model, batch_size=None):
+        """Delete expired sessions in chunks of ``batch_size``; returns the number deleted"""
+        batch_size = batch_size or self.batch_size
+        deleted = 0
+        now = timezone.now()
+        while True:
+            keys = list(
+                model.objects.filter(expire_date__lt=now)
+                .values_list('session_key', flat=True)[:batch_size]
+            )
+            if not keys:
+                break
+            deleted += model.objects.filter(session_key__in=keys, expire_date__lt=now).delete()[0]
+            if len(keys) < batch_size or self._stop.is_set():
+                break
+        with self._lock:
+            self.expired_deleted += deleted
+            self.last_cleanup_at = time.time()
+        if deleted:
+            logger.info(f"Deleted {deleted} expired sessions")
+        return deleted
+
+    # ── thread ──────────────────────────────────────────────────────────────
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.delay)
+            self._wake.clear()
+            try:
+                self.flush()
+                if time.monotonic() >= self._next_cleanup:
+                    self._next_cleanup = time.monotonic() + self.cleanup_interval
+                    SessionStore.clear_expired()
+            except Exception as e:
+                logger.error(f"Session store worker failed: {e}", exc_info=True)
+            finally:
+                close_old_connections()
+
+    def start(self):
+        """Start the worker thread (no-op if it is already running)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            # First sweep one interval after start, not on the request that started it
+            self._next_cleanup = time.monotonic() + self.cleanup_interval
+            self._thread = threading.Thread(target=self._run, name='session-store-worker', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        """Stop the thread and write whatever is still deferred"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def stats(self):
+        with self._lock:
+            reads = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / reads, 4) if reads else 0.0,
+                'pending_writes': len(self._pending),
+                'deferred_writes': self.deferred_writes,
+                'db_writes': self.db_writes,
+                'lost_writes': self.lost_writes,
+                'expired_deleted': self.expired_deleted,
+                'last_cleanup_at': self.last_cleanup_at,
+                'running': self.running,
+            }
+
+
+worker = SessionStoreWorker()
+atexit.register(worker.stop)
+
+
+class SessionStore(CachedDBStore):
+    """
+    cached_db sessions with hit/miss counters, write-behind and chunked
+    cleanup; db sessions when the session cache is process-local
+    """
+
+    cache_key_prefix = 'userauth.session_backend'
+
+    @property
+    def _shared(self):
+        return is_shared_cache(settings.SESSION_CACHE_ALIAS)
+
+    def exists(self, session_key):
+        if not self._shared:
+            return DBStore.exists(self, session_key)
+        return super().exists(session_key)
+
+    def load(self):
+        if not self._shared:
+            return DBStore.load(self)
+
+        try:
+            data = self._cache.get(self.cache_key)
+        except Exception:
+            # Invalid cache keys raise on some backends; read the database
+            data = None
+        worker.count_read(hit=data is not None)
+        if data is not None:
+            return data
+
+        pending = worker.pending_data(self._session_key) if self._session_key else None
+        if pending is not None:
+            # The database row is older than this save
+            return self.decode(pending)
+
+        s = self._get_session_from_db()
+        if not s:
+            return {}
+        data = self.decode(s.session_data)
+        # add(): a save that lands meanwhile is newer than this row
+        self._cache.add(self.cache_key, data, self.get_expiry_age(expiry=s.expire_date))
+        return data
+
+    async def aexists(self, session_key):
+        if not self._shared:
+            return await DBStore.aexists(self, session_key)
+        return await super().aexists(session_key)
+
+    async def aload(self):
+        if not self._shared:
+            return await DBStore.aload(self)
+        return await sync_to_async(self.load)()
+
+    def save(self, must_create=False):
+        if not self._shared:
+            return DBStore.save(self, must_create)
+        if must_create or self.session_key is None or not getattr(settings, 'SESSION_WRITE_BEHIND', True):
+            return super().save(must_create)
+
+        obj = self.create_model_instance(self._get_session(no_load=must_create))
+        try:
+            self._cache.set(self.cache_key, self._session, self.get_expiry_age())
+        except Exception:
+            logger.exception(f"Error saving to cache ({self._cache}), writing through")
+            return super().save(must_create)
+
+        def defer():
+            worker.defer(self.model, obj.session_key, obj.session_data, obj.expire_date)
+
+        if connection.in_atomic_block:
+            # The worker's connection cannot update a row this transaction created
+            transaction.on_commit(defer)
+        else:
+            defer()
+
+    def delete(self, session_key=None):
+        key = session_key or self.session_key
+        if key is not None:
+            worker.discard(key)
+        if not self._shared:
+            return DBStore.delete(self, session_key)
+        super().delete(session_key)
+
+    async def asave(self, must_create=False):
+        if not self._shared:
+            return await DBStore.asave(self, must_create)
+        return await super().asave(must_create)
+
+    async def adelete(self, session_key=None):
+        key = session_key or self.session_key
+        if key is not None:
+            worker.discard(key)
+        if not self._shared:
+            return await DBStore.adelete(self, session_key)
+        return await super().adelete(session_key)
+
+    @classmethod
+    def clear_expired(cls):
+        return worker.clear_expired(cls.get_model_class())
+
+
+def start_worker():
+    """Start the process-wide worker (write-behind and periodic cleanup)"""
+    worker.start()
+
+
+def stats():
+    return worker.stats()
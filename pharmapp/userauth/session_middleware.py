@@ -4,13 +4,15 @@ This middleware prevents session hijacking and ensures each user has independent
 """
 
 from django.contrib.auth import logout
-from django.contrib.sessions.models import Session
 from django.utils import timezone
 from django.http import HttpResponseRedirect
 from django.urls import reverse
 from django.contrib import messages
 import logging
 
+from . import session_activity
+from .session_backend import start_worker
+
 logger = logging.getLogger(__name__)
 
 
@@ -70,7 +72,7 @@ class SessionValidationMiddleware:
                 request.session['session_created'] = timezone.now().isoformat()
             
             # Validate session hasn't been tampered with
-            expected_session_key = self._generate_session_validation_key(request.user)
+            expected_session_key = self._session_validation_key(request)
             stored_session_key = request.session.get('session_validation_key')
             
             if stored_session_key != expected_session_key:
@@ -86,16 +88,22 @@ class SessionValidationMiddleware:
     def _update_session_data(self, request):
         """
         Update session with user-specific data for validation.
+
+        Persisted fields are only assigned when they change, so the session is
+        not marked modified (and rewritten) on every request; last_validation
+        goes to the session activity side store.
         """
         try:
             # Store user-specific session data
-            request.session['user_id'] = request.user.id
-            request.session['username'] = request.user.username
-            request.session['last_validation'] = timezone.now().isoformat()
-
-            # Generate and store session validation key
-            validation_key = self._generate_session_validation_key(request.user)
-            request.session['session_validation_key'] = validation_key
+            session_data = {
+                'user_id': request.user.id,
+                'username': request.user.username,
+                'session_validation_key': self._session_validation_key(request),
+            }
+            for name, value in session_data.items():
+                if request.session.get(name) != value:
+                    request.session[name] = value
+            session_activity.get(request).set('last_validation', timezone.now().isoformat())
 
             # Ensure user-specific session namespace exists
             if 'user_data' not in request.session:
@@ -104,6 +112,12 @@ class SessionValidationMiddleware:
         except Exception as e:
             logger.error(f"Error updating session data: {e}")
 
+    def _session_validation_key(self, request):
+        """The user's validation key, generated once per request."""
+        if not hasattr(request, '_session_validation_key'):
+            request._session_validation_key = self._generate_session_validation_key(request.user)
+        return request._session_validation_key
+
     def _generate_session_validation_key(self, user):
         """
         Generate a user-specific session validation key.
@@ -117,34 +131,17 @@ class SessionValidationMiddleware:
 
 class SessionCleanupMiddleware:
     """
-    Middleware to clean up expired sessions and prevent session buildup.
+    Starts the session store worker (userauth.session_backend), which deletes
+    expired sessions in bounded chunks in the background. Requests no longer
+    pay for the sweep.
     """
     
     def __init__(self, get_response):
         self.get_response = get_response
-        self.cleanup_counter = 0
+        start_worker()
 
     def __call__(self, request):
-        # Periodically clean up expired sessions (every 100 requests)
-        self.cleanup_counter += 1
-        if self.cleanup_counter >= 100:
-            self._cleanup_expired_sessions()
-            self.cleanup_counter = 0
-        
-        response = self.get_response(request)
-        return response
-
-    def _cleanup_expired_sessions(self):
-        """
-        Clean up expired sessions from the database.
-        """
-        try:
-            expired_sessions = Session.objects.filter(expire_date__lt=timezone.now())
-            count = expired_sessions.count()
-            expired_sessions.delete()
-            logger.info(f"Cleaned up {count} expired sessions")
-        except Exception as e:
-            logger.error(f"Error cleaning up sessions: {e}")
+        return self.get_response(request)
 
 
 class UserActivityTrackingMiddleware:
@@ -172,14 +169,19 @@ class UserActivityTrackingMiddleware:
         Track user activity in their session for security monitoring.
         """
         try:
+            # Kept in the session activity side store, not written to the
+            # session on every request
+            activity = session_activity.get(request)
+
             # Get or initialize activity tracking data
-            activity_data = request.session.get('user_activity', {
+            activity_data = activity.get('user_activity') or {
                 'login_time': timezone.now().isoformat(),
                 'page_views': 0,
                 'last_activity': timezone.now().isoformat(),
                 'ip_address': self._get_client_ip(request),
                 'user_agent': request.META.get('HTTP_USER_AGENT', '')[:200]
-            })
+            }
+            ip_changed = False
             
             # Update activity data
             activity_data['page_views'] += 1
@@ -192,9 +194,10 @@ class UserActivityTrackingMiddleware:
                              f"{activity_data['ip_address']} -> {current_ip}")
                 # Update IP but log the change
                 activity_data['ip_address'] = current_ip
+                ip_changed = True
             
-            # Store updated activity data
-            request.session['user_activity'] = activity_data
+            # Store updated activity data (an IP change is saved right away)
+            activity.set('user_activity', activity_data, persist=ip_changed)
             
         except Exception as e:
             logger.error(f"Error tracking user activity: {e}")
@@ -1,7 +1,21 @@
-from django.test import TestCase, Client
+from unittest import mock
+
+from django.test import TestCase, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.utils import timezone
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.contrib.sessions.models import Session
 from django.contrib.auth import get_user_model
+from django.http import HttpResponse
 from django.urls import reverse
-from userauth.models import Profile, PasswordChangeHistory
+from django.urls.resolvers import URLResolver
+from userauth.models import Profile, PasswordChangeHistory, ActivityLog, UserPermission
+from userauth.activity_writer import ActivityLogWriter
+from userauth import session_activity, session_backend
+from userauth.middleware import ActivityMiddleware, RoleBasedAccessMiddleware
+from pharmapp import route_metadata
 
 User = get_user_model()
 
@@ -218,3 +232,377 @@ class PasswordChangeTestCase(TestCase):
         # Should show validation error
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'Passwords do not match')
+
+
+class ActivityLogWriterTestCase(TestCase):
+    """Test cases for the batched activity log writer"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='writer',
+            mobile='08055555555',
+            password='writerpass123'
+        )
+        # No background thread: the tests flush by hand
+        self.writer = ActivityLogWriter(batch_size=2, max_queue=3, background=False)
+
+    def _entry(self, action):
+        return ActivityLog(user=self.user, action=action, action_type='OTHER')
+
+    def test_entries_are_written_in_batches_on_flush(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                self.writer.log(self._entry(f'action {i}'))
+        self.assertEqual(ActivityLog.objects.count(), 0)
+        self.assertEqual(self.writer.stats()['queue_depth'], 3)
+
+        with self.assertNumQueries(2):
+            self.assertEqual(self.writer.flush(), 3)
+        self.assertEqual(
+            sorted(ActivityLog.objects.values_list('action', flat=True)),
+            ['action 0', 'action 1', 'action 2']
+        )
+        stats = self.writer.stats()
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertEqual(stats['written'], 3)
+        self.assertIsNotNone(stats['last_flush_at'])
+
+    def test_entries_wait_for_the_transaction_to_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.writer.log(self._entry('uncommitted'))
+        self.assertEqual(self.writer.stats()['queue_depth'], 0)
+        self.assertEqual(len(callbacks), 1)
+
+    def test_full_queue_falls_back_to_synchronous_writes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(5):
+                self.writer.log(self._entry(f'action {i}'))
+        stats = self.writer.stats()
+        self.assertEqual(stats['queue_depth'], 3)
+        self.assertEqual(stats['sync_writes'], 2)
+        self.assertEqual(ActivityLog.objects.count(), 2)
+
+        self.writer.flush()
+        self.assertEqual(ActivityLog.objects.count(), 5)
+
+
+class EffectivePermissionsTestCase(TestCase):
+    """Test cases for the cached effective-permission set behind has_permission"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='pharmacist',
+            mobile='08066666666',
+            password='pharmpass123'
+        )
+        self.user.profile.user_type = 'Pharmacist'
+        self.user.profile.save()
+
+    def _fresh_user(self):
+        return User.objects.select_related('profile').get(pk=self.user.pk)
+
+    def test_permissions_are_resolved_once_per_request(self):
+        from userauth.permissions import can_operate_retail, can_operate_wholesale
+
+        user = self._fresh_user()
+        with self.assertNumQueries(1):
+            self.assertTrue(can_operate_retail(user))
+            self.assertFalse(can_operate_wholesale(user))
+            self.assertFalse(user.has_permission('manage_users'))
+
+        # Later requests are served from a shared cache
+        with mock.patch('userauth.effective_permissions.is_shared_cache', return_value=True):
+            self.assertTrue(can_operate_retail(self._fresh_user()))
+            user = self._fresh_user()
+            with self.assertNumQueries(0):
+                self.assertTrue(can_operate_retail(user))
+
+    def test_process_local_cache_is_not_shared_across_requests(self):
+        self.assertTrue(self._fresh_user().has_permission('operate_retail'))
+
+        # As if revoked through another worker, whose version bump this
+        # process's LocMem cache never sees
+        with mock.patch('userauth.models.invalidate_permissions'):
+            UserPermission.objects.create(user=self.user, permission='operate_retail', granted=False)
+        user = self._fresh_user()
+        with self.assertNumQueries(1):
+            self.assertFalse(user.has_permission('operate_retail'))
+
+    def test_overrides_take_effect_immediately(self):
+        self.assertTrue(self.user.has_permission('operate_retail'))
+        self.assertFalse(self.user.has_permission('manage_users'))
+
+        UserPermission.objects.create(user=self.user, permission='operate_retail', granted=False)
+        UserPermission.objects.create(user=self.user, permission='manage_users', granted=True)
+        self.assertFalse(self.user.has_permission('operate_retail'))
+        self.assertFalse(self._fresh_user().has_permission('operate_retail'))
+        self.assertTrue(self._fresh_user().has_permission('manage_users'))
+
+        UserPermission.objects.filter(user=self.user).delete()
+        self.assertTrue(self._fresh_user().has_permission('operate_retail'))
+        self.assertEqual(
+            sorted(self._fresh_user().get_permissions()),
+            sorted(Profile.objects.get(user=self.user).get_role_permissions())
+        )
+
+    def test_role_change_takes_effect_immediately(self):
+        self.assertFalse(self._fresh_user().has_permission('operate_wholesale'))
+
+        profile = Profile.objects.get(user=self.user)
+        profile.user_type = 'Wholesale Manager'
+        profile.save()
+        self.assertTrue(self._fresh_user().has_permission('operate_wholesale'))
+        self.assertFalse(self._fresh_user().has_permission('operate_retail'))
+
+
+# Write-through, so the saves the activity layer lets through show up as UPDATEs
+@override_settings(SESSION_ACTIVITY_SAVE_INTERVAL=60, SESSION_WRITE_BEHIND=False)
+class SessionActivityTestCase(TestCase):
+    """Test cases for coalesced session writes"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='sessionuser',
+            mobile='08088888888',
+            password='sessionpass123'
+        )
+        self.client.force_login(self.user)
+        self.now = 1_000_000.0
+        patcher = mock.patch.object(session_activity, '_clock', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # The test cache is LocMem; stand it in for a shared one
+        self.shared = mock.patch('userauth.session_activity.is_shared_cache', return_value=True)
+        self.shared.start()
+        self.addCleanup(self.shared.stop)
+
+    def _get(self, seconds_later, **extra):
+        self.now += seconds_later
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/health/', **extra)
+        writes = [
+            q for q in context.captured_queries
+            if 'django_session' in q['sql'] and q['sql'].startswith('UPDATE')
+        ]
+        return response, len(writes)
+
+    def _activity(self):
+        return cache.get(f'session_activity:{self.client.session.session_key}')
+
+    def test_session_is_written_at_most_once_per_interval(self):
+        self.assertEqual(self._get(0)[1], 1)
+        views = self._activity()['user_activity']['page_views']
+
+        self.assertEqual([self._get(10)[1] for _ in range(5)], [0] * 5)
+        self.assertEqual(self._activity()['user_activity']['page_views'], views + 5)
+        self.assertEqual(self._get(15)[1], 1)
+        # The write carries the activity recorded in between
+        self.assertEqual(self.client.session['user_activity']['page_views'], views + 6)
+
+    def test_ip_change_is_written_immediately(self):
+        self._get(0, REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(self._get(1, REMOTE_ADDR='10.0.0.2')[1], 1)
+        self.assertEqual(self.client.session['user_activity']['ip_address'], '10.0.0.2')
+
+    def test_auto_logout_reads_last_activity_from_side_store(self):
+        self._get(0)
+        activity = self._activity()
+        idle = timezone.now() - timezone.timedelta(minutes=settings.AUTO_LOGOUT_DELAY + 1)
+        activity['last_activity'] = idle.isoformat()
+        cache.set(f'session_activity:{self.client.session.session_key}', activity)
+
+        self._get(1)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_process_local_cache_reads_the_session(self):
+        self.shared.stop()
+        self._get(0)
+        self.assertEqual(self._activity(), None)
+
+        # A copy left by a worker that last served the user 45 minutes ago
+        # (the session holds the activity written through other workers)
+        idle = timezone.now() - timezone.timedelta(minutes=settings.AUTO_LOGOUT_DELAY + 5)
+        cache.set(f'session_activity:{self.client.session.session_key}', {'last_activity': idle.isoformat()})
+
+        self.assertEqual(self._get(10)[1], 0)
+        self.assertIn('_auth_user_id', self.client.session)
+        self.assertEqual(self._get(60)[1], 1)
+        self.assertIn('_auth_user_id', self.client.session)
+
+
+class SessionBackendTestCase(TestCase):
+    """Test cases for the cache-first session engine"""
+
+    def setUp(self):
+        caches['sessions'].clear()
+        self.worker = session_backend.SessionStoreWorker(batch_size=2, background=False)
+        patcher = mock.patch.object(session_backend, 'worker', self.worker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # The test 'sessions' cache is LocMem; stand it in for a shared one
+        self.enterContext(mock.patch('userauth.session_backend.is_shared_cache', return_value=True))
+
+    def _create(self, **data):
+        store = session_backend.SessionStore()
+        store.update(data)
+        store.create()
+        return store
+
+    def _db_data(self, session_key):
+        return session_backend.SessionStore().decode(Session.objects.get(session_key=session_key).session_data)
+
+    def test_reads_are_served_from_the_cache(self):
+        key = self._create(cart='retail').session_key
+        with self.assertNumQueries(0):
+            self.assertEqual(session_backend.SessionStore(key)['cart'], 'retail')
+
+        caches['sessions'].clear()
+        self.assertEqual(session_backend.SessionStore(key)['cart'], 'retail')
+        with self.assertNumQueries(0):
+            self.assertEqual(session_backend.SessionStore(key)['cart'], 'retail')
+
+        stats = self.worker.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+        self.assertEqual(stats['hit_rate'], 0.6667)
+
+    def test_saves_are_written_behind(self):
+        store = self._create(cart='retail')
+        store['cart'] = 'wholesale'
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(0):
+            store.save()
+
+        self.assertEqual(session_backend.SessionStore(store.session_key)['cart'], 'wholesale')
+        self.assertEqual(self._db_data(store.session_key)['cart'], 'retail')
+        self.assertEqual(self.worker.stats()['pending_writes'], 1)
+
+        self.assertEqual(self.worker.flush(), 1)
+        self.assertEqual(self._db_data(store.session_key)['cart'], 'wholesale')
+
+    def test_rows_older_than_a_pending_save_are_not_cached(self):
+        store = self._create(cart='retail')
+        store['cart'] = 'wholesale'
+        with self.captureOnCommitCallbacks(execute=True):
+            store.save()
+
+        # Evicted before the write reached the database
+        caches['sessions'].clear()
+        self.assertEqual(session_backend.SessionStore(store.session_key)['cart'], 'wholesale')
+        self.assertIsNone(caches['sessions'].get(store.cache_key))
+
+        # A row another process cached before the write is dropped with it
+        caches['sessions'].set(store.cache_key, {'cart': 'retail'})
+        self.worker.flush()
+        self.assertIsNone(caches['sessions'].get(store.cache_key))
+        self.assertEqual(session_backend.SessionStore(store.session_key)['cart'], 'wholesale')
+
+    def test_process_local_cache_uses_the_database(self):
+        store = self._create(cart='retail')
+        with mock.patch('userauth.session_backend.is_shared_cache', return_value=False):
+            # Logged out through another worker, whose cache this one never sees
+            Session.objects.filter(session_key=store.session_key).delete()
+            self.assertFalse(session_backend.SessionStore(store.session_key).exists(store.session_key))
+            self.assertEqual(session_backend.SessionStore(store.session_key).load(), {})
+
+            store = self._create(cart='retail')
+            store['cart'] = 'wholesale'
+            store.save()
+            self.assertEqual(self._db_data(store.session_key)['cart'], 'wholesale')
+        self.assertEqual(self.worker.stats()['pending_writes'], 0)
+
+    def test_deleted_session_is_not_written_back(self):
+        store = self._create(cart='retail')
+        store['cart'] = 'wholesale'
+        with self.captureOnCommitCallbacks(execute=True):
+            store.save()
+        store.delete()
+
+        self.assertEqual(self.worker.flush(), 0)
+        self.assertFalse(Session.objects.filter(session_key=store.session_key).exists())
+
+    def test_expired_sessions_are_deleted_in_chunks(self):
+        past = timezone.now() - timezone.timedelta(days=1)
+        Session.objects.bulk_create([
+            Session(session_key=f'expired{i:02d}', session_data='', expire_date=past) for i in range(5)
+        ])
+        live = self._create(cart='retail').session_key
+
+        with self.assertNumQueries(6):  # 3 chunks of a SELECT and a DELETE
+            self.assertEqual(session_backend.SessionStore.clear_expired(), 5)
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), [live])
+        self.assertEqual(self.worker.stats()['expired_deleted'], 5)
+
+
+class RouteMetadataTestCase(TestCase):
+    """Test cases for the shared route table read by the middlewares"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='router',
+            mobile='08066666666',
+            password='routerpass123'
+        )
+        Profile.objects.filter(user=self.user).update(user_type='Salesperson')
+        self.user.refresh_from_db()
+
+    def _request(self, method, path):
+        request = getattr(RequestFactory(), method)(path)
+        request.user = self.user
+        request.session = {}
+        request._messages = mock.MagicMock()
+        return request
+
+    def test_table_is_keyed_by_route(self):
+        table = route_metadata.routes()
+        # store:index is served at two paths, only one of them is exempt
+        self.assertEqual(table['store/index/']['name'], 'store:index')
+        self.assertTrue(table['store/index/']['subscription_exempt'])
+        self.assertFalse(table['store/']['subscription_exempt'])
+
+        self.assertEqual(table['api/health/']['cache_ttl'], 60)
+        self.assertTrue(table['api/health/']['audit_skip'])
+        self.assertEqual(table['store/customer_list/']['roles'], RoleBasedAccessMiddleware.ROLE_REQUIRED_URLS['store:customer_list'])
+
+        delete_item = table['store/delete_item/<int:pk>/']
+        self.assertEqual((delete_item['audit_action'], delete_item['target_model']), ('DELETE', 'Item'))
+
+    def test_middlewares_share_one_resolution(self):
+        request = self._request('post', '/store/delete_item/42/')
+        resolve = URLResolver.resolve
+        paths = []
+
+        def counting_resolve(resolver, path):
+            paths.append(path)
+            return resolve(resolver, path)
+
+        with mock.patch.object(URLResolver, 'resolve', counting_resolve), \
+                mock.patch('userauth.middleware.activity_writer.log_activity') as log_activity:
+            ActivityMiddleware(lambda r: HttpResponse('ok')).process_request(request)
+            response = RoleBasedAccessMiddleware(lambda r: HttpResponse('ok'))(request)
+
+        # Sub-resolvers see the path without its leading slash
+        self.assertEqual([path for path in paths if path.startswith('/')], ['/store/delete_item/42/'])
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(request.route['name'], 'store:delete_item')
+        fields = log_activity.call_args.kwargs
+        self.assertEqual(
+            (fields['action_type'], fields['target_model'], fields['target_id']),
+            ('DELETE', 'Item', '42')
+        )
+
+    def test_undecided_prefix_rules_use_the_request_path(self):
+        table = route_metadata.routes()
+        # <int:stock_check_id> alone cannot rule out /store/index/
+        self.assertIsNone(table['store/<int:stock_check_id>/report/']['subscription_exempt'])
+        route = route_metadata.route_for(self._request('get', '/store/7/report/'))
+        self.assertFalse(route['subscription_exempt'])
+        self.assertTrue(route['audit_get'])
+
+    def test_unresolved_paths_are_described_from_the_path(self):
+        request = self._request('post', '/static/js/add_item/3/')
+        route = route_metadata.route_for(request)
+        self.assertIsNone(route['name'])
+        self.assertTrue(route['audit_skip'])
+        self.assertTrue(route['subscription_exempt'])
+        self.assertEqual(route_metadata.target_id(request), '3')
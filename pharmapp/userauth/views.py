@@ -16,6 +16,7 @@ from django.db import models
 import random
 import json
 from .permissions import role_required
+from utils.pagination import KeysetPaginator, estimated_count, pagination_params
 from .context_processors import clear_user_permissions_cache
 
 
@@ -188,8 +189,8 @@ def activity_dashboard(request):
     # Order by most recent first
     logs = logs.order_by('-timestamp')
 
-    # Get statistics (based on filtered logs)
-    total_logs = logs.count()
+    # Get statistics (based on filtered logs); the total is a cached estimate
+    total_logs = estimated_count(logs)
 
     # Calculate meaningful statistics based on search criteria
     today = timezone.now().date()
@@ -205,12 +206,12 @@ def activity_dashboard(request):
 
         if date_filter:
             # Single date filter - show activities for that specific date
-            today_logs = logs.filter(timestamp__date=date_filter).count()
+            today_logs = total_logs  # logs are already limited to that date
             filtered_date_label = f"Activities on {date_filter.strftime('%Y-%m-%d')}"
             has_date_filter = True
         elif date_from or date_to:
             # Date range filter - show total activities in the range
-            today_logs = logs.count()  # All logs in the filtered range
+            today_logs = total_logs  # All logs in the filtered range
             if date_from and date_to:
                 filtered_date_label = f"Activities from {date_from.strftime('%Y-%m-%d')} to {date_to.strftime('%Y-%m-%d')}"
             elif date_from:
@@ -235,14 +236,15 @@ def activity_dashboard(request):
         last_week = timezone.now() - timezone.timedelta(days=7)
         active_users = logs.filter(timestamp__gte=last_week).values('user').distinct().count()
 
-    # Limit to 50 most recent for display
-    recent_logs = logs[:50]
+    # 50 per page, most recent first (keyset pagination on timestamp, id)
+    recent_logs = KeysetPaginator(logs, 50, ordering=('-timestamp', '-id')).page(request.GET.get('cursor'))
 
     context = {
         'total_logs': total_logs,
         'today_logs': today_logs,
         'active_users': active_users,
         'recent_logs': recent_logs,
+        'search_params': pagination_params(request),
         'search_form': search_form,
         'can_view_all_users': can_view_all_users,
         'filtered_date_label': filtered_date_label,
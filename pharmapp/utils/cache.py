@@ -0,0 +1,20 @@
+"""
+Cache backend helpers.
+
+State kept in a process-local cache (LocMemCache, or DummyCache which keeps
+nothing) is invisible to the other worker processes of a multi-process
+deployment (``gunicorn -w N``). Features that rely on the cache to share
+state between requests check ``is_shared_cache()`` and fall back to the
+database, or to shorter lifetimes, when it returns False.
+"""
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+# Backends whose entries are only seen by the process that wrote them
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def is_shared_cache(alias='default'):
+    """True when every worker process reads the same ``alias`` cache (Redis, Memcached, database, ...)"""
+    return not isinstance(caches[alias], PROCESS_LOCAL_BACKENDS)
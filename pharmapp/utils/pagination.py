@@ -0,0 +1,169 @@
+"""
+Keyset (cursor) pagination for long, append-mostly histories.
+
+Django's Paginator runs a COUNT(*) over the filtered queryset and fetches
+page N with ``OFFSET (N - 1) * per_page``, so both get slower as history
+grows and the deeper a user pages. KeysetPaginator orders by a timestamp
+with the primary key as tie-breaker and continues from the last row shown:
+
+    WHERE (created_at, id) < (:last_created_at, :last_id)
+    ORDER BY created_at DESC, id DESC
+    LIMIT per_page + 1
+
+which is an index range scan whatever the page. Pages are addressed by an
+opaque ``cursor`` query parameter instead of a page number, and the total
+is an optional estimate: a COUNT cached for KEYSET_COUNT_CACHE_SECONDS.
+
+Usage::
+
+    paginator = KeysetPaginator(logs, 50, ordering=('-created_at', '-id'))
+    page_obj = paginator.page(request.GET.get('cursor'))
+
+and ``{% include 'partials/keyset_pagination.html' %}`` for the links.
+"""
+import base64
+import hashlib
+import json
+import logging
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+KEYSET_COUNT_CACHE_SECONDS = getattr(settings, 'KEYSET_COUNT_CACHE_SECONDS', 300)
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def pagination_params(request):
+    """The request's query string without its pagination parameters"""
+    params = {k: v for k, v in request.GET.items() if k not in ('cursor', 'page')}
+    return urlencode(params) if params else ''
+
+
+def estimated_count(queryset):
+    """COUNT(*) of ``queryset``, cached for KEYSET_COUNT_CACHE_SECONDS"""
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+    except Exception:
+        return queryset.count()
+    key = 'keyset_count:' + hashlib.md5(f'{queryset.db}:{sql}:{params}'.encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, getattr(settings, 'KEYSET_COUNT_CACHE_SECONDS', KEYSET_COUNT_CACHE_SECONDS))
+    return count
+
+
+class KeysetPage:
+    """One page of a KeysetPaginator; iterable like a Paginator page"""
+
+    def __init__(self, object_list, has_next, has_previous, paginator):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.paginator = paginator
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    @property
+    def next_cursor(self):
+        return self.paginator.encode_cursor(self.object_list[-1], NEXT) if self.has_next else None
+
+    @property
+    def previous_cursor(self):
+        return self.paginator.encode_cursor(self.object_list[0], PREVIOUS) if self.has_previous else None
+
+    @property
+    def count(self):
+        """Estimated number of rows of all pages, or None if not requested"""
+        return self.paginator.count
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class KeysetPaginator:
+    """
+    Paginate ``queryset`` by ``ordering``, a unique sort key such as
+    ``('-created_at', '-id')``: a timestamp followed by the primary key.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-id'), count=False):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = [field.lstrip('-') for field in self.ordering]
+        self.with_count = count
+        self._count = None
+
+    @property
+    def count(self):
+        if not self.with_count:
+            return None
+        if self._count is None:
+            self._count = estimated_count(self.queryset)
+        return self._count
+
+    def _model_field(self, name):
+        meta = self.queryset.model._meta
+        return meta.pk if name == 'pk' else meta.get_field(name)
+
+    def encode_cursor(self, obj, direction):
+        values = [self._model_field(name).value_to_string(obj) for name in self.fields]
+        return base64.urlsafe_b64encode(json.dumps([direction] + values).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Returns (direction, values), or None for a missing or malformed cursor"""
+        if not cursor:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            direction, values = data[0], data[1:]
+            if direction not in (NEXT, PREVIOUS) or len(values) != len(self.fields):
+                return None
+            return direction, [self._model_field(name).to_python(value) for name, value in zip(self.fields, values)]
+        except Exception:
+            logger.debug(f"Ignoring invalid pagination cursor {cursor!r}")
+            return None
+
+    def _after(self, values, reverse):
+        """Rows after ``values`` in ``ordering`` (before them if ``reverse``)"""
+        condition = Q()
+        for i, (field, value) in enumerate(zip(self.ordering, values)):
+            descending = field.startswith('-') != reverse
+            lookup = f"{self.fields[i]}__{'lt' if descending else 'gt'}"
+            equal = {name: prior for name, prior in zip(self.fields[:i], values[:i])}
+            condition |= Q(**equal, **{lookup: value})
+        return condition
+
+    def page(self, cursor=None):
+        decoded = self.decode_cursor(cursor)
+        direction, values = decoded if decoded else (NEXT, None)
+        reverse = direction == PREVIOUS
+
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._after(values, reverse))
+        ordering = [
+            field.lstrip('-') if field.startswith('-') else f'-{field}' for field in self.ordering
+        ] if reverse else list(self.ordering)
+        rows = list(queryset.order_by(*ordering)[:self.per_page + 1])
+
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+            return KeysetPage(rows, has_next=bool(rows), has_previous=more, paginator=self)
+        return KeysetPage(rows, has_next=more, has_previous=values is not None and bool(rows), paginator=self)
@@ -9,6 +9,7 @@ from decimal import Decimal
 from django.db.models import Sum, Q, F, ExpressionWrapper, DecimalField
 from collections import defaultdict
 from django.core.paginator import Paginator
+from utils.pagination import KeysetPaginator, pagination_params
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.views.decorators.http import require_POST, require_http_methods
 from django.views.decorators.csrf import csrf_exempt
@@ -34,6 +35,10 @@ logger = logging.getLogger(__name__)
 
 # Import GS1 barcode parser
 from store.gs1_parser import parse_barcode, is_gs1_barcode
+from store.search_index import ranked_search
+
+# Batched checkout engine for payment completion
+from store.checkout import checkout_payment_items, InsufficientStockError
 
 # Import ActivityLog for audit trail
 from userauth.models import ActivityLog
@@ -298,15 +303,8 @@ def search_wholesale_item(request):
 
         query = request.GET.get('search', '').strip()
         if query and len(query) >= 2:  # Only search for meaningful queries
-            # Optimized search with prefix matching first, then partial matching
-            items = WholesaleItem.objects.filter(
-                Q(name__istartswith=query) |  # Faster prefix search
-                Q(brand__istartswith=query) |
-                Q(dosage_form__istartswith=query) |
-                Q(name__icontains=query) |  # Fallback for partial matches
-                Q(brand__icontains=query) |
-                Q(dosage_form__icontains=query)
-            ).distinct().order_by('name')[:50]  # Limit results for performance
+            # Ranked search through the search index: prefix, then word, then fuzzy matches
+            items = ranked_search(WholesaleItem.objects.all(), query)[:50]  # Limit results for performance
         else:
             items = WholesaleItem.objects.all().order_by('name')[:50]  # Limit initial load
 
@@ -1042,15 +1040,11 @@ def wholesale_dispense_search_items(request):
                     logger.debug(f"Found {len(results)} results by barcode")
                 else:
                     # Fallback to name/brand search if barcode not found
-                    results = WholesaleItem.objects.filter(
-                        Q(name__icontains=query) | Q(brand__icontains=query)
-                    ).filter(stock__gt=0).order_by('name')[:50]
+                    results = ranked_search(WholesaleItem.objects.filter(stock__gt=0), query)[:50]
                     logger.debug(f"Barcode not found, found {len(results)} results by name/brand")
             else:
                 # Regular name/brand search
-                results = WholesaleItem.objects.filter(
-                    Q(name__icontains=query) | Q(brand__icontains=query)
-                ).filter(stock__gt=0).order_by('name')[:50]
+                results = ranked_search(WholesaleItem.objects.filter(stock__gt=0), query)[:50]
                 logger.debug(f"Found {len(results)} results")
         except Exception as e:
             logger.debug(f"Error searching items: {e}")
@@ -2977,7 +2971,6 @@ def return_wholesale_items_for_customer(request, pk):
 @never_cache
 def wholesale_receipt_list(request):
     if request.user.is_authenticated:
-        from django.core.paginator import Paginator
         from utils.date_utils import filter_queryset_by_date, get_date_filter_context
 
         # Get the date query from the GET request
@@ -2987,20 +2980,20 @@ def wholesale_receipt_list(request):
         receipts_queryset = WholesaleReceipt.objects.select_related(
             'wholesale_customer', 'cashier', 'sales'
         ).prefetch_related(
-            'receipt_payments'
+            'wholesale_receipt_payments'
         ).order_by('-date')
 
         # Filter by date if provided
         if date_query and date_context['is_valid_date']:
             receipts_queryset = filter_queryset_by_date(receipts_queryset, 'date', date_query)
 
-        paginator = Paginator(receipts_queryset, 50)
-        page_number = request.GET.get('page', 1)
-        receipts = paginator.get_page(page_number)
+        paginator = KeysetPaginator(receipts_queryset, 50, ordering=('-date', '-id'), count=True)
+        receipts = paginator.page(request.GET.get('cursor'))
 
         return render(request, 'partials/wholesale_receipt_list.html', {
             'receipts': receipts,
-            'is_paginated': paginator.num_pages > 1
+            'is_paginated': receipts.has_other_pages(),
+            'search_params': pagination_params(request),
         })
     else:
         return redirect('store:index')
@@ -3857,7 +3850,7 @@ def update_wholesale_item_quantity(request):
 
             # Update stock
             item.stock = new_quantity
-            item.save(update_fields=['stock'])
+            item.save(update_fields=['stock', 'updated_at'])
 
             # Create activity log for audit trail
             ActivityLog.objects.create(
@@ -4557,7 +4550,7 @@ def wholesale_bulk_adjust_stock(request, stock_check_id):
                     item.item.stock += discrepancy
                     item.status = 'adjusted'
                     item.save()
-                    WholesaleItem.objects.filter(id=item.item.id).update(stock=item.item.stock)
+                    WholesaleItem.objects.filter(id=item.item.id).update(stock=item.item.stock, updated_at=now())
 
             messages.success(request, f"Stock adjusted for {stock_items.count()} items.")
             return redirect('wholesale:wholesales')
@@ -6140,52 +6133,16 @@ def complete_wholesale_payment_request(request, request_id):
                                     description=f'Wholesale purchase payment from wallet - Payment 2 (Receipt ID: {receipt.receipt_id})'
                                 )
                 
-                # Create WholesaleSalesItem records from payment request items
-                for payment_item in payment_request.items.all():
-                    if payment_item.wholesale_item:
-                        # Lock the item row for update to prevent race conditions (skip for SQLite)
-                        from store.models import WholesaleItem
-                        if connection.vendor == 'sqlite':
-                            item = WholesaleItem.objects.get(id=payment_item.wholesale_item.id)
-                        else:
-                            item = WholesaleItem.objects.select_for_update().get(id=payment_item.wholesale_item.id)
-
-                        # Validate stock availability before deduction
-                        if item.stock < payment_item.quantity:
-                            # Rollback will happen automatically due to @transaction.atomic
-                            messages.error(
-                                request,
-                                f"Insufficient stock for {item.name}. Available: {item.stock}, Required: {payment_item.quantity}"
-                            )
-                            return redirect('wholesale:wholesale_cashier_dashboard')
-
-                        # Create wholesale sales item
-                        WholesaleSalesItem.objects.create(
-                            sales=sales,
-                            item=item,
-                            price=payment_item.unit_price,
-                            quantity=payment_item.quantity,
-                            discount_amount=payment_item.discount_amount,
-                            brand=payment_item.brand
-                        )
+                # Create WholesaleSalesItem records, deduct stock and log dispensing in one batch
+                payment_items = list(payment_request.items.all())
+                try:
+                    checkout_payment_items(sales, payment_items, payment_request.dispenser, wholesale=True)
+                except InsufficientStockError as e:
+                    # Returning normally would commit the sale and wallet changes made above
+                    transaction.set_rollback(True)
+                    messages.error(request, str(e))
+                    return redirect('wholesale:wholesale_cashier_dashboard')
 
-                        # Deduct stock (ONLY place where stock is deducted)
-                        item.stock -= payment_item.quantity
-                        item.save()
-                        
-                        # Create dispensing log for wholesale
-                        DispensingLog.objects.create(
-                            user=payment_request.dispenser,
-                            name=payment_item.item_name,
-                            brand=payment_item.brand,
-                            dosage_form=None,  # Could be added if needed
-                            unit=payment_item.unit,
-                            quantity=payment_item.quantity,
-                            amount=payment_item.subtotal,
-                            discount_amount=payment_item.discount_amount,
-                            status='Dispensed'
-                        )
-                
                 # Create split payment records if this is a split payment
                 if payment_type == 'split':
                     # Payment amounts already validated and set above
@@ -6225,9 +6182,9 @@ def complete_wholesale_payment_request(request, request_id):
                 try:
                     cart_items = WholesaleCart.objects.filter(user=payment_request.dispenser)
                     # Remove cart items that correspond to the payment request items
-                    for payment_item in payment_request.items.all():
-                        if payment_item.wholesale_item:
-                            cart_items.filter(item=payment_item.wholesale_item).delete()
+                    cart_items.filter(
+                        item_id__in=[p.wholesale_item_id for p in payment_items if p.wholesale_item_id]
+                    ).delete()
                     
                     # Comprehensive cart session cleanup after receipt generation
                     from store.cart_utils import cleanup_cart_session_after_receipt